@@ -0,0 +1,164 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from image_container import ImageContainer
+from metrics import metrics, RENDER_SECONDS
+from utils import pil_to_cv2
+from video_player import FrameRenderer
+
+#this module adds animated GIF and WebP images to the slideshow
+#AnimatedContainer is the ImageContainer of an animation, its image is the first frame which is used for thumbnails
+#AnimationPlayer decodes the frames lazily with PIL's ImageSequence as they become due and keeps only
+#a bounded number of processed frames, so a long animation is never held in memory as a whole
+
+ANIMATED_TYPES = ('.gif', '.webp', '.png')
+
+#browsers show frames without a usable delay for 100ms, do the same
+DEFAULT_FRAME_DURATION = 0.1
+MIN_FRAME_DURATION = 0.02
+
+
+def is_animated(fp) -> bool:
+    #fp is a path or a file object, only the header is read
+    try:
+        with Image.open(fp) as img:
+            return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False
+
+
+def is_animated_file(file_path) -> bool:
+    return file_path.lower().endswith(ANIMATED_TYPES) and is_animated(file_path)
+
+
+def frame_duration(frame) -> float:
+    #the delay of the current frame in seconds
+    duration = frame.info.get('duration') or 0
+    if duration <= 0:
+        return DEFAULT_FRAME_DURATION
+    return max(duration / 1000, MIN_FRAME_DURATION)
+
+
+def read_animation_frame(file_path, index=0) -> Optional[np.ndarray]:
+    with Image.open(file_path) as img:
+        return pil_to_cv2(ImageSequence.Iterator(img)[index].convert('RGB'))
+
+
+class AnimatedContainer(ImageContainer):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.frame_count: int = 0
+
+    def reload_image(self):
+        #only the first frame is kept, it stands in for the animation until it is on screen
+        print(f'Reloading first frame of animation {self.filename}')
+        with metrics.timer(RENDER_SECONDS, stage='decode'):
+            self._image = read_animation_frame(self.file_path)
+
+    def release_memory(self):
+        self._image = None
+        self.processed_image = None
+
+    def populate_properties(self):
+        if self.frame_count == 0:
+            with Image.open(self.file_path) as img:
+                self.frame_count = getattr(img, 'n_frames', 1)
+        super().populate_properties()
+
+
+class AnimationPlayer(FrameRenderer):
+    '''
+    Plays an animation on the Tk thread: get_frame advances by the per-frame durations of the file,
+    skipping frames the display is too late for, and only decodes the frame that is shown
+    '''
+
+    def __init__(self, file_path, target_height, target_width, scale_mode, angle, max_frames=32) -> None:
+        super().__init__(target_height, target_width, scale_mode, angle)
+        self.file_path = file_path
+        self.max_frames = max(max_frames, 1)
+
+        self.frames = OrderedDict()             #index -> processed frame, never more than max_frames
+        self.durations = {}                     #index -> seconds, cheap so kept for the whole animation
+        self.image = None
+        self.sequence = None
+        self.frame_count = 0
+        self.index = 0
+        self.deadline = 0
+        self.loops = 0
+        self.dropped_frames = 0
+        self._shown_index = None
+
+    @property
+    def finished(self) -> bool:
+        #an animation has finished once it has been played through
+        return self.loops > 0
+
+    @property
+    def frame_delay(self) -> int:
+        #milliseconds until the next frame is due
+        return max(1, int((self.deadline - time.monotonic()) * 1000))
+
+    def start(self) -> None:
+        if self.image is not None:
+            return
+        self.image = Image.open(self.file_path)
+        self.sequence = ImageSequence.Iterator(self.image)
+        self.frame_count = getattr(self.image, 'n_frames', 1)
+        self.restart()
+
+    def stop(self) -> None:
+        if self.image is not None:
+            self.image.close()
+        self.image = None
+        self.sequence = None
+        self.frames.clear()
+
+    def restart(self) -> None:
+        #play it again from the first frame, the processed frames are kept for the next pass
+        self.index = 0
+        self.loops = 0
+        self._shown_index = None
+        self.deadline = time.monotonic() + self.duration(0)
+
+    def duration(self, index) -> float:
+        if index not in self.durations:
+            self.durations[index] = frame_duration(self.sequence[index])
+        return self.durations[index]
+
+    def get_frame(self) -> Optional[np.ndarray]:
+        '''
+        The frame that should be on screen now, or None if it is already on screen
+        '''
+        if self.image is None:
+            return None
+        now = time.monotonic()
+        while self.deadline <= now and not self.finished:
+            if self._shown_index != self.index:
+                self.dropped_frames += 1
+            self.index += 1
+            if self.index >= self.frame_count:
+                self.index = 0
+                self.loops += 1
+            self.deadline += self.duration(self.index)
+        if self.index == self._shown_index:
+            return None
+        self._shown_index = self.index
+        return self.processed_frame(self.index)
+
+    def processed_frame(self, index) -> np.ndarray:
+        frame = self.frames.get(index)
+        if frame is not None:
+            self.frames.move_to_end(index)
+            return frame
+
+        with metrics.timer(RENDER_SECONDS, stage='animation_frame'):
+            frame = self.render_frame(pil_to_cv2(self.sequence[index].convert('RGB')))
+        self.frames[index] = frame
+        while len(self.frames) > self.max_frames:
+            self.frames.popitem(last=False)
+        return frame
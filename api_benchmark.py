@@ -0,0 +1,378 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+import cv2
+import numpy as np
+from werkzeug.serving import make_server
+
+try:
+    import resource
+except ImportError:
+    resource = None         #not available on Windows, the peak RSS is then not reported
+
+from asgi_app import uvicorn
+from config_manager import ConfigManager
+from media_manager import MediaManager
+from run import API
+from tests.stub_app import StubApp, StubViewer
+
+#this script load tests the real web API: CombinedApp with all of its routes, caches and the ingest queue,
+#but with a stub viewer (no Tk window, commands are drained by a thread), a stub monitor and stub sensors
+#it generates a synthetic image library in a temporary folder and runs a weighted mix of requests against it
+#the report has the throughput and the latency percentiles per kind of request, then the memory (RSS) of the process,
+#which includes the load generating clients and, with --server both, the two servers run one after the other
+#--server both runs the same mix against the Werkzeug development server (web_server 'flask') and the ASGI mode
+#(web_server 'asgi') one after the other and compares them, the dashboard mix is the one the web page generates
+#usage: python api_benchmark.py --mix browse --concurrency 16 --duration 10 --library 300
+#       python api_benchmark.py --mix gallery=4,upload=1,display_now=1 --server asgi
+#       python api_benchmark.py --mix dashboard --concurrency 32 --server both
+
+MIXES = {
+    'browse': {'index': 1, 'gallery': 4, 'thumbnail': 20, 'preview': 2, 'current_image': 5},
+    'push': {'display_now': 1, 'current_image': 5},
+    'upload': {'upload': 1, 'gallery': 2, 'current_image': 5},
+    'control': {'next': 5, 'select': 2, 'configure': 1, 'current_image': 5},
+    'mixed': {'index': 1, 'gallery': 4, 'thumbnail': 20, 'preview': 2, 'upload': 1, 'display_now': 1,
+              'next': 2, 'select': 1, 'configure': 1, 'current_image': 10},
+    #the once a second poll, thumbnails, the live canvas (a JPEG encode, CPU bound) and Plex webhooks
+    'dashboard': {'current_image': 6, 'thumbnail': 3, 'canvas': 1, 'plex_hook': 1},
+}
+
+
+def create_library(folder, count, seed=0):
+    # photo like JPEGs: smooth noise scaled up compresses like a real picture, about a third of them portrait
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        height, width = (1280, 960) if rng.random() < 0.3 else (960, 1280)
+        noise = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+        image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        cv2.imwrite(os.path.join(folder, f'library_{index}.jpg'), image, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+
+
+def encode_jpeg(height, width, seed) -> bytes:
+    noise = np.random.default_rng(seed).integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), 85])[1].tobytes()
+
+
+def multipart(field, filename, data, content_type='image/jpeg'):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Workload:
+    '''
+    Builds the requests of each kind, as (method, path, body, headers)
+    '''
+
+    KINDS = ('index', 'gallery', 'thumbnail', 'preview', 'current_image', 'configure', 'upload', 'display_now', 'next', 'select',
+             'canvas', 'plex_hook')
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    #a pause from a player, acknowledged by the route and handled by the webhook worker without a Plex server
+    PLEX_PAYLOAD = json.dumps({'event': 'media.pause', 'Player': {'uuid': 'load-test'}, 'Metadata': {'title': 'A Movie'}})
+
+    def __init__(self, viewer: StubViewer) -> None:
+        self.viewer = viewer
+        self.snapshot = encode_jpeg(1080, 1920, seed=1)         #a camera snapshot for display_now
+        self.upload_jpeg = encode_jpeg(960, 1280, seed=2)
+
+    def filenames(self):
+        return [media.filename for media in self.viewer.media_manager.all_media_files] or ['missing.jpg']
+
+    def request(self, kind, rng: random.Random):
+        if kind == 'index':
+            return 'GET', API.home_url, None, {}
+        if kind == 'gallery':
+            return 'GET', API.gallery + '?limit=50&fields=filename,thumbnail,orientation', None, {}
+        if kind == 'thumbnail':
+            return 'GET', f'/thumbnails/{rng.choice(self.filenames())}', None, {}
+        if kind == 'preview':
+            return 'GET', f'/uploads/{rng.choice(self.filenames())}?w=600', None, {}
+        if kind == 'current_image':
+            return 'GET', API.current_image_name, None, {}
+        if kind == 'configure':
+            return 'GET', API.configure_display, None, {}
+        if kind == 'upload':
+            body, content_type = multipart('file', 'photo.jpg', self.upload_jpeg)
+            return 'POST', API.upload, body, {'Content-Type': content_type, 'Accept': 'application/json'}
+        if kind == 'display_now':
+            return 'POST', API.display_now, self.snapshot, {'Content-Type': 'image/jpeg'}
+        if kind == 'next':
+            return 'POST', API.slideshow_next, b'', {}
+        if kind == 'select':
+            return 'POST', API.select, urlencode({'filename': rng.choice(self.filenames())}).encode('ascii'), self.FORM
+        if kind == 'canvas':
+            return 'GET', API.canvas, None, {}
+        if kind == 'plex_hook':
+            return 'POST', API.plex_hook, urlencode({'payload': self.PLEX_PAYLOAD}).encode('ascii'), self.FORM
+        raise ValueError(f'Unknown request kind {kind}')
+
+
+class WerkzeugServer:
+    def __init__(self, app, port) -> None:
+        #app.run uses the same threaded server
+        self.server = make_server('127.0.0.1', port, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class UvicornServer:
+    def __init__(self, adapter, port) -> None:
+        self.server = uvicorn.Server(uvicorn.Config(adapter, host='127.0.0.1', port=port, log_level='warning'))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def percentile(values, pct) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def rss_mb() -> float:
+    # the current resident memory on Linux, the peak elsewhere
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_mix(port, workload: Workload, mix, concurrency, duration, seed=0) -> dict:
+    '''
+    concurrency clients with keep-alive connections send requests picked from mix (kind -> weight) for duration seconds
+    '''
+    kinds, weights = zip(*mix.items())
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    server_errors = {kind: 0 for kind in kinds}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(client_seed):
+        rng = random.Random(client_seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = {kind: [] for kind in kinds}
+        local_errors = {kind: 0 for kind in kinds}
+        local_server_errors = {kind: 0 for kind in kinds}
+        while time.monotonic() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            method, path, body, headers = workload.request(kind, rng)
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_server_errors[kind] += 1
+                elif response.status >= 400 and response.status != 404:
+                    #a 404 is a file deleted or renamed meanwhile, not a failure of the server
+                    local_errors[kind] += 1
+            except (OSError, http.client.HTTPException):
+                local_errors[kind] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            local[kind].append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            for kind in kinds:
+                latencies[kind].extend(local[kind])
+                errors[kind] += local_errors[kind]
+                server_errors[kind] += local_server_errors[kind]
+
+    threads = [threading.Thread(target=client, args=(seed + index,)) for index in range(concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    results = {}
+    for kind in kinds:
+        values = latencies[kind]
+        results[kind] = {
+            'requests': len(values),
+            'errors': errors[kind],
+            'server_errors': server_errors[kind],
+            'rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    all_values = [value for values in latencies.values() for value in values]
+    results['total'] = {
+        'requests': len(all_values),
+        'errors': sum(errors.values()),
+        'server_errors': sum(server_errors.values()),
+        'rps': len(all_values) / elapsed,
+        'p50_ms': percentile(all_values, 50) * 1000,
+        'p95_ms': percentile(all_values, 95) * 1000,
+        'p99_ms': percentile(all_values, 99) * 1000,
+    }
+    return results
+
+
+def print_report(results, viewer: StubViewer):
+    print(f"{'request':<15}{'count':>8}{'errors':>8}{'5xx':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, result in results.items():
+        print(f"{kind:<15}{result['requests']:>8}{result['errors']:>8}{result['server_errors']:>8}{result['rps']:>10.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    print(f"Viewer: {viewer.images_shown} images shown, {viewer.commands.coalesced} commands coalesced, "
+          f"{len(viewer.media_manager.all_media_files)} files in the library")
+    faults = [kind for kind, result in results.items() if kind != 'total' and result['server_errors']]
+    if faults:
+        print(f"SERVER FAULT: {', '.join(faults)} returned 5xx responses, see the server log above")
+
+
+def print_comparison(results):
+    # the totals of each server, for --server both
+    print(f"{'server':<10}{'requests':>10}{'errors':>8}{'5xx':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        total = result['total']
+        print(f"{name:<10}{total['requests']:>10}{total['errors']:>8}{total['server_errors']:>8}{total['rps']:>10.1f}"
+              f"{total['p50_ms']:>10.1f}{total['p95_ms']:>10.1f}{total['p99_ms']:>10.1f}")
+
+
+def parse_mix(text) -> dict:
+    '''
+    A named mix or weights like gallery=4,upload=1, raises ValueError for unknown kinds or bad weights
+    '''
+    if text in MIXES:
+        return MIXES[text]
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in Workload.KINDS:
+            raise ValueError(f'Unknown request kind {kind!r}, one of {", ".join(Workload.KINDS)}')
+        mix[kind] = float(weight or 1)
+        if mix[kind] < 0:
+            raise ValueError(f'The weight of {kind} is negative')
+    if not any(mix.values()):
+        raise ValueError('The mix has no requests')
+    return mix
+
+
+def start_app(folder, library_size, port):
+    '''
+    Create the synthetic library and a CombinedApp with the stub viewer in folder, which becomes the working directory
+    '''
+    os.chdir(folder)
+    create_library('images', library_size)
+
+    config_manager = ConfigManager(os.path.join(folder, 'config.json'))
+    config_manager.config.update({'mqtt_broker': '127.0.0.1', 'mqtt_port': 9, 'web_interface_port': port,
+                                  'media_orientation_filter': 'both'})
+    combined = StubApp(config_manager)
+
+    media_manager = MediaManager('images', 'thumbnails', 200, 200)
+    media_manager.get_media_files()
+    media_manager.create_playlist()
+    viewer = StubViewer(media_manager)
+    viewer.image_change_callback = combined.slideshow_manager.on_image_changed
+    media_manager.media_files_changed_callback = combined.slideshow_manager.on_media_files_changed
+    combined.slideshow_manager.viewer = viewer
+    combined.slideshow_manager.viewers = [viewer]
+    return combined, viewer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the web API of Digital Canvas with a stub viewer')
+    parser.add_argument('--mix', default='mixed', help=f'one of {", ".join(MIXES)} or weights like gallery=4,upload=1')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--library', type=int, default=200, help='number of images in the synthetic library')
+    parser.add_argument('--server', choices=('flask', 'asgi', 'both'), default='flask',
+                        help='both runs the mix against each server in turn and compares them')
+    parser.add_argument('--port', type=int, default=7200)
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    with tempfile.TemporaryDirectory() as folder:
+        cwd = os.getcwd()
+        try:
+            memory = {'before': rss_mb()}
+            combined, viewer = start_app(folder, args.library, args.port)
+            workload = Workload(viewer)
+
+            names = ['flask', 'asgi'] if args.server == 'both' else [args.server]
+            if 'asgi' in names and uvicorn is None:
+                print('uvicorn is not installed, only the Flask development server is measured')
+                names = ['flask']
+            results = {}
+            for index, name in enumerate(names):
+                port = args.port + index
+                print(f"Serving a library of {args.library} images with the {name} server, mix {mix}")
+                if name == 'asgi':
+                    server = UvicornServer(combined.create_asgi_app(), port)
+                else:
+                    server = WerkzeugServer(combined.app, port)
+                server.start()
+                try:
+                    run_mix(port, workload, mix, args.concurrency, min(args.duration, 1))     #warm up
+                    results[name] = run_mix(port, workload, mix, args.concurrency, args.duration)
+                finally:
+                    server.stop()
+
+            memory['after'] = rss_mb()
+            memory['peak'] = max(peak_rss_mb(), memory['after'])
+            for name, result in results.items():
+                print(f"\n{name}")
+                print_report(result, viewer)
+            if len(results) > 1:
+                print()
+                print_comparison(results)
+            #one process ran both servers, so the memory is only a per-server figure when a single one was measured
+            scope = 'both servers' if len(results) > 1 else names[0]
+            print(f"\nRSS MB ({scope} and the clients): {memory['before']:.0f} before, {memory['after']:.0f} after, "
+                  f"{memory['peak']:.0f} peak")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics, RENDER_SECONDS
+from utils import check_and_create, cv_read_reduced
+
+#this class ArtworkFetcher is responsible for getting the posters of what is playing on Plex
+#downloads share one pooled HTTP session (kept alive connections) and are bounded by a connect and a read timeout
+#and a size limit, so an offline or slow server fails fast instead of holding a thread
+#the encoded artwork is kept on disk and the decoded images (at the size the screen needs) in memory, both keyed
+#by the thumb path of the payload, which changes when the artwork changes; the least recently used ones are removed
+#replaying or resuming a title then shows its poster without a request, and concurrent fetches of one poster share a download
+
+
+class ArtworkFetcher:
+
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 10
+    MAX_ARTWORK_BYTES = 20 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, cache_folder, max_disk_bytes=64 * 1024 * 1024, max_memory_bytes=32 * 1024 * 1024, pool_size=4) -> None:
+        self.cache_folder = cache_folder
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.files = OrderedDict()          #file name -> size, least recently used first
+        self.disk_size = 0
+        self.images = OrderedDict()         #(thumb, height, width) -> decoded image, least recently used first
+        self.memory_size = 0
+        self.pending = {}                   #(thumb, height, width) -> Future of a fetch in progress
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        check_and_create(cache_folder)
+        entries = [entry for entry in os.scandir(cache_folder) if entry.is_file() and not entry.name.endswith('.part')]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_atime):
+            self.files[entry.name] = entry.stat().st_size
+            self.disk_size += entry.stat().st_size
+        self.evict_files()
+
+    @staticmethod
+    def file_name(thumb) -> str:
+        return hashlib.blake2b(thumb.encode('utf-8'), digest_size=16).hexdigest() + '.jpg'
+
+    def get(self, base_url, thumb, target_height, target_width) -> np.ndarray:
+        '''
+        Return the artwork at thumb (e.g. /library/metadata/1/thumb/1700000000) from the Plex server at base_url,
+        decoded no larger than needed to fill target_height x target_width
+        raises requests.RequestException when it can't be downloaded and ValueError when it can't be decoded
+        '''
+        key = (thumb, target_height, target_width)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                metrics.inc('plex_artwork_total', source='memory')
+                return image
+            future = self.pending.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.pending[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            image = self.decode(self.read(base_url, thumb), target_height, target_width)
+            self.remember(key, image)
+            future.set_result(image)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return image
+
+    def read(self, base_url, thumb) -> bytes:
+        # the encoded artwork from the disk cache, downloaded first if needed
+        name = self.file_name(thumb)
+        with self.lock:
+            cached = name in self.files
+            if cached:
+                self.files.move_to_end(name)
+        if cached:
+            try:
+                with open(os.path.join(self.cache_folder, name), 'rb') as file:
+                    data = file.read()
+                metrics.inc('plex_artwork_total', source='disk')
+                return data
+            except OSError:
+                with self.lock:
+                    self.disk_size -= self.files.pop(name, 0)
+
+        data = self.download(f"{base_url}{thumb}.jpg")
+        self.store(name, data)
+        metrics.inc('plex_artwork_total', source='download')
+        return data
+
+    def download(self, url) -> bytes:
+        with self.session.get(url, stream=True, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.MAX_ARTWORK_BYTES:
+                    raise ValueError(f'The artwork at {url} is larger than {self.MAX_ARTWORK_BYTES} bytes')
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def decode(self, data, target_height, target_width) -> np.ndarray:
+        with metrics.timer(RENDER_SECONDS, stage='decode'):
+            image = cv_read_reduced(data, target_height, target_width)
+        if image is None:
+            raise ValueError('The artwork is not an image')
+        return image
+
+    def store(self, name, data) -> None:
+        #write next to the final name and rename, so a half written file is never read
+        target = os.path.join(self.cache_folder, name)
+        temporary = target + '.part'
+        try:
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, target)
+        except OSError as e:
+            print(f"Failed to cache the artwork {name}: {e}")
+            return
+        with self.lock:
+            self.disk_size -= self.files.pop(name, 0)
+            self.files[name] = len(data)
+            self.disk_size += len(data)
+        self.evict_files()
+
+    def remember(self, key, image: np.ndarray) -> None:
+        if image.nbytes > self.max_memory_bytes:
+            return
+        with self.lock:
+            previous = self.images.pop(key, None)
+            if previous is not None:
+                self.memory_size -= previous.nbytes
+            self.images[key] = image
+            self.memory_size += image.nbytes
+            while self.memory_size > self.max_memory_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.memory_size -= evicted.nbytes
+
+    def evict_files(self) -> None:
+        with self.lock:
+            removed = []
+            while self.disk_size > self.max_disk_bytes and len(self.files) > 1:
+                name, size = self.files.popitem(last=False)
+                self.disk_size -= size
+                removed.append(name)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.cache_folder, name))
+            except OSError as e:
+                print(f"Failed to remove {name} from the artwork cache: {e}")
@@ -0,0 +1,233 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+#this module serves the Flask app over ASGI, as an alternative to the Werkzeug development server
+#the event loop only moves bytes: request bodies are read and responses are sent asynchronously,
+#while the Flask routes themselves run in thread pools, so a slow upload or Plex fetch never holds up other requests.
+#routes that decode or encode images (CPU) get a small pool sized to leave cores for the slideshow,
+#everything else (file and network I/O) a larger one. opencv releases the GIL, so threads are enough for the CPU work
+#and the routes keep access to the shared viewer, which a process pool would not have
+
+
+class FileWrapper:
+    '''
+    wsgi.file_wrapper with large blocks, every block is one hop between the event loop and a worker thread
+    '''
+
+    def __init__(self, file, block_size=65536) -> None:
+        self.file = file
+        self.block_size = max(block_size, AsgiAdapter.CHUNK_SIZE)
+
+    def __iter__(self):
+        while True:
+            block = self.file.read(self.block_size)
+            if not block:
+                return
+            yield block
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class AsgiAdapter:
+
+    CHUNK_SIZE = 65536
+    SPOOL_SIZE = 1024 * 1024            #request bodies larger than this are spooled to disk, e.g. video uploads
+
+    def __init__(self, wsgi_app, cpu_routes=(), native_routes=None, io_workers=16, cpu_workers=2) -> None:
+        self.wsgi_app = wsgi_app
+        self.cpu_routes = tuple(cpu_routes)
+        self.native_routes = native_routes or {}            #path -> async handler(adapter, scope, receive, send)
+        self.io_executor = ThreadPoolExecutor(max(io_workers, 1), thread_name_prefix='asgi-io')
+        self.cpu_executor = ThreadPoolExecutor(max(cpu_workers, 1), thread_name_prefix='asgi-cpu')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self.native_routes.get(scope['path'])
+        if handler is not None:
+            await handler(self, scope, receive, send)
+        else:
+            await self.handle_wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def shutdown(self) -> None:
+        self.io_executor.shutdown(wait=False)
+        self.cpu_executor.shutdown(wait=False)
+
+    def executor_for(self, path) -> ThreadPoolExecutor:
+        if path.startswith(self.cpu_routes):
+            return self.cpu_executor
+        return self.io_executor
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    @staticmethod
+    def build_environ(scope, body) -> dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    @staticmethod
+    async def watch_disconnect(receive, disconnected: asyncio.Event):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    @staticmethod
+    async def send_text(send, status, text):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+    async def handle_wsgi(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor_for(scope['path'])
+        environ = self.build_environ(scope, body)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        def call_app():
+            iterable = self.wsgi_app(environ, start_response)
+            return iterable, iter(iterable)
+
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self.watch_disconnect(receive, disconnected))
+        iterable = None
+        try:
+            iterable, chunks = await loop.run_in_executor(executor, call_app)
+            await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            while not disconnected.is_set():
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            if iterable is not None and hasattr(iterable, 'close'):
+                await loop.run_in_executor(executor, iterable.close)
+            body.close()
+
+
+def stream_route(streamer, is_ready=None, poll_interval=0.1, keepalive=None, keepalive_interval=15):
+    '''
+    A native handler for the streams fed by StreamClient queues (the MJPEG canvas and the server-sent events):
+    waiting for the next chunk doesn't hold a worker thread, so any number of clients can be connected
+    '''
+    async def handler(adapter: AsgiAdapter, scope, receive, send):
+        if is_ready is not None and not is_ready():
+            await adapter.send_text(send, 503, 'Viewer is not initialized')
+            return
+
+        loop = asyncio.get_running_loop()
+        client = streamer.add_client()
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(adapter.watch_disconnect(receive, disconnected))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', streamer.mimetype.encode('latin-1')),
+                                    (b'cache-control', b'no-cache')]})
+            last_sent = loop.time()
+            while streamer.running and not client.dropped and not disconnected.is_set():
+                try:
+                    chunk = client.queue.get_nowait()
+                except Empty:
+                    if keepalive is None or loop.time() - last_sent < keepalive_interval:
+                        await asyncio.sleep(poll_interval)
+                        continue
+                    chunk = keepalive
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                last_sent = loop.time()
+        finally:
+            watcher.cancel()
+            streamer.remove_client(client)
+    return handler
+
+
+def canvas_stream_route(streamer, is_ready):
+    return stream_route(streamer, is_ready, poll_interval=1 / streamer.max_fps)
+
+
+def event_stream_route(broadcaster):
+    return stream_route(broadcaster, poll_interval=0.25, keepalive=broadcaster.KEEPALIVE,
+                        keepalive_interval=broadcaster.keepalive_interval)
+
+
+def serve(app, host, port) -> bool:
+    '''
+    Run the ASGI app with uvicorn, returns False if uvicorn is not installed
+    '''
+    if uvicorn is None:
+        print('uvicorn is not installed, the ASGI web server is not available')
+        return False
+    uvicorn.run(app, host=host, port=port, log_level='warning')
+    return True
@@ -0,0 +1,69 @@
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import cv2
+
+#this class EncodedCanvasCache is responsible for keeping the JPEG encoded canvas around between requests
+#the encoded bytes are cached per canvas generation and per (width, quality) variant
+#so polling an unchanged canvas only costs a dict lookup
+
+EncodedCanvas = namedtuple('EncodedCanvas', ['data', 'etag', 'last_modified'])
+
+
+class EncodedCanvasCache:
+
+    DEFAULT_QUALITY = 95            #the default cv2.imencode quality
+    MIN_WIDTH = 16
+
+    def __init__(self, max_variants=8) -> None:
+        self.max_variants = max_variants
+        #etags must not survive a restart as the generation counter starts again from zero
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.generation = None
+        self.last_modified = None
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def normalise(self, image, width=None, quality=None):
+        image_width = image.shape[1]
+        if width is None or width >= image_width:
+            width = image_width
+        width = max(width, self.MIN_WIDTH)
+        if quality is None:
+            quality = self.DEFAULT_QUALITY
+        quality = min(max(quality, 1), 100)
+        return width, quality
+
+    def get(self, generation, image, width=None, quality=None) -> EncodedCanvas:
+        width, quality = self.normalise(image, width, quality)
+        key = (width, quality)
+
+        with self.lock:
+            if generation != self.generation:
+                #the canvas changed, every cached variant is stale
+                self.generation = generation
+                self.last_modified = time.time()
+                self.variants = {}
+
+            entry = self.variants.get(key)
+            if entry is not None:
+                return entry
+
+            entry = EncodedCanvas(self.encode(image, width, quality),
+                                  f'{self.instance_id}-{generation}-{width}-{quality}',
+                                  self.last_modified)
+            if len(self.variants) >= self.max_variants:
+                #drop the oldest variant
+                self.variants.pop(next(iter(self.variants)))
+            self.variants[key] = entry
+            return entry
+
+    def encode(self, image, width, quality) -> bytes:
+        image_height, image_width = image.shape[:2]
+        if width != image_width:
+            height = max(1, int(round(image_height * width / image_width)))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return buffer.tobytes()
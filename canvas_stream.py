@@ -0,0 +1,173 @@
+import threading
+import time
+from queue import Empty, Full, Queue
+
+import cv2
+
+#this class CanvasStreamer is responsible for serving the canvas as a multipart MJPEG stream
+#each new canvas frame is JPEG encoded once and the same bytes are handed to every connected client
+#clients that can't keep up are dropped instead of having frames buffered for them
+#with no client connected the encoder thread sleeps until one connects, so an idle frame does no MJPEG work
+
+
+class StreamClient:
+    def __init__(self, max_pending=2) -> None:
+        self.queue = Queue(maxsize=max_pending)
+        self.dropped = False
+
+    def send(self, chunk) -> bool:
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(chunk)
+            return True
+        except Full:
+            #the client is still busy with older frames, don't buffer for it
+            self.dropped = True
+            return False
+
+
+class CanvasStreamer:
+
+    BOUNDARY = 'frame'
+
+    def __init__(self, get_frame, max_fps=10, quality=80, min_quality=40, max_pending=2) -> None:
+        '''
+        get_frame is a callable returning a (generation, image) tuple or None when no canvas is available.
+        The generation only changes when the canvas changes, so an unchanged canvas is never re-encoded.
+        '''
+        self.get_frame = get_frame
+        self.max_fps = max_fps
+        self.max_quality = quality
+        self.min_quality = min(min_quality, quality)
+        self.quality = quality
+        self.max_pending = max_pending
+
+        self.clients: set = set()
+        self.clients_lock = threading.Lock()
+        self.has_clients = threading.Event()
+        self.last_generation = None
+        self.last_chunk = None
+        self._thread = None
+        self._running = False
+
+    @property
+    def mimetype(self) -> str:
+        return f'multipart/x-mixed-replace; boundary={CanvasStreamer.BOUNDARY}'
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def client_count(self) -> int:
+        with self.clients_lock:
+            return len(self.clients)
+
+    def add_client(self) -> StreamClient:
+        client = StreamClient(self.max_pending)
+        #send the latest frame straight away so a static canvas still shows up
+        if self.last_chunk is not None:
+            client.send(self.last_chunk)
+        with self.clients_lock:
+            self.clients.add(client)
+            self.has_clients.set()
+        self.start()
+        return client
+
+    def remove_client(self, client: StreamClient) -> None:
+        with self.clients_lock:
+            self.clients.discard(client)
+            if not self.clients:
+                self.has_clients.clear()
+
+    def stream(self, client: StreamClient):
+        '''
+        Generator yielding the multipart chunks for a single client, used as the Flask response body
+        '''
+        try:
+            while self._running and not client.dropped:
+                try:
+                    chunk = client.queue.get(timeout=1.0)
+                except Empty:
+                    continue
+                yield chunk
+        finally:
+            self.remove_client(client)
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        with self.clients_lock:
+            #stop leaves it set to wake the thread
+            if not self.clients:
+                self.has_clients.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        #wake the encoder if it is waiting for a client
+        self.has_clients.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def encode(self, image) -> bytes:
+        _, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        jpeg = buffer.tobytes()
+        header = (f'--{CanvasStreamer.BOUNDARY}\r\n'
+                  f'Content-Type: image/jpeg\r\n'
+                  f'Content-Length: {len(jpeg)}\r\n\r\n').encode()
+        return header + jpeg + b'\r\n'
+
+    def adapt_quality(self, encode_time, frame_budget, dropped) -> None:
+        #lower the quality when encoding eats too much of the frame budget or clients fall behind
+        #and slowly raise it again when there is headroom
+        if dropped or encode_time > frame_budget * 0.5:
+            self.quality = max(self.min_quality, self.quality - 10)
+        elif encode_time < frame_budget * 0.25:
+            self.quality = min(self.max_quality, self.quality + 2)
+
+    def broadcast(self, chunk) -> int:
+        with self.clients_lock:
+            clients = list(self.clients)
+        dropped = 0
+        for client in clients:
+            if not client.send(chunk):
+                dropped += 1
+                self.remove_client(client)
+        return dropped
+
+    def _run(self) -> None:
+        frame_budget = 1.0 / max(self.max_fps, 1)
+        next_tick = time.monotonic()
+        while self._running:
+            if not self.has_clients.is_set():
+                self.has_clients.wait()
+                next_tick = time.monotonic()
+                continue
+            next_tick += frame_budget
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                #we're running late, don't try to catch up with a burst of frames
+                next_tick = time.monotonic()
+
+            frame = self.get_frame()
+            if frame is None:
+                continue
+            generation, image = frame
+            if image is None or generation == self.last_generation:
+                continue
+
+            start = time.perf_counter()
+            chunk = self.encode(image)
+            encode_time = time.perf_counter() - start
+
+            self.last_generation = generation
+            self.last_chunk = chunk
+            dropped = self.broadcast(chunk)
+            self.adapt_quality(encode_time, frame_budget, dropped > 0)
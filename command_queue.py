@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+
+#this class CommandQueue is responsible for handing work from other threads (Flask, MQTT, sensors) to the Tk loop
+#Tk may only be used from the thread running its mainloop, so the other threads post commands and the viewer drains them
+#commands posted with the same key supersede each other while they are waiting, so a burst of them is processed once:
+#ten presses of next become a single step of ten and two rotations only apply the last one
+
+Command = namedtuple('Command', ['func', 'args', 'kwargs'])
+
+
+def sum_steps(old: Command, new: Command) -> Command:
+    # merge for commands taking a single count, e.g. the step of next/previous
+    if old.func != new.func:
+        return new
+    return Command(new.func, (old.args[0] + new.args[0],), new.kwargs)
+
+
+def merge_kwargs(old: Command, new: Command) -> Command:
+    # merge for commands taking keyword settings, e.g. update_parameters, the newest value of each wins
+    if old.func != new.func:
+        return new
+    return Command(new.func, new.args, {**old.kwargs, **new.kwargs})
+
+
+class CommandQueue:
+    def __init__(self) -> None:
+        self.pending = OrderedDict()        #key -> Command, in the order they were last posted
+        self.lock = threading.Lock()
+        self.coalesced = 0                  #commands merged into another or dropped because they were superseded
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def post(self, func, *args, key=None, merge=None, **kwargs) -> None:
+        '''
+        Queue func(*args, **kwargs), safe to call from any thread
+        a command with the same key that is still waiting is replaced, or combined with this one by merge(old, new)
+        '''
+        command = Command(func, args, kwargs)
+        if key is None:
+            key = object()
+        with self.lock:
+            old = self.pending.pop(key, None)
+            if old is not None:
+                self.coalesced += 1
+                if merge is not None:
+                    command = merge(old, command)
+            self.pending[key] = command
+
+    def call(self, func, *args, **kwargs) -> Future:
+        '''
+        Queue func(*args, **kwargs) like post and return a Future of its result, for a thread that has to wait for it
+        '''
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        run.__name__ = getattr(func, '__name__', 'call')
+        self.post(run)
+        return future
+
+    def drain(self) -> int:
+        '''
+        Run every waiting command on the calling thread, returns how many ran
+        '''
+        with self.lock:
+            commands = list(self.pending.values())
+            self.pending.clear()
+        for command in commands:
+            try:
+                command.func(*command.args, **command.kwargs)
+            except Exception as e:
+                print(f"Command {getattr(command.func, '__name__', command.func)} failed: {e}")
+        return len(commands)
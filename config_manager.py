@@ -16,6 +16,8 @@ valid_auto_rotation = [True, False]
 valid_rotation = [0, 90, 180, 270]
 valid_allow_plex = [True, False]
 valid_pause_when_plex_playing = [True, False]
+valid_ken_burns = [True, False]
+valid_web_servers = ['flask', 'asgi']
 
 
     # "image_folder": "images",
@@ -47,7 +49,9 @@ valid_values = {
     'rotation': valid_rotation,
     'allow_plex': valid_allow_plex,
     'playback_mode': valid_playback_mode,
-    'pause_when_plex_playing': valid_pause_when_plex_playing
+    'pause_when_plex_playing': valid_pause_when_plex_playing,
+    'ken_burns': valid_ken_burns,
+    'web_server': valid_web_servers
 }
 
 
@@ -78,6 +82,46 @@ class ConfigManager:
             return isinstance(value, int)
         if key == 'time_on' or key == 'time_off':
             return isinstance(value, str) and bool(re.match(r'^\d{2}:\d{2}$', value))
+        if key == 'stream_max_fps':
+            return isinstance(value, int) and 0 < value <= 60
+        if key == 'stream_quality':
+            return isinstance(value, int) and 0 < value <= 100
+        if key == 'metrics_publish_interval':
+            return isinstance(value, int) and value >= 0
+        if key == 'idle_sensor_interval':
+            return isinstance(value, int) and value > 0
+        if key == 'prewarm_lead_time':
+            return isinstance(value, int) and value >= 0
+        if key == 'frame_cache_size':
+            return isinstance(value, int) and value >= 0
+        if key == 'video_buffer_frames':
+            return isinstance(value, int) and value > 0
+        if key == 'animation_max_frames':
+            return isinstance(value, int) and value > 0
+        if key == 'ken_burns_zoom':
+            return isinstance(value, (int, float)) and 1 <= value <= 1.5
+        if key == 'ken_burns_fps':
+            return isinstance(value, int) and 1 <= value <= 60
+        if key == 'asgi_io_workers' or key == 'asgi_cpu_workers':
+            return isinstance(value, int) and value > 0
+        if key == 'ingest_workers' or key == 'ingest_max_queued':
+            return isinstance(value, int) and value > 0
+        if key == 'download_max_size' or key == 'download_timeout' or key == 'download_workers':
+            return isinstance(value, int) and value > 0
+        if key == 'remote_playlist_url':
+            return isinstance(value, str) and (value == '' or value.startswith(('http://', 'https://')))
+        if key == 'remote_cache_size' or key == 'remote_prefetch' or key == 'remote_refresh_interval':
+            return isinstance(value, int) and value > 0
+        if key == 'thumbnail_cache_size':
+            return isinstance(value, int) and value >= 0
+        if key == 'derivative_cache_size':
+            return isinstance(value, int) and value > 0
+        if key == 'plex_artwork_cache_size':
+            return isinstance(value, int) and value > 0
+        if key == 'slow_request_threshold':
+            return isinstance(value, (int, float)) and value >= 0
+        if key == 'displays':
+            return isinstance(value, list) and all(isinstance(display, dict) for display in value)
 
         return False
     
@@ -85,6 +129,7 @@ class ConfigManager:
         self.default_config = self.populate_defaults()      # Populate the default configuration values
         self.config_file_path = config_file_path            # Path to the configuration file
         self.config = self.load_config()                    # Load the configuration from the JSON file
+        self.config_changed_callback = None                 # Called with the key and value of every accepted update
         
     def __str__(self) -> str:
         return str(self.config)
@@ -115,7 +160,35 @@ class ConfigManager:
             "light_sensor_max_reading": 1000,                               #maximum reading from light sensor
             "light_sensor_min_reading": 0,                                  #minimum reading from light sensor
             "time_on": "06:00",                                             #time to turn on
-            "time_off": "22:00"                                             #time to turn off
+            "time_off": "22:00",                                            #time to turn off
+            "stream_max_fps": 10,                                           #frame rate cap of the /canvas/stream MJPEG stream
+            "stream_quality": 80,                                           #maximum JPEG quality of the MJPEG stream
+            "metrics_publish_interval": 0,                                  #seconds between publishing metrics over MQTT, 0 to disable
+            "idle_sensor_interval": 5,                                      #seconds between sensor loop iterations while the display is off
+            "prewarm_lead_time": 60,                                        #seconds before time_on to prepare the first frames
+            "frame_cache_size": 6,                                          #number of processed frames shared between displays
+            "video_buffer_frames": 8,                                       #decoded frames buffered ahead while playing a video clip
+            "animation_max_frames": 32,                                     #processed frames of an animated GIF/WebP kept in memory
+            "ken_burns": False,                                             #slowly pan and zoom over still images
+            "ken_burns_zoom": 1.2,                                          #how far the pan zooms in, at most 1.5 to keep the frames sharp and cheap
+            "ken_burns_fps": 30,                                            #frame rate cap of the pan
+            "web_server": "flask",                                          #'flask' for the development server or 'asgi' to serve with uvicorn
+            "asgi_io_workers": 16,                                          #threads for file and network bound routes in asgi mode
+            "asgi_cpu_workers": 2,                                          #threads for routes that encode or decode images in asgi mode
+            "ingest_workers": 2,                                            #uploads processed at the same time
+            "ingest_max_queued": 200,                                       #uploads waiting to be processed before new ones are refused
+            "download_workers": 4,                                          #image URLs downloaded at the same time
+            "download_max_size": 50,                                        #MB, larger downloads from image URLs are refused
+            "download_timeout": 60,                                         #seconds a download from an image URL may take
+            "remote_playlist_url": "",                                      #JSON index of image URLs played after the library, e.g. on a NAS, empty for none
+            "remote_cache_size": 512,                                       #MB of remote playlist images kept on disk
+            "remote_prefetch": 3,                                           #remote images downloaded ahead of the one on screen
+            "remote_refresh_interval": 600,                                 #seconds between reads of the remote playlist index
+            "thumbnail_cache_size": 16,                                     #MB of small thumbnails kept in memory for the web interface, 0 to disable
+            "derivative_cache_size": 256,                                   #MB of resized copies of uploads kept on disk
+            "slow_request_threshold": 1.0,                                  #seconds before a request is logged as slow with a stack sample, 0 to disable
+            "plex_artwork_cache_size": 64,                                  #MB of Plex posters kept on disk, replaying a title shows its poster without a download
+            "displays": []                                                  #per display overrides, e.g. [{"screen_width": 1920, "screen_height": 1080, "window_x": 0, "window_y": 0, "rotation": 90}]
         }
         return default_config
 
@@ -163,6 +236,8 @@ class ConfigManager:
         if value is not None and self.is_valid_value(key, value):
             self.config[key] = value
             self.save_config()
+            if self.config_changed_callback is not None:
+                self.config_changed_callback(key, value)
 
     def __getitem__(self, key):
         """Get the value of a configuration parameter."""
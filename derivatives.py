@@ -0,0 +1,175 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from typing import Optional
+
+import cv2
+from werkzeug.security import safe_join
+
+from animated_image import is_animated_file, read_animation_frame
+from metrics import metrics, RENDER_SECONDS
+from utils import check_and_create, cv_read_reduced, cv_resize_to_target_size, is_video_file, read_video_frame
+
+#this class DerivativeCache is responsible for the resized copies of library files asked for with /uploads/<filename>?w=&h=
+#a copy is made once with cv_resize_to_target_size and kept in a folder on disk, the least recently used ones
+#are removed when the folder grows over its size limit
+#requests for a copy that is still being made wait for it instead of making it again
+
+Variant = namedtuple('Variant', ['width', 'height', 'fit', 'fmt'])     #0 for a width or height that follows the aspect ratio
+
+FORMATS = {
+    'jpg': ('.jpg', [int(cv2.IMWRITE_JPEG_QUALITY), 85]),
+    'webp': ('.webp', [int(cv2.IMWRITE_WEBP_QUALITY), 80]),
+    'png': ('.png', []),
+}
+FITS = ('fit', 'fill')
+MAX_SIZE = 4096
+
+
+def parse_variant(args, filename) -> Optional[Variant]:
+    '''
+    Read the w, h, fit and fmt query parameters, None when no resizing is asked for, raises ValueError for bad values
+    '''
+    if not args.get('w') and not args.get('h'):
+        return None
+    try:
+        width = int(args.get('w') or 0)
+        height = int(args.get('h') or 0)
+    except ValueError:
+        raise ValueError('w and h must be whole numbers')
+    #a missing w or h follows the aspect ratio, one that is given has to be a real size
+    for name, value in (('w', width), ('h', height)):
+        if args.get(name) and not 1 <= value <= MAX_SIZE:
+            raise ValueError(f'w and h must be between 1 and {MAX_SIZE}')
+
+    fit = args.get('fit', 'fit')
+    if fit not in FITS:
+        raise ValueError(f'fit must be one of {", ".join(FITS)}')
+    if fit == 'fill' and not (width and height):
+        raise ValueError('fill needs both w and h')
+
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    extension = 'jpg' if extension == 'jpeg' else extension
+    fmt = args.get('fmt', extension if extension in FORMATS else 'jpg')
+    if fmt not in FORMATS:
+        raise ValueError(f'fmt must be one of {", ".join(FORMATS)}')
+    return Variant(width, height, fit, fmt)
+
+
+class DerivativeCache:
+    def __init__(self, source_folder, cache_folder, max_bytes=256 * 1024 * 1024) -> None:
+        self.source_folder = source_folder
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.files = OrderedDict()          #name -> size, least recently used first
+        self.size = 0
+        self.pending = {}                   #name -> Future of a copy being made
+        self.lock = threading.Lock()
+
+        check_and_create(cache_folder)
+        entries = [entry for entry in os.scandir(cache_folder) if entry.is_file()]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_atime):
+            self.files[entry.name] = entry.stat().st_size
+            self.size += entry.stat().st_size
+        self.evict()
+
+    @staticmethod
+    def variant_name(filename, variant: Variant) -> str:
+        return f'{filename}.{variant.width}x{variant.height}.{variant.fit}{FORMATS[variant.fmt][0]}'
+
+    def get(self, filename, variant: Variant) -> str:
+        '''
+        Return the name of the resized copy in the cache folder, making it first if needed
+        raises FileNotFoundError for an unknown file and ValueError if it can't be decoded
+        '''
+        name = self.variant_name(filename, variant)
+        with self.lock:
+            if name in self.files:
+                self.files.move_to_end(name)
+                return name
+            future = self.pending.get(name)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.pending[name] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            size = self.generate(filename, variant, name)
+            with self.lock:
+                self.files[name] = size
+                self.size += size
+            self.evict()
+            future.set_result(name)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(name, None)
+        return name
+
+    def read_source(self, path, variant: Variant):
+        if is_video_file(path):
+            return read_video_frame(path)
+        if is_animated_file(path):
+            return read_animation_frame(path)
+        return cv_read_reduced(path, variant.height or variant.width, variant.width or variant.height)
+
+    def generate(self, filename, variant: Variant, name) -> int:
+        path = safe_join(self.source_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise FileNotFoundError(filename)
+
+        with metrics.timer(RENDER_SECONDS, stage='derivative'):
+            image = self.read_source(path, variant)
+            if image is None:
+                raise ValueError(f'{filename} is not an image')
+
+            image_height, image_width = image.shape[:2]
+            width = variant.width or max(round(image_width * variant.height / image_height), 1)
+            height = variant.height or max(round(image_height * variant.width / image_width), 1)
+            if variant.fit == 'fill' or width < image_width or height < image_height:
+                #a fit never makes an image bigger than it is
+                image = cv_resize_to_target_size(image, height, width, variant.fit)
+
+            extension, params = FORMATS[variant.fmt]
+            success, encoded = cv2.imencode(extension, image, params)
+            if not success:
+                raise ValueError(f'Failed to encode {name}')
+
+        #write next to the final name and rename, so a half written file is never served
+        target = os.path.join(self.cache_folder, name)
+        temporary = target + '.part'
+        with open(temporary, 'wb') as file:
+            file.write(encoded.tobytes())
+        os.replace(temporary, target)
+        return len(encoded)
+
+    def evict(self) -> None:
+        with self.lock:
+            removed = []
+            while self.size > self.max_bytes and len(self.files) > 1:
+                name, size = self.files.popitem(last=False)
+                self.size -= size
+                removed.append(name)
+        self.remove_files(removed)
+
+    def discard(self, filename) -> None:
+        #forget the copies of a deleted file
+        prefix = filename + '.'
+        with self.lock:
+            removed = [name for name in self.files if name.startswith(prefix)]
+            for name in removed:
+                self.size -= self.files.pop(name)
+        self.remove_files(removed)
+
+    def remove_files(self, names) -> None:
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_folder, name))
+            except OSError as e:
+                print(f"Failed to remove {name} from the derivative cache: {e}")
@@ -0,0 +1,79 @@
+import json
+import threading
+from collections import OrderedDict
+from queue import Empty
+
+from canvas_stream import StreamClient
+
+#this class EventBroadcaster is responsible for pushing changes to the web interface as server-sent events
+#there is one broadcaster for all clients: every event is formatted once and the same bytes are handed to each of them
+#the latest event of every kind is replayed to new clients, so a page gets the current state as soon as it connects
+#clients that can't keep up are dropped, their browser reconnects by itself
+
+
+class EventBroadcaster:
+
+    KEEPALIVE = b': keepalive\n\n'
+    RETRY = b'retry: 3000\n\n'                  #how long a browser waits before reconnecting, in milliseconds
+
+    def __init__(self, max_pending=16, keepalive_interval=15) -> None:
+        self.max_pending = max_pending
+        self.keepalive_interval = keepalive_interval
+        self.clients: set = set()
+        self.latest = OrderedDict()             #event -> last chunk sent for it
+        self.event_id = 0
+        self.lock = threading.Lock()
+
+    @property
+    def mimetype(self) -> str:
+        return 'text/event-stream'
+
+    @property
+    def running(self) -> bool:
+        return True
+
+    @property
+    def client_count(self) -> int:
+        with self.lock:
+            return len(self.clients)
+
+    def format(self, event, data) -> bytes:
+        return f'id: {self.event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+
+    def publish(self, event, data) -> None:
+        with self.lock:
+            self.event_id += 1
+            chunk = self.format(event, data)
+            self.latest[event] = chunk
+            self.latest.move_to_end(event)
+            clients = list(self.clients)
+        for client in clients:
+            if not client.send(chunk):
+                self.remove_client(client)
+
+    def add_client(self) -> StreamClient:
+        client = StreamClient(self.max_pending)
+        with self.lock:
+            client.send(self.RETRY)
+            for chunk in self.latest.values():
+                client.send(chunk)
+            self.clients.add(client)
+        return client
+
+    def remove_client(self, client: StreamClient) -> None:
+        with self.lock:
+            self.clients.discard(client)
+
+    def stream(self, client: StreamClient):
+        '''
+        Generator yielding the events for a single client, used as the Flask response body
+        '''
+        try:
+            while not client.dropped:
+                try:
+                    yield client.queue.get(timeout=self.keepalive_interval)
+                except Empty:
+                    #a comment keeps proxies from closing an idle connection
+                    yield self.KEEPALIVE
+        finally:
+            self.remove_client(client)
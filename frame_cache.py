@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+
+#this class FrameCache is responsible for keeping recently processed frames in memory
+#frames are keyed by the media and the render parameters (height, width, scale mode, rotation)
+#so the same image shown on several displays of the same size is only processed once
+
+
+class FrameCache:
+    def __init__(self, max_frames=6) -> None:
+        self.max_frames = max_frames
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(media_id, target_height, target_width, scale_mode, angle) -> tuple:
+        return (media_id, target_height, target_width, str(scale_mode), angle)
+
+    def get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame) -> None:
+        if frame is None or self.max_frames <= 0:
+            return
+        with self.lock:
+            self.frames[key] = frame
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.max_frames:
+                self.frames.popitem(last=False)
+
+    def discard(self, media_id) -> None:
+        #drop every frame of a media, e.g. when it is deleted
+        with self.lock:
+            for key in [key for key in self.frames if key[0] == media_id]:
+                del self.frames[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.frames.clear()
+
+    def __len__(self) -> int:
+        return len(self.frames)
@@ -0,0 +1,47 @@
+import base64
+import json
+
+#these helpers are responsible for the paging of the gallery API (/gallery)
+#a cursor is the sort key (upload time, filename) of the last media of the previous page, encoded so clients treat it as opaque
+#paging by key instead of by offset means a page never repeats or skips media when files are added or deleted meanwhile
+
+GALLERY_FIELDS = ('filename', 'type', 'orientation', 'width', 'height', 'uploaded', 'thumbnail', 'url')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor) -> tuple:
+    '''
+    Raises ValueError for a cursor that wasn't made by encode_cursor
+    '''
+    try:
+        uploaded, filename = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(uploaded), str(filename)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def parse_fields(fields) -> tuple:
+    '''
+    The fields asked for with ?fields=a,b, all of them when none are given, raises ValueError for unknown ones
+    '''
+    if not fields:
+        return GALLERY_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in requested if field not in GALLERY_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return requested
+
+
+def parse_limit(limit) -> int:
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return min(limit, MAX_PAGE_SIZE)
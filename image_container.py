@@ -4,15 +4,18 @@ import os
 import cv2
 import numpy as np
 from utils import cv2_crop_center, overlay_center, read_image_from_url, cv_resize_to_target_size, cv2_rotate_image, read_image_properties
+from metrics import metrics, RENDER_SECONDS
 
 from typing import List, Optional
 from enum import Enum
+from itertools import count
 import gc
 
 
 class ImageContainer:
     
     DEFAULT_THUMBNAIL_DIR = 'thumbnails'
+    _ids = count()
     
     class Orientation(Enum):
         UNSET = 'square'
@@ -54,17 +57,24 @@ class ImageContainer:
     #it will keep a record of the orientation of the image 
     #it will keep the original image object and the resized image object
     def __init__(self) -> None:
+        #unique per container, used to key its frames in a shared FrameCache
+        self.cache_id: int = next(ImageContainer._ids)
+        
         #strings
         self.file_path: str = None
         self.thumbnail_path: str = None
         self.filename: str = None
         self.source: ImageContainer.Source = None
+        self.uploaded: float = 0                        #modification time of the file, when it was added to the library
+        self.url_cache = None                           #RemoteMediaCache that downloads a URL source ahead of time, see from_url
         
         #image data
         self._image: np.ndarray = None
         self._encoded_image = None
         self.thumbnail: np.ndarray = None
         self.processed_image: np.ndarray = None
+        self.oversampled_image: np.ndarray = None      #larger processed frame for the Ken Burns pan, see get_oversampled_for
+        self.oversampled_parameters = None
         # self._encoded_processed_image = None
         
         #properties
@@ -96,8 +106,25 @@ class ImageContainer:
         return self.filename == other.filename
 
 
+    @property
+    def thumbnail_name(self) -> str:
+        return self.filename
+
+    @property
+    def local_path(self) -> Optional[str]:
+        # where the image is read from, None for a remote image that hasn't been downloaded yet
+        if self.source == ImageContainer.Source.URL:
+            return self.url_cache.path_for(self.file_path) if self.url_cache is not None else None
+        return self.file_path
+
     def exists(self) -> bool:
-        return os.path.exists(self.file_path)
+        path = self.local_path
+        return path is not None and os.path.exists(path)
+
+    @property
+    def reloadable(self) -> bool:
+        # the decoded image can be dropped and read again from disk
+        return self.source == ImageContainer.Source.FILE or self.url_cache is not None
 
     @property
     def image(self) -> np.ndarray:
@@ -133,6 +160,7 @@ class ImageContainer:
         #strings
         self.file_path: str = file_path
         self.filename = os.path.basename(file_path)
+        self.uploaded = os.path.getmtime(file_path)
 
         #image data
         if read_image:
@@ -148,14 +176,19 @@ class ImageContainer:
         
         return self
 
-    def from_url(self, url, thumbnail_dir=None, thumbnail_width=100, thumbnail_height=100, read_image=False):
+    def from_url(self, url, thumbnail_dir=None, thumbnail_width=100, thumbnail_height=100, read_image=False, cache=None, size=None):
+        '''
+        with a RemoteMediaCache the image is only ever read from its downloaded copy, never fetched on the display path
+        size is the (width, height) when it is known before the download, e.g. from a playlist index
+        '''
         self.source = ImageContainer.Source.URL
         #strings
         self.file_path: str = url
         self.filename = os.path.basename(url)
+        self.url_cache = cache
 
         #image data
-        if read_image:
+        if read_image and cache is None:
             self._image = read_image_from_url(url)
 
         #properties
@@ -164,7 +197,14 @@ class ImageContainer:
         
         #default actions
         # self.check_for_thumbnail(thumbnail_dir)       #TODO decide what to do with the thumbnail
-        self.populate_properties()                      #populate the properties
+        if self._image is None and self.local_path is None:
+            #not downloaded yet, the orientation stays unset until the size is known
+            self.width, self.height = size if size else (0, 0)
+            self.is_portrait = self.height > self.width
+            if size:
+                self.orientation = ImageContainer.Orientation.PORTRAIT if self.is_portrait else ImageContainer.Orientation.LANDSCAPE
+        else:
+            self.populate_properties()                  #populate the properties
         
         return self
 
@@ -203,18 +243,32 @@ class ImageContainer:
     def reload_image(self):        
         if self._encoded_image is not None:
             print(f'Reloading image from memory')
-            self._image = cv2.imdecode(self._encoded_image, cv2.IMREAD_COLOR)
+            with metrics.timer(RENDER_SECONDS, stage='decode'):
+                self._image = cv2.imdecode(self._encoded_image, cv2.IMREAD_COLOR)
             return
         
         if self.source == ImageContainer.Source.FILE:
             if self.exists():
                 print(f'Reloading image from file {self.filename}')
-                self._image = cv2.imread(self.file_path)
+                with metrics.timer(RENDER_SECONDS, stage='decode'):
+                    self._image = cv2.imread(self.file_path)
         
         if self.source == ImageContainer.Source.URL:
-            print(f'Reloading image from URL {self.file_path}')
-            self._image = read_image_from_url(self.file_path)
+            if self.url_cache is not None:
+                path = self.local_path
+                if path is None:
+                    #the prefetcher downloads it ahead of the playlist, it is skipped until then
+                    return
+                print(f'Reloading image {self.filename} from the remote cache')
+                with metrics.timer(RENDER_SECONDS, stage='decode'):
+                    self._image = cv2.imread(path)
+            else:
+                print(f'Reloading image from URL {self.file_path}')
+                with metrics.timer(RENDER_SECONDS, stage='decode'):
+                    self._image = read_image_from_url(self.file_path)
 
+        if self._image is None:
+            return
         self._encoded_image = cv2.imencode('.jpg', self._image, [int(cv2.IMWRITE_JPEG_QUALITY), 100])[1]
 
 
@@ -234,15 +288,44 @@ class ImageContainer:
         
         if self.target_height != target_height or self.target_width != target_width or self.scale_mode != scale_mode or self.rotation != angle:
             print('Reprocessing image')
-            if int(abs(self.rotation - angle)) == 180:
-                self.processed_image = cv2_rotate_image(self.processed_image, 180)
+            if self.processed_image is not None and int(abs(self.rotation - angle)) == 180:
+                with metrics.timer(RENDER_SECONDS, stage='rotate'):
+                    self.processed_image = cv2_rotate_image(self.processed_image, 180)
                 self.rotation = angle
             else:
                 self.process_image(target_height, target_width, scale_mode, angle)
         else:
             if self.processed_image is None:
                 self.process_image(self.target_height, self.target_width, self.scale_mode, self.rotation)
+            else:
+                metrics.inc('processed_cache_hits_total')
         
+    def get_processed_for(self, target_height, target_width, scale_mode, angle, frame_cache=None) -> Optional[np.ndarray]:
+        '''
+        Get the processed frame for the given render parameters.
+        When a shared FrameCache is given, frames already processed for these parameters (e.g. by another display) are reused
+        '''
+        if frame_cache is None:
+            self.check_processing_parameters(target_height, target_width, scale_mode, angle)
+            return self.processed_image
+
+        if isinstance(scale_mode, ImageContainer.ScaleMode):
+            scale_mode = scale_mode.value
+        key = frame_cache.make_key(self.cache_id, target_height, target_width, scale_mode, angle)
+        if self.processed_image is None or not self.has_processing_parameters(target_height, target_width, scale_mode, angle):
+            frame = frame_cache.get(key)
+            if frame is not None:
+                metrics.inc('processed_cache_hits_total')
+                return frame
+
+        self.check_processing_parameters(target_height, target_width, scale_mode, angle)
+        frame_cache.put(key, self.processed_image)
+        return self.processed_image
+
+    def has_processing_parameters(self, target_height, target_width, scale_mode, angle) -> bool:
+        return (self.target_height == target_height and self.target_width == target_width
+                and self.scale_mode == scale_mode and self.rotation == angle)
+
     def check_for_thumbnail(self, thumbnail_dir):
         #check if thumbnail dir exists, if not create one
         if thumbnail_dir is None:
@@ -250,7 +333,7 @@ class ImageContainer:
             thumbnail_dir = self.DEFAULT_THUMBNAIL_DIR
         
         #check if thumbnail exists, if not create one
-        self.thumbnail_path = os.path.join(thumbnail_dir, self.filename)
+        self.thumbnail_path = os.path.join(thumbnail_dir, self.thumbnail_name)
         if os.path.exists(self.thumbnail_path):
             self.has_thumbnail = True
             # self.check_thumnail_size(self.thumbnail_width, self.thumbnail_height)
@@ -275,11 +358,14 @@ class ImageContainer:
     def populate_properties(self):
         if self._image is None:
             #read the properties from the file without loading the image
-            size = read_image_properties(self.file_path)['size']
-            self.width, self.height = size
+            self.set_size(*read_image_properties(self.local_path)['size'])
         else:
-            self.height, self.width = self._image.shape[:2]
-            
+            height, width = self._image.shape[:2]
+            self.set_size(width, height)
+
+    def set_size(self, width, height):
+        # the size and the orientation that follows from it
+        self.width, self.height = width, height
         self.is_portrait = self.height > self.width
 
         if self.is_portrait:
@@ -300,6 +386,8 @@ class ImageContainer:
         if not self.exists() and self._image is None:
             return None
 
+        previous_image = self.processed_image
+
         #do the processing of the image once
         self.target_height = target_height
         self.target_width = target_width
@@ -308,26 +396,67 @@ class ImageContainer:
         
         self.scale_mode = scale_mode
         self.rotation = angle
-        rotated_image = cv2_rotate_image(self.image, self.rotation)
-        self.processed_image = cv_resize_to_target_size(rotated_image, self.target_height, self.target_width, self.scale_mode)
-        # self.processed_image = cv2_crop_center(self.processed_image, (self.target_height, self.target_width))
+        self.processed_image = self.render(self.image, self.target_height, self.target_width, self.scale_mode, self.rotation)
         
-        if self.scale_mode == ImageContainer.ScaleMode.FIT:
-            background = cv_resize_to_target_size(rotated_image, self.target_height, self.target_width, ImageContainer.ScaleMode.FILL)
-            background = cv2.GaussianBlur(background, (101, 101), 0)
-            background = cv2.multiply(background, 0.5)
-            self.processed_image = cv2_crop_center(self.processed_image, (self.target_height, self.target_width), background=background)
-        else:
-            self.processed_image = cv2_crop_center(self.processed_image, (self.target_height, self.target_width))
-                        
-            # background = cv_resize_to_target_size(rotated_image, self.target_height, self.target_width, ImageContainer.ScaleMode.FILL)
-            # self.processed_image = overlay_center(background, self.processed_image)
+        if previous_image is not None and previous_image.shape == self.processed_image.shape and np.array_equal(previous_image, self.processed_image):
+            #the new parameters resolve to the same frame, keep the old one so the viewer can tell nothing changed
+            self.processed_image = previous_image
         
-        if self.source == ImageContainer.Source.FILE:
+        metrics.inc('images_processed_total')
+        if self.reloadable:
             #if it's from file we can clear the image from memory as we can easily reload it
             self.image = None
         return self.processed_image
 
+    def render(self, image, target_height, target_width, scale_mode, angle) -> np.ndarray:
+        #rotate, resize and crop the image to the target size, over a blurred copy of itself for 'fit'
+        with metrics.timer(RENDER_SECONDS, stage='rotate'):
+            rotated_image = cv2_rotate_image(image, angle)
+        with metrics.timer(RENDER_SECONDS, stage='resize'):
+            resized_image = cv_resize_to_target_size(rotated_image, target_height, target_width, scale_mode)
+        
+        if scale_mode == ImageContainer.ScaleMode.FIT:
+            with metrics.timer(RENDER_SECONDS, stage='resize'):
+                background = cv_resize_to_target_size(rotated_image, target_height, target_width, ImageContainer.ScaleMode.FILL)
+            with metrics.timer(RENDER_SECONDS, stage='blur'):
+                background = cv2.GaussianBlur(background, (101, 101), 0)
+                background = cv2.multiply(background, 0.5)
+            return cv2_crop_center(resized_image, (target_height, target_width), background=background)
+        
+        return cv2_crop_center(resized_image, (target_height, target_width))
+
+    def get_oversampled_for(self, target_height, target_width, scale_mode, angle, zoom, frame_cache=None) -> Optional[np.ndarray]:
+        '''
+        The frame processed at zoom times the target size. The Ken Burns pan moves a crop window over it,
+        so it is made once per image instead of resizing the image for every frame
+        '''
+        if isinstance(scale_mode, ImageContainer.ScaleMode):
+            scale_mode = scale_mode.value
+        parameters = (target_height, target_width, scale_mode, angle, zoom)
+        if self.oversampled_image is not None and self.oversampled_parameters == parameters:
+            metrics.inc('processed_cache_hits_total')
+            return self.oversampled_image
+
+        key = None
+        if frame_cache is not None:
+            key = frame_cache.make_key(self.cache_id, target_height, target_width, scale_mode, angle) + (zoom,)
+            frame = frame_cache.get(key)
+            if frame is not None:
+                metrics.inc('processed_cache_hits_total')
+                return frame
+
+        if not self.exists() and self._image is None:
+            return None
+        height, width = int(round(target_height * zoom)), int(round(target_width * zoom))
+        self.oversampled_image = self.render(self.image, height, width, scale_mode, angle)
+        self.oversampled_parameters = parameters
+        metrics.inc('images_processed_total')
+        if self.reloadable:
+            self.image = None
+        if frame_cache is not None:
+            frame_cache.put(key, self.oversampled_image)
+        return self.oversampled_image
+
     def blend_image(self, image: 'ImageContainer', alpha: float) -> Optional[np.ndarray]:
         # if self.processed_image is None:
         #     return image.processed_image
@@ -343,8 +472,17 @@ class ImageContainer:
 
         return cv2.addWeighted(self.processed_image, alpha, image.processed_image, 1 - alpha, 0)
 
+    def release_memory(self):
+        #like free_memory but also drops the in-memory encoded copy for file backed images, they can be read again from disk
+        self._image = None
+        self.processed_image = None
+        self.oversampled_image = None
+        if self.reloadable:
+            self._encoded_image = None
+
     def free_memory(self):
         self._image = None
         self.thumbnail = None
         self.processed_image = None
+        self.oversampled_image = None
         gc.collect()
\ No newline at end of file
@@ -26,24 +26,47 @@
 # the application will have a method to quit the slideshow
 # the application will have an option to ransomise the next image
 
+import base64
 import time
 import tkinter as tk
 from PIL import ImageTk
 from config_manager import ConfigManager
 from media_manager import MediaManager
+from frame_cache import FrameCache
+from video_player import VideoContainer, VideoPlayer
+from animated_image import AnimatedContainer, AnimationPlayer
+from ken_burns import KenBurns
+from command_queue import CommandQueue, merge_kwargs, sum_steps
 from image_container import ImageContainer
-from utils import cv2_to_pil
+from utils import cv2_to_pil, cv_read_reduced
+from metrics import metrics, RENDER_SECONDS
 import cv2
 import numpy as np
 
 class ImageViewer:
-    def __init__(self, config_manager: ConfigManager):
+
+    COMMAND_INTERVAL = 20           #milliseconds between draining the commands posted by other threads
+
+    def __init__(self, config_manager: ConfigManager, media_manager: MediaManager = None, frame_cache: FrameCache = None,
+                 display_config: dict = None, master: tk.Tk = None):
+        '''
+        A viewer owns one window. Several viewers can run in one process by passing the first viewer's root as master,
+        a view of its media_manager and its frame_cache, so the catalog is loaded and each frame processed only once.
+        display_config holds the per display overrides (screen size, position, rotation, timing, ...) of the top level configuration
+        '''
         
         #objects
         self.config_manager: ConfigManager = config_manager
-        self.media_manager = MediaManager(config_manager.config['image_folder'], config_manager.config['thumbnail_folder'], 200, 200)
-        self.media_manager.get_media_files()
-        self.media_manager.create_playlist()
+        self.display_config: dict = display_config
+        self.master = master
+        if media_manager is None:
+            media_manager = MediaManager(config_manager.config['image_folder'], config_manager.config['thumbnail_folder'], 200, 200)
+            media_manager.get_media_files()
+            media_manager.create_playlist()
+        self.media_manager = media_manager
+        if frame_cache is None:
+            frame_cache = FrameCache(config_manager.config['frame_cache_size'])
+        self.frame_cache = frame_cache
 
         #internal variables    
         self._display_mode = None
@@ -55,8 +78,20 @@ class ImageViewer:
         self._next_image_job_id = None
         self._transition_job_id = None
         self._media_orientation_filter = None
+        self._idle = False
+        self._prewarmed = False
+        self._active_before_idle = False
+        self._hold_state_changes = False     #set while going in or out of idle, so that sends a single state
+        self._playback_job_id = None
+        self.media_player = None                #VideoPlayer, AnimationPlayer or KenBurns of the media on screen
+        self.playback_started = None            #when the current clip first started, clips loop until frame_interval has passed
+        self.commands = CommandQueue()          #work posted by other threads, run on the Tk loop by _drain_commands
         
         self.photo = None
+        self._displayed_image = None        #the frame last pasted to the canvas, used to skip redundant updates
+        self.fade_in_progress = False
+        self.fade_from_image = None
+        self.target_image = None
         
         # make the UI - sets up the tkinter window and screen size variables
         self.create_ui()
@@ -64,36 +99,44 @@ class ImageViewer:
         # the current image as ImageContainer
         self.current_image: ImageContainer = None
         self.canvas_image: np.ndarray = None
+        # (generation, image) of the frame on screen, the generation increases every time the canvas is updated
+        self.canvas_frame: tuple = (0, None)
 
         #set the initial values from the configuration        
-        self.display_mode = self.config_manager.config['display_mode']
-        self.scale_mode = self.config_manager.config['scale_mode']
-        self.rotation = self.config_manager.config['rotation']
-        self.frame_interval = self.config_manager.config['frame_interval']
-        self.transition_duration = self.config_manager.config['transition_duration']
-        self.media_orientation_filter = self.config_manager.config['media_orientation_filter']
+        self.display_mode = self.get_setting('display_mode')
+        self.scale_mode = self.get_setting('scale_mode')
+        self.rotation = self.get_setting('rotation')
+        self.frame_interval = self.get_setting('frame_interval')
+        self.transition_duration = self.get_setting('transition_duration')
+        self.media_orientation_filter = self.get_setting('media_orientation_filter')
                
         #set the initial image
         self.current_image = self.media_manager.get_media_by_index(0)
         if self.current_image is not None:
-            self.current_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
-            self.canvas_image = self.current_image.get_processed_image()
+            self.canvas_image = self.get_processed_frame(self.current_image)
         self.update_canvas()
 
         #mqtt callbacks
         self.image_change_callback = None
+        self.state_change_callback = None       #called with self.state when the slideshow is paused, resumed or goes idle
         
         
     def create_ui(self):
-        self.root = tk.Tk()
+        if self.master is None:
+            self.root = tk.Tk()
+        else:
+            # additional displays are extra windows of the same Tk instance and share its mainloop
+            self.root = tk.Toplevel(self.master)
         
-        self.screen_width = self.root.winfo_screenwidth()
-        self.screen_height = self.root.winfo_screenheight()
+        self.screen_width = self.get_setting('screen_width') or self.root.winfo_screenwidth()
+        self.screen_height = self.get_setting('screen_height') or self.root.winfo_screenheight()
+        self.window_x = self.get_setting('window_x') or 0
+        self.window_y = self.get_setting('window_y') or 0
         
         if self.display_mode == "fullscreen":
             self.root.attributes('-fullscreen', True)
         else:
-            self.root.geometry(f"{self.screen_width}x{self.screen_height}")
+            self.root.geometry(f"{self.screen_width}x{self.screen_height}+{self.window_x}+{self.window_y}")
         
         self.root.configure(background='black')
 
@@ -126,9 +169,9 @@ class ImageViewer:
                     self.root.config(cursor="none")
                 elif self.display_mode == "windowed":
                     self.root.attributes('-fullscreen', False)
-                    self.root.geometry("800x600")
+                    self.root.geometry(f"800x600+{self.window_x}+{self.window_y}")
                     self.root.config(cursor="arrow")
-                self.config_manager.update_parameter('display_mode', mode)
+                self.update_setting('display_mode', mode)
 
     @property
     def scale_mode(self):
@@ -139,9 +182,8 @@ class ImageViewer:
         if ConfigManager.is_valid_value('scale_mode', mode):
             if self._scale_mode != mode:
                 self._scale_mode = mode
-                self.config_manager.update_parameter('scale_mode', mode)
+                self.update_setting('scale_mode', mode)
                 if self.current_image is not None:
-                    self.current_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
                     self.fade_to_image(self.current_image, self.transition_duration)
 
     @property
@@ -153,9 +195,8 @@ class ImageViewer:
         if ConfigManager.is_valid_value('rotation', rotation):
             if self._rotation != rotation:
                 self._rotation = rotation
-                self.config_manager.update_parameter('rotation', rotation)
+                self.update_setting('rotation', rotation)
                 if self.current_image is not None:
-                    self.current_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
                     self.fade_to_image(self.current_image, self.transition_duration)
                     
     @property
@@ -170,6 +211,7 @@ class ImageViewer:
                     self._slideshow_active = True
                 else:
                     self._slideshow_active = False
+                self.notify_state_change()
 
     @property
     def frame_interval(self):
@@ -207,12 +249,36 @@ class ImageViewer:
             self.root.after_cancel(self._transition_job_id)
         self._transition_job_id = id
     
+    @property
+    def playback_job_id(self):
+        return self._playback_job_id
+    
+    @playback_job_id.setter
+    def playback_job_id(self, id):
+        if self._playback_job_id is not None:
+            self.root.after_cancel(self._playback_job_id)
+        self._playback_job_id = id
+    
     @property
     def current_image_name(self):
         if self.current_image is None:
             return ''
         return self.current_image.filename
     
+    @property
+    def idle(self):
+        return self._idle
+    
+    @property
+    def state(self):
+        return {'slideshow_active': self.slideshow_active, 'idle': self.idle}
+    
+    def notify_state_change(self):
+        if self._hold_state_changes:
+            return
+        if self.state_change_callback is not None:
+            self.state_change_callback(self.state)
+    
     @property
     def media_orientation_filter(self):
         return self._media_orientation_filter
@@ -222,10 +288,32 @@ class ImageViewer:
         if ConfigManager.is_valid_value('media_orientation_filter', orientation):
             if self._media_orientation_filter != orientation:
                 self._media_orientation_filter = orientation
-                self.config_manager.update_parameter('media_orientation_filter', orientation)
+                self.update_setting('media_orientation_filter', orientation)
                 self.media_manager.filter_media_by_orientation(self.media_orientation_filter)
     
     
+    def get_setting(self, key):
+        '''
+        Read a setting, per display overrides take precedence over the top level configuration
+        '''
+        if self.display_config is not None and key in self.display_config:
+            return self.display_config[key]
+        return self.config_manager.config.get(key)
+    
+    def update_setting(self, key, value):
+        '''
+        Store a setting where it was read from, a display only overrides the settings listed in its own configuration
+        '''
+        if self.display_config is not None and key in self.display_config:
+            if ConfigManager.is_valid_value(key, value):
+                self.display_config[key] = value
+                self.config_manager.save_config()
+        else:
+            self.config_manager.update_parameter(key, value)
+    
+    def get_processed_frame(self, image: ImageContainer):
+        return image.get_processed_for(self.screen_height, self.screen_width, self.scale_mode, self.rotation, self.frame_cache)
+    
     def toggle_fullscreen(self, event=None):
         if self.display_mode == "fullscreen":
             self.display_mode = "windowed"
@@ -267,12 +355,18 @@ class ImageViewer:
         if self.canvas_image is None:
             return
         
+        if self.canvas_image is self._displayed_image:
+            # this exact frame is already on screen
+            return
+        
         # Convert OpenCV image to PIL image and create PhotoImage
-        pil_image = cv2_to_pil(self.canvas_image)
-        if self.photo is None:
-            self.photo = ImageTk.PhotoImage(pil_image)
-        else:
-            self.photo.paste(pil_image)
+        with metrics.timer(RENDER_SECONDS, stage='color_convert'):
+            pil_image = cv2_to_pil(self.canvas_image)
+        with metrics.timer(RENDER_SECONDS, stage='tk_paste'):
+            if self.photo is None:
+                self.photo = ImageTk.PhotoImage(pil_image)
+            else:
+                self.photo.paste(pil_image)
         
         # Get image dimensions
         width, height = self.photo.width(), self.photo.height()
@@ -285,6 +379,10 @@ class ImageViewer:
         
         # Store the reference to the photo to prevent garbage collection
         self.canvas.image = self.photo
+
+        # publish the new frame as a single tuple so other threads always see a matching generation and image
+        self._displayed_image = self.canvas_image
+        self.canvas_frame = (self.canvas_frame[0] + 1, self.canvas_image)
     
     def set_image_from_path(self, path: str):
         image = ImageContainer()
@@ -299,15 +397,29 @@ class ImageViewer:
     def set_image(self, image: np.ndarray, title: str='plex_image'):
         plex_image = ImageContainer()
         plex_image.from_image(image, filename=title)
-        plex_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
         self.fade_to_image(plex_image, self.transition_duration)
     
-    def set_image_from_base64(self, base64_image: str, name: str='remote_image'):
+    def set_image_from_base64(self, base64_image: str, name: str='remote_image') -> bool:
+        return self.set_image_from_bytes(base64.b64decode(base64_image), name)
+
+    def set_image_from_bytes(self, data: bytes, name: str='remote_image') -> bool:
+        '''
+        Show an encoded image (e.g. a camera snapshot) straight away, it is decoded once and only as large as the screen needs
+        can be called from any thread: the image is decoded on the calling thread and shown by the Tk loop
+        returns False if the data can't be decoded
+        '''
+        with metrics.timer(RENDER_SECONDS, stage='decode'):
+            image = cv_read_reduced(data, self.screen_height, self.screen_width)
+        if image is None:
+            return False
+        remote_image = ImageContainer()
+        remote_image.from_image(image, filename=name)
+        self.post(self.show_remote_image, remote_image, key='show')
+        return True
+
+    def show_remote_image(self, remote_image: ImageContainer):
         self.next_image_job_id = None
         self.transition_job_id = None
-        remote_image = ImageContainer()
-        remote_image.from_base64(base64_image, filename=name)
-        remote_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
         self.fade_to_image(remote_image, self.transition_duration)
     
     def select_image(self, image_name: str):
@@ -318,32 +430,71 @@ class ImageViewer:
         if image is None:
             print(f"Image {image_name} not found")
             return
-        image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
-        self.fade_to_image(image, self.transition_duration)
+        if not self.fade_to_image(image, self.transition_duration):
+            print(f"Image {image_name} is not available")
     
-    def fade_to_image(self, to_image: ImageContainer, duration: float):
+    def fade_to_image(self, to_image: ImageContainer, duration: float) -> bool:
+        '''
+        Crossfade to to_image. Returns False and leaves the screen and the current image as they are
+        when it can't be shown, e.g. a remote image that hasn't been downloaded yet
+        '''
+        player = None
+        if self.uses_ken_burns(to_image):
+            # the pan starts with the crossfade, its first frame is the target
+            player = self.create_player(to_image)
+            if player is not None:
+                player.start()
+            target_image = player.get_frame() if player is not None else None
+        else:
+            target_image = self.get_processed_frame(to_image)
+        if target_image is None:
+            if player is not None:
+                player.stop()
+            return False
+
+        self.stop_playback()
+        image_changed = to_image is not self.current_image
+        if image_changed:
+            self.playback_started = None
         self.current_image = to_image
-        if self.image_change_callback is not None:
+        if self.image_change_callback is not None and image_changed:
             self.image_change_callback(self.current_image.filename)
+        if player is not None:
+            self.start_playback(to_image, step=False, player=player)
+        
+        if self.fade_in_progress and target_image is self.target_image:
+            # already fading to this frame, let the running transition finish
+            return True
+        if target_image is self.canvas_image:
+            # the frame on screen is already the requested one, there is nothing to convert, paste or fade
+            self.transition_job_id = None
+            self.fade_in_progress = False
+            self._on_transition_finished()
+            return True
 
+        metrics.inc('transitions_total')
         self.fade_in_progress = True
         self.fade_start_time = time.time()
         self.fade_from_image = self.canvas_image
-        to_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation) 
-        self.target_image = to_image.get_processed_image()
-        if self.target_image is None:
-            self.target_image = self.canvas_image
-            return
+        self.target_image = target_image
         self.fade_duration = duration
 
+        if isinstance(to_image, AnimatedContainer):
+            # the animation plays during the crossfade, _fade_step blends its live frame
+            self.start_playback(to_image, step=False)
+
         if self.fade_from_image is None:
             self.fade_from_image = self.target_image
         if self.canvas_image is None:
+            # nothing to fade from, show the first frame straight away
             self.canvas_image = self.target_image        
             self.update_canvas()
             self.fade_in_progress = False
+            self._on_transition_finished()
+            return True
 
         self._fade_step()
+        return True
 
     def _fade_step(self):
         if not self.fade_in_progress:
@@ -351,16 +502,26 @@ class ImageViewer:
 
         current_time = time.time()
         elapsed_time = current_time - self.fade_start_time
-        if self.fade_duration == 0:
+        if self.fade_duration == 0 or self.fade_from_image is self.target_image:
             progress = 1.0
         else:
             progress = min(elapsed_time / self.fade_duration, 1.0)
 
-        self.canvas_image = cv2.addWeighted(
-            self.fade_from_image, 1 - progress,
-            self.target_image, progress,
-            0
-        )
+        if self.media_player is not None:
+            frame = self.media_player.get_frame()
+            if frame is not None:
+                self.target_image = frame
+
+        if progress < 1.0:
+            with metrics.timer(RENDER_SECONDS, stage='blend'):
+                self.canvas_image = cv2.addWeighted(
+                    self.fade_from_image, 1 - progress,
+                    self.target_image, progress,
+                    0
+                )
+        else:
+            # the last step is the target itself, no need to blend it
+            self.canvas_image = self.target_image
 
         self.update_canvas()
         
@@ -368,16 +529,123 @@ class ImageViewer:
             self.transition_job_id = self.root.after(10, self._fade_step)  # Approximately 30 FPS
         else:
             self.fade_in_progress = False
-            if self.slideshow_active:
-                self.next_image_job_id = self.root.after(int(self.frame_interval * 1000), self.show_next_image)
-                # self.current_image = self.target_image
+            self._on_transition_finished()
+    
+    def _on_transition_finished(self):
+        if self.media_player is not None:
+            # the animation kept playing under the crossfade, carry on from the frame it is at
+            self._playback_step()
+        elif isinstance(self.current_image, (VideoContainer, AnimatedContainer)) or self.uses_ken_burns(self.current_image):
+            # the crossfade went to the first frame of the clip, now play it
+            self.start_playback(self.current_image)
+        else:
+            self._schedule_next_image()
+    
+    def _schedule_next_image(self):
+        # while a clip or animation is playing the end of it moves the slideshow on
+        if self.slideshow_active and self.media_player is None:
+            self.next_image_job_id = self.root.after(int(self.frame_interval * 1000), self.show_next_image)
+    
+    def uses_ken_burns(self, media: ImageContainer):
+        return bool(self.get_setting('ken_burns')) and not isinstance(media, (VideoContainer, AnimatedContainer))
+    
+    def create_player(self, media: ImageContainer):
+        if self.uses_ken_burns(media):
+            frame = media.get_oversampled_for(self.screen_height, self.screen_width, self.scale_mode, self.rotation,
+                                              self.get_setting('ken_burns_zoom'), self.frame_cache)
+            if frame is None:
+                return None
+            return KenBurns(frame, self.screen_height, self.screen_width, self.frame_interval + self.transition_duration,
+                            fps=self.config_manager.config['ken_burns_fps'])
+        if isinstance(media, AnimatedContainer):
+            return AnimationPlayer(media.file_path, self.screen_height, self.screen_width, self.scale_mode, self.rotation,
+                                   max_frames=self.config_manager.config['animation_max_frames'])
+        return VideoPlayer(media.file_path, self.screen_height, self.screen_width, self.scale_mode, self.rotation,
+                           buffer_size=self.config_manager.config['video_buffer_frames'], fps=media.fps)
+    
+    def start_playback(self, media: ImageContainer, step=True, player=None):
+        self.stop_playback()
+        self.next_image_job_id = None
+        self.media_player = player if player is not None else self.create_player(media)
+        if self.media_player is None:
+            return
+        self.media_player.start()
+        if self.playback_started is None:
+            self.playback_started = time.monotonic()
+        if step:
+            self._playback_step()
+    
+    def stop_playback(self):
+        self.playback_job_id = None
+        if self.media_player is not None:
+            self.media_player.stop()
+            self.media_player = None
+    
+    def _playback_step(self):
+        player = self.media_player
+        if player is None:
+            return
+        
+        frame = player.get_frame()
+        if frame is not None:
+            self.canvas_image = frame
+            self.update_canvas()
+        
+        if not player.finished:
+            self.playback_job_id = self.root.after(player.frame_delay, self._playback_step)
+            return
+        
+        # played through: loop it until it has been on screen for at least frame_interval
+        if self.slideshow_active and time.monotonic() - self.playback_started >= self.frame_interval:
+            self.stop_playback()
+            self.playback_started = None
+            self.show_next_image()
+        else:
+            player.restart()
+            self.playback_job_id = self.root.after(player.frame_delay, self._playback_step)
         
     def quit_app(self, event=None):
         self.root.quit()
     
+    def post(self, func, *args, key=None, merge=None, **kwargs):
+        '''
+        Run func on the Tk loop, this is how other threads (Flask, MQTT, sensors) control the viewer
+        commands with the same key supersede each other, see CommandQueue
+        '''
+        self.commands.post(func, *args, key=key, merge=merge, **kwargs)
+
+    def call(self, func, *args, **kwargs):
+        # like post, the returned Future lets the calling thread wait for the result
+        return self.commands.call(func, *args, **kwargs)
+
+    def post_step(self, step: int):
+        # next (1) and previous (-1) presses in a burst add up to a single change of image
+        self.post(self.step_images, step, key='show', merge=sum_steps)
+
+    def post_parameters(self, **parameters):
+        self.post(self.update_parameters, key='parameters', merge=merge_kwargs, **parameters)
+
+    def _drain_commands(self):
+        self.commands.drain()
+        self.root.after(ImageViewer.COMMAND_INTERVAL, self._drain_commands)
+
+    def step_images(self, step: int):
+        # move step images forward (or back when negative) but only show the last one
+        for _ in range(abs(step) - 1):
+            if step > 0:
+                self.media_manager.get_next_media()
+            else:
+                self.media_manager.get_prev_media()
+        if step > 0:
+            self.show_next_image()
+        elif step < 0:
+            self.show_previous_image()
+
     def run(self):
+        self._drain_commands()
         self.play_slideshow()
-        self.root.mainloop()
+        if self.master is None:
+            self.root.mainloop()
     
     def pause_slideshow(self, event=None):  
         self.slideshow_active = False
@@ -392,35 +660,75 @@ class ImageViewer:
         if self.canvas_image is None:
             self.show_next_image()
             
-        self.next_image_job_id = self.root.after(int(self.frame_interval * 1000), self.show_next_image)
+        self._schedule_next_image()
     
     def show_next_image(self, event=None):
-        self.next_image = self.media_manager.get_next_media()
-        if self.next_image is None:
-            return
-        self.next_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
-        
-        self.fade_to_image(self.next_image, self.transition_duration)
-        
-        self.current_image = self.next_image
-        if self.slideshow_active:
-            self.next_image_job_id = self.root.after(int(self.frame_interval * 1000), self.show_next_image)
+        self._show_available_media(self.media_manager.get_next_media)
 
     def show_previous_image(self, event=None):
-        self.next_image = self.media_manager.get_prev_media()
-        if self.next_image is None:
-            return
-        self.next_image.check_processing_parameters(self.screen_height, self.screen_width, self.scale_mode, self.rotation)
-        
-        self.fade_to_image(self.next_image, self.transition_duration)
-        
-        self.current_image = self.next_image
-        if self.slideshow_active:
-            self.next_image_job_id = self.root.after(int(self.frame_interval * 1000), self.show_next_image)
+        self._show_available_media(self.media_manager.get_prev_media)
+
+    def _show_available_media(self, get_media):
+        # move through the playlist with get_media until something can be shown, at most once round it,
+        # so remote images that are still downloading are skipped straight away instead of holding the old one
+        for _ in range(max(len(self.media_manager.playlist), 1)):
+            self.next_image = get_media()
+            if self.next_image is None:
+                return
+            if self.fade_to_image(self.next_image, self.transition_duration):
+                self._schedule_next_image()
+                return
+            metrics.inc('media_skipped_total')
+        # nothing in the playlist can be shown right now, try again later
+        self._schedule_next_image()
         
     def quit_slideshow(self):
         pass
     
+    def enter_idle(self):
+        '''
+        The display has been turned off: stop the slideshow and release everything that can be rebuilt later.
+        The frame on the canvas is kept so it can still be served to the web interface.
+        '''
+        self._active_before_idle = self.slideshow_active
+        self._idle = True
+        self._hold_state_changes = True
+        try:
+            self.pause_slideshow()
+        finally:
+            self._hold_state_changes = False
+        self.notify_state_change()
+        self.stop_playback()
+        self._prewarmed = False
+        self.fade_in_progress = False
+        self.fade_from_image = None
+        self.target_image = None
+        self.next_image = None
+        self.frame_cache.clear()
+        self.media_manager.release_memory()
+        
+    def exit_idle(self):
+        self._idle = False
+        self._prewarmed = False
+        self._hold_state_changes = True
+        try:
+            if self._active_before_idle:
+                #only resume the slideshow if it was active before the display was turned off
+                self.play_slideshow()
+        finally:
+            self._hold_state_changes = False
+        self.notify_state_change()
+    
+    def prewarm(self, count=2):
+        '''
+        Process the current and the next images ahead of the display coming back on
+        '''
+        if self._prewarmed:
+            return
+        self._prewarmed = True
+        for media in self.media_manager.get_upcoming_media(count):
+            self.get_processed_frame(media)
+    
     
 if __name__ == "__main__":
     config_manager = ConfigManager('config.json')
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+#this class IngestQueue is responsible for adding uploaded media to the library in the background
+#the upload route only streams the files to a staging folder and queues them, a small pool of workers
+#then does the slow part (resizing, thumbnails, decoding) so the request returns straight away with a job id
+#the progress of a job can be read back by its id until it is evicted by newer jobs
+#items added by URL are downloaded first by a separate pool, several at once, then queued like the uploaded files
+#staged files are written as <random>~<name>.part and renamed without .part once complete, so a restart requeues
+#only whole files and still knows the name they were uploaded with
+
+STAGED_SEPARATOR = '~'
+PARTIAL_SUFFIX = '.part'
+
+
+def staging_suffix(name) -> str:
+    # the end of a staged file name, mkstemp puts a random prefix in front of it
+    return STAGED_SEPARATOR + re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.basename(name or '')) + PARTIAL_SUFFIX
+
+
+def staged_name(path) -> str:
+    # the name a staged file was uploaded with
+    return os.path.basename(path).partition(STAGED_SEPARATOR)[2] or os.path.basename(path)
+
+
+class IngestItem:
+    QUEUED = 'queued'
+    DOWNLOADING = 'downloading'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, name, path=None, url=None) -> None:
+        self.name = name                #the name it was uploaded with
+        self.path = path                #the staged file, None for a URL that hasn't been downloaded yet
+        self.url = url
+        self.filename = None            #the name in the library once it's done
+        self.status = IngestItem.QUEUED
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'status': self.status, 'filename': self.filename, 'error': self.error}
+
+
+class IngestJob:
+    def __init__(self, items) -> None:
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.created = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return all(item.status in (IngestItem.DONE, IngestItem.FAILED) for item in self.items)
+
+    @property
+    def status(self) -> str:
+        if self.done:
+            return IngestItem.FAILED if all(item.status == IngestItem.FAILED for item in self.items) else IngestItem.DONE
+        if any(item.status != IngestItem.QUEUED for item in self.items):
+            return IngestItem.PROCESSING
+        return IngestItem.QUEUED
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            items = [item.to_dict() for item in self.items]
+        completed = sum(item['status'] in (IngestItem.DONE, IngestItem.FAILED) for item in items)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': len(items),
+            'completed': completed,
+            'failed': sum(item['status'] == IngestItem.FAILED for item in items),
+            'items': items,
+        }
+
+
+class IngestQueue:
+    def __init__(self, process, workers=2, max_queued=200, max_jobs=50, fetch=None, fetch_workers=4) -> None:
+        '''
+        process is called with an IngestItem on a worker thread and returns the library filename, it raises on failure
+        fetch is called with the items that have a url but no path yet and sets their path (and name), it raises on failure
+        '''
+        self.process = process
+        self.fetch = fetch
+        self.fetch_workers = max(fetch_workers, 1)
+        self.fetching = 0                   #items being downloaded or waiting for a download thread
+        self._fetch_executor = None
+        self.workers = max(workers, 1)
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self.queue = Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.job_finished_callback = None
+        self._threads = []
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() + self.fetching
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'ingest-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def can_accept(self, count) -> bool:
+        return self.pending + count <= self.max_queued
+
+    def submit(self, items, check_limit=True) -> IngestJob:
+        '''
+        Queue the items as one job, raises OverflowError when the queue is full so the caller can ask to retry later
+        check_limit=False queues them regardless, for files that are already staged
+        '''
+        if check_limit and not self.can_accept(len(items)):
+            raise OverflowError('Ingest queue is full')
+        job = IngestJob(items)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                #forget the oldest finished job, running jobs are kept
+                oldest = next((job_id for job_id, old in self.jobs.items() if old.done), None)
+                if oldest is None:
+                    break
+                del self.jobs[oldest]
+        self.start()
+        for item in items:
+            if item.path is None and item.url is not None and self.fetch is not None:
+                self._submit_fetch(job, item)
+            else:
+                self.queue.put((job, item))
+        return job
+
+    def _submit_fetch(self, job, item) -> None:
+        with self.lock:
+            if self._fetch_executor is None:
+                self._fetch_executor = ThreadPoolExecutor(self.fetch_workers, thread_name_prefix='ingest-fetch')
+            self.fetching += 1
+        self._fetch_executor.submit(self._fetch, job, item)
+
+    def _fetch(self, job, item) -> None:
+        with job.lock:
+            item.status = IngestItem.DOWNLOADING
+        try:
+            self.fetch(item)
+        except Exception as e:
+            self._fail(job, item, e)
+            return
+        finally:
+            with self.lock:
+                self.fetching -= 1
+        with job.lock:
+            item.status = IngestItem.QUEUED
+        self.queue.put((job, item))
+
+    def get(self, job_id) -> IngestJob:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _work(self) -> None:
+        while True:
+            job, item = self.queue.get()
+            with job.lock:
+                item.status = IngestItem.PROCESSING
+            try:
+                filename = self.process(item)
+                with job.lock:
+                    item.filename = filename
+                    item.status = IngestItem.DONE
+            except Exception as e:
+                self._fail(job, item, e)
+                continue
+            finally:
+                self.queue.task_done()
+            self._check_finished(job)
+
+    def _fail(self, job, item, error) -> None:
+        print(f"Failed to ingest {item.name}: {error}")
+        with job.lock:
+            item.error = str(error)
+            item.status = IngestItem.FAILED
+        self._check_finished(job)
+
+    def _check_finished(self, job) -> None:
+        with job.lock:
+            finished = job.done and job.finished is None
+            if finished:
+                job.finished = time.time()
+        if finished and self.job_finished_callback is not None:
+            self.job_finished_callback(job)
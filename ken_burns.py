@@ -0,0 +1,95 @@
+import random
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from metrics import metrics, RENDER_SECONDS
+
+#this module animates a slow pan and zoom over a still image, the Ken Burns effect
+#the image is processed once at zoom times the screen size (ImageContainer.get_oversampled_for), every frame then only
+#moves a crop window over it and warps that window into a screen-sized frame,
+#so the cost of a frame depends on the screen size alone and not on the image
+#every frame is a new array: a published frame is read by the stream and canvas encoders on other threads,
+#a reused buffer could be overwritten while they encode it
+
+
+def ease_in_out(progress) -> float:
+    return progress * progress * (3 - 2 * progress)
+
+
+class KenBurns:
+    '''
+    Plays the pan like a clip, with the same start/stop/get_frame interface as VideoPlayer and AnimationPlayer.
+    The position follows the wall clock, so a slow frame lowers the frame rate but never the speed of the pan
+    '''
+
+    def __init__(self, source, target_height, target_width, duration, fps=30, rng=None) -> None:
+        self.source = source
+        self.target_height = target_height
+        self.target_width = target_width
+        self.duration = max(duration, 0.001)
+        self.frame_time = 1 / max(fps, 1)
+        rng = rng or random
+
+        #a window is (x, y, width) in source pixels, its height follows from the aspect ratio of the screen
+        source_height, source_width = source.shape[:2]
+        self.aspect = target_height / target_width
+        close_width = min(target_width, source_width)
+        whole = (0.0, 0.0, float(min(source_width, source_height / self.aspect)))
+        close = (rng.uniform(0, source_width - close_width),
+                 rng.uniform(0, max(source_height - close_width * self.aspect, 0)),
+                 float(close_width))
+        #zoom in or out, picked at random per image
+        self.windows = (whole, close) if rng.random() < 0.5 else (close, whole)
+
+        self.start_time = None
+        self.next_frame_time = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.start_time is not None and time.monotonic() - self.start_time >= self.duration
+
+    @property
+    def frame_delay(self) -> int:
+        #milliseconds until the next frame is due
+        return max(1, int((self.next_frame_time - time.monotonic()) * 1000))
+
+    def start(self) -> None:
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+            self.next_frame_time = self.start_time
+
+    def stop(self) -> None:
+        self.start_time = None
+
+    def restart(self) -> None:
+        #pan back the way it came so the motion carries on without a jump
+        self.windows = self.windows[::-1]
+        self.start_time = time.monotonic()
+        self.next_frame_time = self.start_time
+
+    def window_at(self, progress) -> tuple:
+        start, end = self.windows
+        progress = ease_in_out(min(max(progress, 0.0), 1.0))
+        return tuple(a + (b - a) * progress for a, b in zip(start, end))
+
+    def get_frame(self) -> Optional[np.ndarray]:
+        '''
+        The next frame of the pan, or None if it is not due yet
+        '''
+        if self.start_time is None:
+            return None
+        now = time.monotonic()
+        if now < self.next_frame_time:
+            return None
+        self.next_frame_time = now + self.frame_time
+        return self.render(*self.window_at((now - self.start_time) / self.duration))
+
+    def render(self, x, y, width) -> np.ndarray:
+        scale = self.target_width / width
+        matrix = np.float32([[scale, 0, -x * scale], [0, scale, -y * scale]])
+        with metrics.timer(RENDER_SECONDS, stage='ken_burns'):
+            return cv2.warpAffine(self.source, matrix, (self.target_width, self.target_height),
+                                  flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
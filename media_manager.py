@@ -5,11 +5,15 @@ import cv2
 import numpy as np
 # from utils import cv2_crop_center, read_image_from_url, cv_resize_to_target_size, cv2_rotate_image
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 # from enum import Enum
 import random
+import gc
 
 from image_container import ImageContainer
+from video_player import VideoContainer
+from animated_image import AnimatedContainer, is_animated_file
+from utils import VIDEO_TYPES, is_video_file
 
 #this class MediaManager is responsible for managing the media files
 #it will be responsible for loading the media files from the media directory
@@ -18,7 +22,7 @@ from image_container import ImageContainer
 
 class MediaManager:
 
-    ALLOWED_TYPES = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+    ALLOWED_TYPES = ('.png', '.jpg', '.jpeg', '.bmp', '.webp', '.gif') + VIDEO_TYPES
 
     @property
     def orientation_filter(self) -> ImageContainer.Orientation:
@@ -44,6 +48,28 @@ class MediaManager:
         
         self.media_files_changed_callback = None
         
+        #other MediaManagers sharing this catalog with their own playlist, see create_view
+        self.views: List['MediaManager'] = []
+
+        #images from a RemotePlaylist, they are played after the library but are not part of it (gallery, delete)
+        self.remote_media: List[ImageContainer] = []
+        
+
+    def create_view(self) -> 'MediaManager':
+        '''
+        Create a MediaManager that shares this catalog (and so its loaded images) but keeps its own playlist,
+        position and orientation filter, e.g. for a second display
+        '''
+        view = MediaManager(self.media_dir, self.thumbnail_dir, self.thumbnail_width, self.thumbnail_height)
+        view.all_media_files = self.all_media_files
+        view.remote_media = self.remote_media
+        view.playlist = view.all_media_files
+        self.views.append(view)
+        return view
+
+    def refresh_views(self) -> None:
+        for view in self.views:
+            view.filter_media_by_orientation(view.orientation_filter)
 
     def to_list(self):
         return [media.filename for media in self.all_media_files]
@@ -68,23 +94,37 @@ class MediaManager:
         return self.all_media_files
 
     def add_media_file(self, file_path) -> None:
-        img = ImageContainer()
+        self.add_media(self.create_media(file_path))
+
+    def create_media(self, file_path) -> ImageContainer:
+        # reads the file without touching the library, so it can run on another thread than the one using the playlist
+        if is_video_file(file_path):
+            img = VideoContainer()
+        elif is_animated_file(file_path):
+            img = AnimatedContainer()
+        else:
+            img = ImageContainer()
         img.from_file(file_path, self.thumbnail_dir, self.thumbnail_width, self.thumbnail_height, read_image=True)
-        self.all_media_files.append(img)
+        return img
+
+    def add_media(self, media) -> None:
+        self.all_media_files.append(media)
+        self.refresh_views()
         if self.media_files_changed_callback is not None:
             self.media_files_changed_callback()
 
     def remove_media_file(self, file_path) -> None:
-        for media in self.all_media_files:
-            if media.file_path == file_path:
-                self.all_media_files.remove(media)
-                break
+        self.remove_media_files([file_path])
 
-        for media in self.playlist:
-            if media.file_path == file_path:
-                self.playlist.remove(media)
-                break
-    
+    def remove_media_files(self, file_paths) -> None:
+        # remove several files in one pass, the views are refreshed and the change reported once
+        file_paths = set(file_paths)
+        #filtered in place, the views share the catalog list
+        self.all_media_files[:] = [media for media in self.all_media_files if media.file_path not in file_paths]
+        if self.playlist is not self.all_media_files:
+            self.playlist[:] = [media for media in self.playlist if media.file_path not in file_paths]
+
+        self.refresh_views()
         if self.media_files_changed_callback is not None:
             self.media_files_changed_callback()
 
@@ -118,6 +158,19 @@ class MediaManager:
             index = i % len(self.playlist)
             self.playlist[index].check_processing_parameters()
 
+    def release_memory(self) -> None:
+        #drop every decoded and processed frame, they are rebuilt on demand
+        for media in self.all_media_files:
+            media.release_memory()
+        gc.collect()
+
+    def get_upcoming_media(self, count) -> List[ImageContainer]:
+        #the current media followed by the next count media in the playlist
+        if len(self.playlist) == 0:
+            return []
+        indices = [(self.current_index + i) % len(self.playlist) for i in range(count + 1)]
+        return [self.playlist[index] for index in dict.fromkeys(indices)]
+
     def get_current_media(self) -> ImageContainer:
         return self.current_media
 
@@ -158,8 +211,39 @@ class MediaManager:
             return self.all_media_files
         return [media for media in self.all_media_files if media.orientation == orientation]
 
+    @staticmethod
+    def page_key(media: ImageContainer) -> tuple:
+        return (media.uploaded, media.filename)
+
+    def get_page(self, orientation='both', newest_first=True, after=None, limit=50) -> Tuple[List[ImageContainer], Optional[tuple]]:
+        '''
+        One page of the library sorted by upload time, after is the page_key of the last media of the previous page
+        returns the media and the key to continue from, None when there are no more
+        '''
+        ordered = sorted(self.get_media_by_orientation(orientation), key=self.page_key, reverse=newest_first)
+        if after is not None:
+            if newest_first:
+                ordered = [media for media in ordered if self.page_key(media) < after]
+            else:
+                ordered = [media for media in ordered if self.page_key(media) > after]
+        page = ordered[:limit]
+        next_key = self.page_key(page[-1]) if len(ordered) > limit else None
+        return page, next_key
+
     def filter_media_by_orientation(self, orientation) -> None:
+        self._orientation_filter = orientation
         self.playlist = self.get_media_by_orientation(orientation)
+        if self.remote_media:
+            #remote images whose size isn't known until they are downloaded are kept in, the prefetcher gets to them
+            self.playlist = self.playlist + [media for media in self.remote_media
+                                             if orientation == 'both' or media.orientation == orientation
+                                             or media.orientation == ImageContainer.Orientation.UNSET]
+
+    def set_remote_media(self, media_files: List[ImageContainer]) -> None:
+        # replace the remote images, in place as the views share the list
+        self.remote_media[:] = media_files
+        self.filter_media_by_orientation(self.orientation_filter)
+        self.refresh_views()
 
     def get_media_by_index(self, index) -> Optional[ImageContainer]:
         if index < 0 or index >= len(self.playlist):
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+#this module is responsible for collecting lightweight counters and timing histograms
+#the metrics are kept in a single process wide registry so any module can record into it
+#they can be rendered in the prometheus text format or as a plain dict for MQTT
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def escape_label_value(value) -> str:
+    # the text format needs backslashes, double quotes and newlines in label values escaped
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, labels=()) -> None:
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def render(self) -> list:
+        return [f'{self.name}{format_labels(self.labels)} {self.value}']
+
+
+class Gauge(Counter):
+    # a value that goes up and down, e.g. the requests in flight
+
+    def dec(self, amount=1) -> None:
+        self.inc(-amount)
+
+    def set(self, value) -> None:
+        with self.lock:
+            self.value = value
+
+
+class Histogram:
+    def __init__(self, name, labels=(), buckets=DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        #one slot per bucket plus one for +Inf, cumulated when rendering
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def render(self) -> list:
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            labels = self.labels + (('le', bound),)
+            lines.append(f'{self.name}_bucket{format_labels(labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(self.labels)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+
+    PREFIX = 'digital_canvas_'
+
+    def __init__(self) -> None:
+        self.metrics = {}
+        self.help = {}
+        self.types = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        full_name = self.PREFIX + name
+        labels = tuple(sorted(labels.items()))
+        key = (full_name, labels)
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = cls(full_name, labels, **kwargs)
+                    self.metrics[key] = metric
+                    self.help.setdefault(full_name, help_text)
+                    self.types.setdefault(full_name, {Counter: 'counter', Gauge: 'gauge'}.get(cls, 'histogram'))
+        return metric
+
+    def counter(self, name, help_text='', **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def inc(self, name, amount=1, **labels) -> None:
+        self.counter(name, **labels).inc(amount)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def render_prometheus(self) -> str:
+        with self.lock:
+            metrics = sorted(self.metrics.items(), key=lambda item: item[0])
+        lines = []
+        previous_name = None
+        for (name, _), metric in metrics:
+            if name != previous_name:
+                if self.help.get(name):
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {self.types[name]}')
+                previous_name = name
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        '''
+        A compact dict of the metrics, counters and gauges as values and histograms as count and mean
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            name = metric.name[len(self.PREFIX):] + ''.join(f'.{value}' for _, value in metric.labels)
+            if isinstance(metric, Counter):
+                snapshot[name] = metric.value
+            else:
+                snapshot[name] = {'count': metric.count, 'mean': round(metric.mean, 6)}
+        return snapshot
+
+
+metrics = MetricsRegistry()
+
+#the render pipeline stages share one histogram family, labelled by stage
+RENDER_SECONDS = 'render_seconds'
+metrics.histogram(RENDER_SECONDS, 'Time spent in each stage of the render pipeline', stage='decode')
+metrics.counter('images_processed_total', 'Number of images processed for the screen')
+metrics.counter('processed_cache_hits_total', 'Number of times an already processed image was reused')
+metrics.counter('transitions_total', 'Number of transitions started')
+metrics.counter('media_skipped_total', 'Number of playlist items skipped because they could not be shown, e.g. remote images not downloaded yet')
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from monitor_controller import MonitorController
+
+#this class MonitorState is responsible for keeping the last known power, brightness and contrast of the monitor
+#reading them is a DDC/CI round trip over I2C that can take hundreds of milliseconds, so pages read the cached values
+#a background thread reads each value again once it is older than its TTL, so a page never waits for the bus,
+#writes update the cache straight away but only when the monitor took them
+#every access to the bus goes through one lock so page loads, refreshes and the brightness loop don't interleave on it,
+#the cache is updated before that lock is released so a refresh can never overwrite a newer write with what it read before
+
+
+class MonitorState:
+
+    TTLS = {'power': 10, 'brightness': 30, 'contrast': 300}            #seconds before a value is read again
+    DEFAULTS = {'power': 'on', 'brightness': -1, 'contrast': None}      #what MonitorController returns without a monitor
+
+    def __init__(self, monitor_controller: MonitorController, ttls: dict = None) -> None:
+        self.monitor_controller = monitor_controller
+        self.ttls = {**MonitorState.TTLS, **(ttls or {})}
+        self.values = dict(MonitorState.DEFAULTS)
+        self.due = {key: 0 for key in self.values}          #when each value is read again, 0 for straight away
+        self.lock = threading.Lock()
+        self.bus_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self._thread = None
+        self.readers = {
+            'power': monitor_controller.get_power_mode,
+            'brightness': monitor_controller.get_luminance,
+            'contrast': monitor_controller.get_contrast,
+        }
+
+    def start(self) -> None:
+        # everything is read once straight away so the first page load soon has real values
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name='monitor-state', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _refresh_loop(self) -> None:
+        while not self.stopped.is_set():
+            for key in self.values:
+                with self.lock:
+                    expired = time.time() >= self.due[key]
+                if expired:
+                    self.refresh(key)
+            with self.lock:
+                wait = min(self.due.values()) - time.time()
+            self.stopped.wait(max(wait, 0.05))
+
+    def get(self, key):
+        with self.lock:
+            return self.values[key]
+
+    def set(self, key, value) -> None:
+        with self.lock:
+            self.values[key] = value
+            self.due[key] = time.time() + self.ttls[key]
+
+    def refresh(self, key) -> None:
+        try:
+            with self.bus_lock:
+                self.set(key, self.readers[key]())
+        except Exception as e:
+            print(f"Failed to read the monitor {key}: {e}")
+            with self.lock:
+                #tried again after the TTL, not in a tight loop
+                self.due[key] = time.time() + self.ttls[key]
+
+    def get_power_mode(self):
+        return self.get('power')
+
+    def get_luminance(self):
+        return self.get('brightness')
+
+    def get_contrast(self):
+        return self.get('contrast')
+
+    def set_power_mode(self, mode):
+        with self.bus_lock:
+            result = self.monitor_controller.set_power_mode(mode)
+            if result:
+                self.set('power', 'on' if mode == 'on' else 'off')
+        return result
+
+    def set_luminance(self, value):
+        with self.bus_lock:
+            result = self.monitor_controller.set_luminance(value)
+            if result:
+                self.set('brightness', value)
+        return result
+
+    def set_contrast(self, value):
+        with self.bus_lock:
+            result = self.monitor_controller.set_contrast(value)
+            if result:
+                self.set('contrast', value)
+        return result
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import namedtuple
+
+from metrics import metrics
+
+#this class PlexWebhookQueue is responsible for handling the Plex webhooks off the request thread
+#the route only parses the payload and submits it, so Plex gets its 200 straight away even when its server is slow or offline
+#a worker waits for a burst of events of a player session (play, pause, resume within a fraction of a second) to settle
+#and only handles the latest one; an event still being handled when a newer one of its session arrives is stale,
+#the handler checks is_current() before showing its result so an old poster never replaces a newer state
+
+PlexEvent = namedtuple('PlexEvent', ['session', 'event', 'payload', 'address', 'sequence'])
+
+PLAY_EVENTS = ('media.play', 'media.resume')
+STOP_EVENTS = ('media.pause', 'media.stop')
+
+
+def session_key(payload) -> str:
+    # one player plays one thing at a time, its uuid identifies the session
+    player = payload.get('Player')
+    if not isinstance(player, dict):
+        return 'default'
+    return str(player.get('uuid') or player.get('publicAddress') or 'default')
+
+
+class PlexWebhookQueue:
+    def __init__(self, handle, coalesce_delay=0.3, max_delay=2.0) -> None:
+        '''
+        handle is called on the worker thread with a PlexEvent and an is_current function, it returns False when it dropped
+        the event as stale, exceptions are logged
+        an event is handled once its session had no newer event for coalesce_delay seconds, or after max_delay at most
+        '''
+        self.handle = handle
+        self.coalesce_delay = coalesce_delay
+        self.max_delay = max_delay
+        self.pending = {}                   #session -> (latest PlexEvent, time of the first event of the burst, time of the latest)
+        self.sequences = {}                 #session -> sequence number of its latest event
+        self.condition = threading.Condition()
+        self._thread = None
+
+    def start(self) -> None:
+        with self.condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._work, name='plex-webhooks', daemon=True)
+        self._thread.start()
+
+    def submit(self, payload, address) -> bool:
+        '''
+        Queue an event for handling, returns False for the events that are not handled (e.g. media.scrobble)
+        '''
+        event = payload.get('event')
+        if event not in PLAY_EVENTS and event not in STOP_EVENTS:
+            metrics.inc('plex_events_total', event=str(event), result='ignored')
+            return False
+
+        session = session_key(payload)
+        now = time.monotonic()
+        with self.condition:
+            sequence = self.sequences.get(session, 0) + 1
+            self.sequences[session] = sequence
+            previous = self.pending.get(session)
+            if previous is not None:
+                metrics.inc('plex_events_total', event=previous[0].event, result='coalesced')
+            first = previous[1] if previous is not None else now
+            self.pending[session] = (PlexEvent(session, event, payload, address, sequence), first, now)
+            self.condition.notify()
+        self.start()
+        return True
+
+    def is_current(self, event: PlexEvent) -> bool:
+        with self.condition:
+            return self.sequences.get(event.session) == event.sequence
+
+    def _due(self, now):
+        # the pending events whose burst has settled, and how long until the next one is due
+        due = []
+        wait = None
+        for session, (event, first, latest) in list(self.pending.items()):
+            ready_at = min(latest + self.coalesce_delay, first + self.max_delay)
+            if ready_at <= now:
+                due.append(event)
+                del self.pending[session]
+            else:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        return due, wait
+
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    due, wait = self._due(time.monotonic())
+                    if due:
+                        break
+                    self.condition.wait(wait)
+            for event in due:
+                try:
+                    handled = self.handle(event, lambda event=event: self.is_current(event))
+                    metrics.inc('plex_events_total', event=event.event, result='stale' if handled is False else 'handled')
+                except Exception as e:
+                    print(f"Failed to handle the Plex event {event.event}: {e}")
+                    metrics.inc('plex_events_total', event=event.event, result='failed')
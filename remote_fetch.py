@@ -0,0 +1,143 @@
+import itertools
+import mimetypes
+import os
+import tempfile
+import time
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ingest import staging_suffix
+from metrics import metrics
+
+#this class RemoteDownloader is responsible for downloading images and videos added by URL into the staging folder
+#the response is streamed to a .part file, never held in memory, and given up on when it is larger than max_bytes
+#or takes longer than max_seconds in total; the status, type and length headers are checked before the body is read,
+#so a web page or a huge file is refused without downloading it
+#downloads share one pooled HTTP session, the ingest queue runs several of them at once
+
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/bmp': '.bmp',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+}
+GENERIC_TYPES = ('application/octet-stream', 'binary/octet-stream', '')
+
+#the first bytes of the formats above, for servers that send a generic content type
+SIGNATURES = ((b'\xff\xd8\xff', '.jpg'), (b'\x89PNG', '.png'), (b'GIF8', '.gif'), (b'BM', '.bmp'), (b'\x1aE\xdf\xa3', '.webm'))
+
+
+def sniff_extension(data) -> str:
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    if data[4:8] == b'ftyp':
+        return '.mov' if data[8:10] == b'qt' else '.mp4'
+    return None
+
+
+def parse_urls(values) -> list:
+    '''
+    The http(s) URLs from form values, each value may hold several separated by whitespace, raises ValueError for anything else
+    '''
+    urls = []
+    for value in values:
+        for url in (value or '').split():
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+                raise ValueError(f'Not an http(s) URL: {url}')
+            urls.append(url)
+    return list(dict.fromkeys(urls))
+
+
+class RemoteDownloader:
+
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 15
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, folder, max_bytes=50 * 1024 * 1024, max_seconds=60, pool_size=4) -> None:
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def name_for(url, extension) -> str:
+        # the name in the URL, with the extension of what was actually sent
+        name = os.path.basename(unquote(urlparse(url).path)) or 'remote'
+        stem, current = os.path.splitext(name)
+        if current.lower() in ('.jpeg', '.jpg') and extension == '.jpg':
+            return name
+        return (stem or 'remote') + extension
+
+    def check_headers(self, response: requests.Response):
+        '''
+        The extension for the response from its headers, None when it has to be read from the first bytes
+        raises ValueError when it is not an image or video, or too large
+        '''
+        length = response.headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise ValueError(f'{length} bytes is more than the limit of {self.max_bytes}')
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type in CONTENT_TYPES:
+            return CONTENT_TYPES[content_type]
+        if content_type.startswith(('image/', 'video/')):
+            return mimetypes.guess_extension(content_type) or None
+        if content_type in GENERIC_TYPES:
+            return None
+        raise ValueError(f'{content_type} is not an image or video')
+
+    def download(self, url):
+        '''
+        Stream url into the folder, returns the path of the file and the name to ingest it by
+        raises requests.RequestException, ValueError (not an image, too large) or TimeoutError
+        '''
+        deadline = time.monotonic() + self.max_seconds
+        with self.session.get(url, stream=True, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            extension = self.check_headers(response)
+
+            chunks = response.iter_content(self.CHUNK_SIZE)
+            first = next(chunks, b'')
+            if not first:
+                raise ValueError('The response is empty')
+            if extension is None:
+                extension = sniff_extension(first)
+                if extension is None:
+                    raise ValueError('The response is not an image or video')
+
+            #a unique .part file, renamed once complete so a restart never ingests half a download
+            name = self.name_for(url, extension)
+            descriptor, temporary = tempfile.mkstemp(suffix=staging_suffix(name), dir=self.folder)
+            size = 0
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    for block in itertools.chain((first,), chunks):
+                        size += len(block)
+                        if size > self.max_bytes:
+                            raise ValueError(f'The download is larger than {self.max_bytes} bytes')
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f'The download took longer than {self.max_seconds} seconds')
+                        file.write(block)
+                path = temporary[:-len('.part')]
+                os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+        metrics.inc('remote_download_bytes_total', size)
+        return path, name
@@ -0,0 +1,235 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional
+from urllib.parse import urljoin
+
+from image_container import ImageContainer
+from metrics import metrics
+from remote_fetch import RemoteDownloader
+from utils import check_and_create, read_image_properties
+
+#this class RemotePlaylist is responsible for playing images listed in a JSON index on a web server, e.g. a NAS
+#the index is read again every refresh_interval seconds, its images are added to the playlist of the MediaManager
+#a background thread downloads the next prefetch_count remote images of the playlist into a RemoteMediaCache,
+#so the viewer only ever reads local files and a remote image that isn't there yet is skipped, not waited for;
+#nothing is downloaded while the display is idle
+#the index is a list of URLs, relative ones are resolved against the index URL, or of {"url": ..., "width": ..., "height": ...}
+#objects, the size lets the orientation filter apply before the image is downloaded; {"images": [...]} works too
+
+
+class RemoteMediaCache:
+    '''
+    Remote images on disk, named by a hash of their URL, the least recently used ones are removed over max_bytes
+    '''
+
+    def __init__(self, folder, downloader: RemoteDownloader, max_bytes=512 * 1024 * 1024) -> None:
+        self.folder = folder
+        self.downloader = downloader
+        self.max_bytes = max_bytes
+        self.files = OrderedDict()          #url hash -> (file name, size), least recently used first
+        self.size = 0
+        self.pending = {}                   #url -> Future of a download in progress
+        self.lock = threading.Lock()
+
+        check_and_create(folder)
+        entries = []
+        for entry in os.scandir(folder):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.part'):
+                os.remove(entry.path)
+                continue
+            entries.append(entry)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_atime):
+            self.files[os.path.splitext(entry.name)[0]] = (entry.name, entry.stat().st_size)
+            self.size += entry.stat().st_size
+        self.evict()
+
+    @staticmethod
+    def url_hash(url) -> str:
+        return hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
+
+    def path_for(self, url) -> Optional[str]:
+        key = self.url_hash(url)
+        with self.lock:
+            item = self.files.get(key)
+            if item is None:
+                return None
+            self.files.move_to_end(key)
+        return os.path.join(self.folder, item[0])
+
+    def fetch(self, url) -> str:
+        '''
+        Return the path of the downloaded copy of url, downloading it first if needed
+        raises the errors of RemoteDownloader.download
+        '''
+        path = self.path_for(url)
+        if path is not None:
+            return path
+        with self.lock:
+            future = self.pending.get(url)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.pending[url] = future
+        if not leader:
+            return future.result()
+
+        try:
+            downloaded, name = self.downloader.download(url)
+            key = self.url_hash(url)
+            file_name = key + os.path.splitext(name)[1]
+            path = os.path.join(self.folder, file_name)
+            os.replace(downloaded, path)
+            size = os.path.getsize(path)
+            with self.lock:
+                self.files[key] = (file_name, size)
+                self.size += size
+            self.evict()
+            metrics.inc('remote_cache_downloads_total')
+            future.set_result(path)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(url, None)
+        return path
+
+    def evict(self) -> None:
+        with self.lock:
+            removed = []
+            while self.size > self.max_bytes and len(self.files) > 1:
+                _, (name, size) = self.files.popitem(last=False)
+                self.size -= size
+                removed.append(name)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError as e:
+                print(f"Failed to remove {name} from the remote cache: {e}")
+
+
+def parse_index(index, index_url) -> List[tuple]:
+    '''
+    The (url, size) entries of a playlist index, size is (width, height) or None, raises ValueError for anything else
+    '''
+    if isinstance(index, dict):
+        index = index.get('images')
+    if not isinstance(index, list):
+        raise ValueError('The playlist index must be a list of URLs')
+    entries = []
+    for item in index:
+        if isinstance(item, str):
+            url, size = item, None
+        elif isinstance(item, dict) and isinstance(item.get('url'), str):
+            url = item['url']
+            width, height = item.get('width'), item.get('height')
+            size = (width, height) if isinstance(width, int) and isinstance(height, int) and width > 0 and height > 0 else None
+        else:
+            raise ValueError(f'Unexpected playlist entry {item!r}')
+        entries.append((urljoin(index_url, url), size))
+    return list(OrderedDict((url, (url, size)) for url, size in entries).values())
+
+
+class RemotePlaylist:
+
+    INDEX_TIMEOUT = (5, 15)
+    PREFETCH_INTERVAL = 5           #seconds between checks of the upcoming images when nothing wakes the thread
+
+    def __init__(self, index_url, cache: RemoteMediaCache, prefetch_count=3, refresh_interval=600) -> None:
+        self.index_url = index_url
+        self.cache = cache
+        self.prefetch_count = prefetch_count
+        self.refresh_interval = refresh_interval
+        self.media = {}                     #url -> ImageContainer, kept across refreshes so processed frames survive
+        self.media_manager = None
+        self.is_idle = lambda: False
+        self.post = lambda func, *args: func(*args)     #runs changes to the playlists on the thread that owns them
+        self.wake_event = threading.Event()
+        self._thread = None
+
+    def start(self, media_manager, is_idle=None, post=None) -> None:
+        '''
+        Play the remote images in media_manager (and its views), is_idle returns True while the display is off
+        post(func, *args) runs func where the playlists may be changed, the viewer's Tk loop
+        '''
+        self.media_manager = media_manager
+        if is_idle is not None:
+            self.is_idle = is_idle
+        if post is not None:
+            self.post = post
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='remote-playlist', daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        # the image on screen changed, look at the upcoming ones again
+        self.wake_event.set()
+
+    def refresh(self) -> None:
+        response = self.cache.downloader.session.get(self.index_url, timeout=self.INDEX_TIMEOUT)
+        response.raise_for_status()
+        entries = parse_index(response.json(), self.index_url)
+
+        media_files = []
+        for url, size in entries:
+            media = self.media.get(url)
+            if media is None:
+                media = ImageContainer().from_url(url, cache=self.cache, size=size)
+            media_files.append(media)
+        self.media = {media.file_path: media for media in media_files}
+        self.post(self.media_manager.set_remote_media, media_files)
+        print(f"Remote playlist {self.index_url} has {len(media_files)} images")
+
+    def upcoming(self) -> List[ImageContainer]:
+        # the remote images next in the playlists of every display, nearest first
+        upcoming = {}
+        for media_manager in [self.media_manager] + self.media_manager.views:
+            for media in media_manager.get_upcoming_media(self.prefetch_count):
+                if media.url_cache is self.cache:
+                    upcoming.setdefault(media.file_path, media)
+        return list(upcoming.values())
+
+    def prefetch(self) -> None:
+        sizes = []
+        for media in self.upcoming():
+            if self.is_idle():
+                break
+            if self.cache.path_for(media.file_path) is not None:
+                continue
+            try:
+                path = self.cache.fetch(media.file_path)
+                if media.orientation == ImageContainer.Orientation.UNSET:
+                    #read here, the media is only changed where the playlists are
+                    sizes.append((media, read_image_properties(path)['size']))
+            except Exception as e:
+                print(f"Failed to prefetch {media.file_path}: {e}")
+                metrics.inc('remote_cache_failures_total')
+        if sizes:
+            self.post(self.apply_sizes, sizes)
+
+    def apply_sizes(self, sizes) -> None:
+        # runs where the playlists are changed, the orientation filter can apply to these images now
+        for media, size in sizes:
+            media.set_size(*size)
+        self.media_manager.set_remote_media(list(self.media.values()))
+
+    def _run(self) -> None:
+        next_refresh = 0
+        while True:
+            if not self.is_idle():
+                if time.monotonic() >= next_refresh:
+                    try:
+                        self.refresh()
+                        next_refresh = time.monotonic() + self.refresh_interval
+                    except Exception as e:
+                        print(f"Failed to read the remote playlist {self.index_url}: {e}")
+                        next_refresh = time.monotonic() + min(self.refresh_interval, 60)
+                self.prefetch()
+            self.wake_event.wait(self.PREFETCH_INTERVAL)
+            self.wake_event.clear()
@@ -0,0 +1,157 @@
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from werkzeug.exceptions import HTTPException
+
+from metrics import metrics
+
+#this class RequestMetrics is responsible for timing every request to the web interface
+#it wraps the WSGI app and records per route (the URL rule, not the path) latency and response size histograms,
+#a count of requests per status and the requests in flight, all in the shared metrics registry
+#a sampler thread logs the stack of any request still running after slow_threshold seconds, so a slow /upload,
+#/plex_hook or / shows where it was waiting; the latest samples are kept for the metrics route
+
+REQUEST_SECONDS = 'http_request_seconds'
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RESPONSE_BYTES = 'http_response_bytes'
+RESPONSE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+UNMATCHED = 'unmatched'
+
+
+class RequestRecord:
+    def __init__(self, route, method, path) -> None:
+        self.route = route
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()      #None once the view has returned, the body may be sent from other threads
+        self.sampled = False
+
+
+class MeteredBody:
+    '''
+    Wraps the response body to count its bytes and finish the record when the server closes it
+    '''
+
+    def __init__(self, body, finish) -> None:
+        self.body = body
+        self.finish = finish
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.finish(self.size)
+
+
+class RequestMetrics:
+    def __init__(self, wsgi_app, url_map, slow_threshold=1.0, streaming_routes=(), max_samples=20) -> None:
+        '''
+        streaming_routes are long lived (MJPEG, server-sent events), they are counted but left out of the latency histograms
+        '''
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.slow_threshold = slow_threshold
+        self.streaming_routes = set(streaming_routes)
+        self.slow_requests = deque(maxlen=max_samples)
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self._sampler = None
+
+    def route_for(self, environ) -> str:
+        try:
+            rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except HTTPException:
+            #404 and 405, kept in one label so random paths can't grow the metrics
+            return UNMATCHED
+
+    def __call__(self, environ, start_response):
+        record = RequestRecord(self.route_for(environ), environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', ''))
+        in_flight = metrics.gauge('http_requests_in_flight', 'Requests being handled', route=record.route)
+        in_flight.inc()
+        with self.lock:
+            self.in_flight.add(record)
+        self.start_sampler()
+
+        status = ['500']
+
+        def metered_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        def finish(size):
+            with self.lock:
+                self.in_flight.discard(record)
+            in_flight.dec()
+            elapsed = time.perf_counter() - record.started
+            metrics.inc('http_requests_total', route=record.route, method=record.method, status=status[0])
+            if record.route in self.streaming_routes:
+                return
+            metrics.histogram(REQUEST_SECONDS, 'Time to handle a request and send its response', buckets=REQUEST_BUCKETS,
+                              route=record.route).observe(elapsed)
+            metrics.histogram(RESPONSE_BYTES, 'Size of the response bodies', buckets=RESPONSE_BUCKETS,
+                              route=record.route).observe(size)
+            if self.slow_threshold and elapsed >= self.slow_threshold and not record.sampled:
+                #the view was quick but sending the body was not
+                self.add_sample(record, elapsed, None)
+
+        try:
+            body = self.wsgi_app(environ, metered_start_response)
+        except Exception:
+            record.thread_id = None
+            finish(0)
+            raise
+        record.thread_id = None
+        return MeteredBody(body, finish)
+
+    def start_sampler(self) -> None:
+        if not self.slow_threshold or self._sampler is not None:
+            return
+        with self.lock:
+            if self._sampler is not None:
+                return
+            self._sampler = threading.Thread(target=self._sample_slow_requests, name='request-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample_slow_requests(self) -> None:
+        interval = max(self.slow_threshold / 4, 0.05)
+        while True:
+            time.sleep(interval)
+            now = time.perf_counter()
+            with self.lock:
+                slow = [record for record in self.in_flight
+                        if not record.sampled and record.thread_id is not None and record.route not in self.streaming_routes
+                        and now - record.started >= self.slow_threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for record in slow:
+                frame = frames.get(record.thread_id)
+                if frame is None or record.thread_id is None:
+                    continue
+                record.sampled = True
+                self.add_sample(record, now - record.started, ''.join(traceback.format_stack(frame)))
+
+    def add_sample(self, record: RequestRecord, elapsed, stack) -> None:
+        print(f"Slow request {record.method} {record.path} ({record.route}) after {elapsed:.2f}s"
+              + (f", stack:\n{stack}" if stack else ", while sending the response"))
+        metrics.inc('http_slow_requests_total', route=record.route)
+        self.slow_requests.append({
+            'route': record.route,
+            'method': record.method,
+            'path': record.path,
+            'seconds': round(elapsed, 3),
+            'time': time.time(),
+            'stack': stack,
+        })
@@ -1,11 +1,12 @@
 import base64
 import datetime
 import os
+import tempfile
 import threading
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
 
-import cv2
-import numpy as np
 from flask import (
     Flask,
     json,
@@ -14,16 +15,33 @@ from flask import (
     redirect,
     render_template,
     request,
+    Request,
+    Response,
     send_from_directory,
     url_for
 )
 
+from animated_image import AnimatedContainer, is_animated
+from artwork import ArtworkFetcher
+from asgi_app import AsgiAdapter, canvas_stream_route, event_stream_route, serve
+from canvas_cache import EncodedCanvasCache
+from canvas_stream import CanvasStreamer
 from config_manager import ConfigManager
+from derivatives import DerivativeCache, parse_variant
+from gallery import decode_cursor, encode_cursor, parse_fields, parse_limit
+from ingest import IngestItem, IngestQueue, PARTIAL_SUFFIX, staged_name, staging_suffix
+from metrics import metrics
 from monitor_controller import MonitorController
+from monitor_state import MonitorState
+from plex_webhook import PlexEvent, PLAY_EVENTS, PlexWebhookQueue
+from remote_fetch import parse_urls, RemoteDownloader
+from request_metrics import RequestMetrics
 from sensors import SensorReader
 from slideshow_manager import SlideshowManager
+from static_cache import BytesCache, ImmutableFileServer
 from utils import (
     accel_to_rotation,
+    check_and_create,
     check_for_duplicate_files,
     create_thumbnail,
     create_thumbnails_for_existing_images,
@@ -32,12 +50,14 @@ from utils import (
     get_thumbnail,
     get_title,
     is_raspberry_pi,
+    is_video_file,
     lerp,
+    list_files,
     max_usful_size,
-    read_image_from_url,
     replace_webp_extension,
-    save_remote_image,
+    seconds_until,
     strtobool,
+    thumbnail_filename,
     generate_unique_filename,
     convert_files_to_unique_filenames
 )
@@ -61,6 +81,7 @@ class API:
     favicon = f'/favicon.ico'
     display_now = f'/display_now'
     upload = f'/upload'
+    upload_status = f'/upload/status/<job_id>'
     uploads = f'/uploads/<filename>'
     thumbnails = f'/thumbnails/<filename>'
     update_device_name = f'/update_device_name'
@@ -68,7 +89,11 @@ class API:
     delete = f'/delete'
     select = f'/select'
     current_image_name = f'/current_image_name'
+    gallery = f'/gallery'
+    gallery_batch = f'/gallery/batch'
     canvas = f'/canvas'   #we can also use current_image_name and the /uploads/<filename> endpoint to get the image
+    canvas_stream = f'/canvas/stream'
+    events = f'/events'
     
     configure = f'/configure'
     configure_mqtt = f'/configure/mqtt'
@@ -85,28 +110,108 @@ class API:
     plex_hook = f'/plex_hook'
     
     power_control = f'/power_control'
+    
+    metrics = f'/metrics'
+    metrics_slow = f'/metrics/slow'
+
+
+class StagingRequest(Request):
+    """
+    Request that writes uploaded files straight into the staging folder while the form is parsed,
+    instead of spooling them to a temporary file first and copying them afterwards
+    the files are .part files until the form has been parsed, so an aborted upload is never ingested
+    and the ones still .part when the request is closed are removed straight away
+    """
+    staging_folder = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.staged_paths = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.staging_folder is None or self.path != API.upload:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = tempfile.NamedTemporaryFile('w+b', dir=self.staging_folder, suffix=staging_suffix(filename), delete=False)
+        self.staged_paths.append(stream.name)
+        return stream
+
+    def close(self) -> None:
+        super().close()
+        # the upload route renames the complete files, what's left was cut short or never reached the route
+        for path in self.staged_paths:
+            if os.path.exists(path):
+                os.remove(path)
 
 
 class CombinedApp:
+
+    #the hardware classes, replaced by stubs in tests/stub_app.py
+    monitor_controller_class = MonitorController
+    sensor_reader_class = SensorReader
+
+    #how long a worker waits for the Tk loop to apply a change to the library
+    library_update_timeout = 10
+
     def __init__(self, config_manager: dict):
         self.config_manager: ConfigManager = config_manager
         
         self.app = Flask(__name__)
         self.app.config['UPLOAD_FOLDER'] = 'images'
         self.app.config['THUMBNAIL_FOLDER'] = 'thumbnails'
+        self.app.config['INCOMING_FOLDER'] = 'incoming'         #uploads waiting for the ingest queue
+        self.app.config['DERIVATIVE_FOLDER'] = 'derivatives'    #resized copies of uploads served with ?w=&h=
+        self.app.config['ARTWORK_FOLDER'] = 'artwork'           #posters downloaded from Plex
+        check_and_create(self.app.config['INCOMING_FOLDER'])
+        StagingRequest.staging_folder = self.app.config['INCOMING_FOLDER']
+        self.app.request_class = StagingRequest
 
         convert_files_to_unique_filenames(self.app.config['UPLOAD_FOLDER'])
         create_thumbnails_for_existing_images(self.app.config['UPLOAD_FOLDER'], self.app.config['THUMBNAIL_FOLDER'])
+
+        thumbnail_cache_size = self.config_manager.config['thumbnail_cache_size'] * 1024 * 1024
+        self.upload_server = ImmutableFileServer(self.app.config['UPLOAD_FOLDER'])
+        self.thumbnail_server = ImmutableFileServer(self.app.config['THUMBNAIL_FOLDER'],
+                                                    BytesCache(thumbnail_cache_size) if thumbnail_cache_size else None)
+        self.derivative_cache = DerivativeCache(self.app.config['UPLOAD_FOLDER'], self.app.config['DERIVATIVE_FOLDER'],
+                                                max_bytes=self.config_manager.config['derivative_cache_size'] * 1024 * 1024)
+        self.derivative_server = ImmutableFileServer(self.app.config['DERIVATIVE_FOLDER'])
+        self.artwork_fetcher = ArtworkFetcher(self.app.config['ARTWORK_FOLDER'],
+                                              max_disk_bytes=self.config_manager.config['plex_artwork_cache_size'] * 1024 * 1024)
         self.setup_flask_routes()
+        self.request_metrics = RequestMetrics(self.app.wsgi_app, self.app.url_map,
+                                              slow_threshold=self.config_manager.config['slow_request_threshold'],
+                                              streaming_routes=(API.canvas_stream, API.events))
+        self.app.wsgi_app = self.request_metrics
 
         self.slideshow_manager = SlideshowManager(os.path.join(os.path.dirname(os.path.abspath(__file__)), self.app.config['UPLOAD_FOLDER']),
                                                   config_manager=self.config_manager)
         
-        self.monitor_controller = MonitorController()
-        self.sensor_reader = SensorReader()
+        self.canvas_cache = EncodedCanvasCache()
+        self.canvas_streamer = CanvasStreamer(self.get_canvas_frame,
+                                              max_fps=self.config_manager.config['stream_max_fps'],
+                                              quality=self.config_manager.config['stream_quality'])
+
+        self.ingest_lock = threading.Lock()
+        self.remote_downloader = RemoteDownloader(self.app.config['INCOMING_FOLDER'],
+                                                  max_bytes=self.config_manager.config['download_max_size'] * 1024 * 1024,
+                                                  max_seconds=self.config_manager.config['download_timeout'],
+                                                  pool_size=self.config_manager.config['download_workers'])
+        self.ingest_queue = IngestQueue(self.ingest_item,
+                                        workers=self.config_manager.config['ingest_workers'],
+                                        max_queued=self.config_manager.config['ingest_max_queued'],
+                                        fetch=self.fetch_remote_item,
+                                        fetch_workers=self.config_manager.config['download_workers'])
+        self.ingest_queue.job_finished_callback = lambda job: self.slideshow_manager.events.publish('ingest', job.to_dict())
+        self.requeue_incoming()
+
+        self.plex_webhooks = PlexWebhookQueue(self.handle_plex_event)
+
+        self.monitor_controller = self.monitor_controller_class()
+        self.monitor_state = MonitorState(self.monitor_controller)     #pages read the monitor from here, see MonitorState
+        self.monitor_state.start()
+        self.sensor_reader = self.sensor_reader_class()
 
         self.on_trigger = False
-        self.previous_slideshow_active_state = False
 
     def setup_flask_routes(self):
         
@@ -121,11 +226,9 @@ class CombinedApp:
             if self.slideshow_manager.viewer is None:
                 return render_template('loading.html')
 
-            files = self.slideshow_manager.viewer.media_manager.get_media_files(self.config_manager.config['media_orientation_filter'])
-
+            # the gallery itself is loaded a page at a time from the gallery route as it is scrolled
             # render the page
             params = {
-                'files': files,
                 'config_manager': self.config_manager,
                 'mqtt_broker': self.config_manager.config['mqtt_broker'],
                 'mqtt_port': self.config_manager.config['mqtt_port'],
@@ -138,13 +241,13 @@ class CombinedApp:
                 'selected_theme': self.config_manager.config['theme'],
                 'rotation': self.config_manager.config['rotation'],
                 'scale_mode': self.config_manager.config['scale_mode'],
-                'monitor_power_state': self.monitor_controller.get_power_mode(),
+                'monitor_power_state': self.monitor_state.get_power_mode(),
                 'plex_port': self.config_manager.config['plex_port'],
                 'allow_plex': self.config_manager.config['allow_plex'],
                 'pause_when_plex_playing': self.config_manager.config['pause_when_plex_playing'],
                 'auto_brightness': self.config_manager.config['auto_brightness'],
                 'auto_rotation': self.config_manager.config['auto_rotation'],
-                'current_brightness': self.monitor_controller.get_luminance(),
+                'current_brightness': self.monitor_state.get_luminance(),
                 'slideshow_running': self.slideshow_manager.viewer.slideshow_active,
                 'time_on': self.config_manager.config['time_on'],
                 'time_off': self.config_manager.config['time_off'],
@@ -157,70 +260,107 @@ class CombinedApp:
             '''
             This route is used to display an image immediately
             '''
-            base64_image = None
-            if 'file' in request.files and request.files['file'].filename != '':
-                file = request.files['file']
-                image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
-                base64_image = base64.b64encode(cv2.imencode('.jpg', image)[1]).decode()
-            elif 'image' in request.form:
-                base64_image = request.form['image']
-            else:
-                base64_image = request.data.decode('utf-8')
-            
-            #receive an image in base64 format
-            if base64_image is not None:
-                if self.slideshow_manager.viewer is None:
-                    return "Viewer is not initialized", 500
-                self.slideshow_manager.viewer.set_image_from_base64(base64_image)
-                return '', 204
-            else:
+            if self.slideshow_manager.viewer is None:
+                return "Viewer is not initialized", 500
+
+            # a file, an image/* or application/octet-stream body is passed on as it is and decoded once by the viewer,
+            # the image form field and other bodies are base64
+            try:
+                if 'file' in request.files and request.files['file'].filename != '':
+                    data = request.files['file'].read()
+                elif 'image' in request.form:
+                    data = base64.b64decode(request.form['image'])
+                elif request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+                    data = request.get_data()
+                else:
+                    data = base64.b64decode(request.get_data())
+            except ValueError:
+                return "Invalid base64 image data", 400
+
+            if not data:
                 return "No image data provided", 400
+            if not self.slideshow_manager.viewer.set_image_from_bytes(data):
+                return "Image data could not be decoded", 400
+            return '', 204
 
         @self.app.route(API.uploads, methods=['GET'])
         def uploaded_file(filename):
-            return send_from_directory(self.app.config['UPLOAD_FOLDER'], filename)
+            # ?w=&h=&fit=&fmt= asks for a resized copy instead of the original
+            try:
+                variant = parse_variant(request.args, filename)
+            except ValueError as e:
+                return str(e), 400
+            if variant is None:
+                return self.upload_server.send(filename)
+
+            try:
+                name = self.derivative_cache.get(filename, variant)
+            except FileNotFoundError:
+                return "File not found", 404
+            except ValueError as e:
+                return str(e), 415
+            return self.derivative_server.send(name)
 
         @self.app.route(API.upload, methods=['POST'])
         def upload_file():
-            if request.method == 'POST':
-                list_was_empty = len(self.slideshow_manager.viewer.media_manager.all_media_files) == 0
-                if 'file' in request.files and request.files['file'].filename != '':
-                    files = request.files.getlist('file')
-                    for file in files:
-                        filename = replace_webp_extension(file.filename)
-                        name, ext = os.path.splitext(filename)
-                        filename = generate_unique_filename(self.app.config['UPLOAD_FOLDER'], ext)
-                        file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
-                        max_usful_size(file_path, max_size=max(self.slideshow_manager.viewer.screen_width, self.slideshow_manager.viewer.screen_height))
-                        thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], filename)
-                        create_thumbnail(file_path, thumbnail_path)
-                        self.slideshow_manager.viewer.media_manager.add_media_file(os.path.join(self.app.config['UPLOAD_FOLDER'], filename))
-
-                elif 'image_url' in request.form and request.form['image_url'] != '':
-                    image_url = request.form['image_url']
-                    filename = save_remote_image(image_url, self.app.config['UPLOAD_FOLDER'])         #duplicate files are checked for in this function
-                    filename = replace_webp_extension(filename)
-                    name, ext = os.path.splitext(filename)
-                    filename = generate_unique_filename(self.app.config['UPLOAD_FOLDER'], ext)
-                    if filename:
-                        file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
-                        max_usful_size(file_path, max_size=max(self.slideshow_manager.viewer.screen_width, self.slideshow_manager.viewer.screen_height))
-                        thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], filename)
-                        create_thumbnail(file_path, thumbnail_path)
-                        self.slideshow_manager.viewer.media_manager.add_media_file(os.path.join(self.app.config['UPLOAD_FOLDER'], filename))
-
-                self.slideshow_manager.viewer.media_manager.filter_media_by_orientation(self.config_manager.config['media_orientation_filter'])
-
-                # if the list was empty, select the first image we've just uploaded
-                if list_was_empty and len(self.slideshow_manager.viewer.media_manager.all_media_files) > 0:
-                    self.slideshow_manager.viewer.select_image(self.slideshow_manager.viewer.media_manager.all_media_files[0].filename)
-
+            # the files have already been streamed into the staging folder by StagingRequest,
+            # they are queued for the ingest workers and the request returns straight away
+            items = []
+            for file in request.files.getlist('file'):
+                path = getattr(file.stream, 'name', None)
+                file.stream.close()
+                if file.filename == '':
+                    # an empty file input
+                    if path is not None and os.path.exists(path):
+                        os.remove(path)
+                    continue
+                if path is not None and path.endswith(PARTIAL_SUFFIX):
+                    # the whole form has been read, the file is complete
+                    os.replace(path, path[:-len(PARTIAL_SUFFIX)])
+                    path = path[:-len(PARTIAL_SUFFIX)]
+                items.append(IngestItem(file.filename, path=path))
+
+            # image_url may be repeated or hold several URLs, a JSON body can list them in urls, they are downloaded concurrently
+            data = request.get_json(silent=True) if request.is_json else None
+            url_values = request.form.getlist('image_url') + request.form.getlist('image_urls')
+            if isinstance(data, dict) and isinstance(data.get('urls'), list):
+                url_values += [str(url) for url in data['urls']]
+            try:
+                urls = parse_urls(url_values)
+            except ValueError as e:
+                for item in items:
+                    if item.path is not None and os.path.exists(item.path):
+                        os.remove(item.path)
+                return str(e), 400
+            items.extend(IngestItem(os.path.basename(urlparse(url).path) or url, url=url) for url in urls)
+
+            if not items:
+                return "No file or image URL provided", 400
+
+            try:
+                job = self.ingest_queue.submit(items)
+            except OverflowError:
+                for item in items:
+                    if item.path is not None and os.path.exists(item.path):
+                        os.remove(item.path)
+                return "Too many uploads are waiting to be processed, try again later", 503, {'Retry-After': '30'}
+
+            status_url = url_for('upload_status', job_id=job.id)
+            if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+                # a plain form post from a browser without javascript
                 return redirect(url_for('index'))
+            return jsonify({**job.to_dict(), 'status_url': status_url}), 202, {'Location': status_url}
+
+        @self.app.route(API.upload_status, methods=['GET'])
+        def upload_status(job_id):
+            job = self.ingest_queue.get(job_id)
+            if job is None:
+                return jsonify(error='Unknown job'), 404
+            return jsonify(job.to_dict())
 
         @self.app.route(API.thumbnails, methods=['GET'])
         def uploaded_thumbnail(filename):
-            return send_from_directory(self.app.config['THUMBNAIL_FOLDER'], filename)
+            return self.thumbnail_server.send(filename)
         
         @self.app.route(API.update_device_name, methods=['POST'])
         def update_device_name():
@@ -234,22 +374,38 @@ class CombinedApp:
             filename = request.form.get('filename')
             if not filename:
                 return "Filename is required", 400  # Return a 400 Bad Request if filename is not provided
-            
-            file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
-            thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-            
-            #remove the image from the slideshow files list
-            self.slideshow_manager.viewer.media_manager.remove_media_file(file_path)
 
-            if len(self.slideshow_manager.viewer.media_manager.all_media_files) == 0:
-                self.slideshow_manager.viewer.set_image_from_path('static/background.png')
+            try:
+                self.delete_media_files([filename])
+            except ValueError as e:
+                return str(e), 400
 
             return redirect(url_for('index'))
 
+        @self.app.route(API.gallery_batch, methods=['POST'])
+        def gallery_batch():
+            '''
+            Apply one action to many files at once, e.g. {"action": "delete", "filenames": ["a.jpg", "b.mp4"]}
+            the library is updated and the change published once for the whole batch
+            '''
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data, dict):
+                return jsonify(error='The body must be a JSON object'), 400
+            action = data.get('action', request.form.get('action'))
+            filenames = data.get('filenames', request.form.getlist('filenames'))
+            if not isinstance(filenames, list) or not all(isinstance(filename, str) and filename for filename in filenames):
+                return jsonify(error='filenames must be a list of file names'), 400
+            if action != 'delete':
+                return jsonify(error='Unknown action, the only batch action is delete'), 400
+            if self.slideshow_manager.viewer is None:
+                return jsonify(error='Viewer is not initialized'), 503
+
+            try:
+                deleted, missing = self.delete_media_files(filenames)
+            except ValueError as e:
+                return jsonify(error=str(e)), 400
+            return jsonify(action=action, deleted=deleted, missing=missing)
+
         @self.app.route(API.select, methods=['POST'])
         def select_file():
             # Extract filename from POST data
@@ -259,23 +415,88 @@ class CombinedApp:
 
             file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
             if os.path.exists(file_path):
-                self.slideshow_manager.viewer.select_image(filename)
+                self.slideshow_manager.viewer.post(self.slideshow_manager.viewer.select_image, filename, key='show')
             return '', 204
         
         @self.app.route(API.current_image_name, methods=['GET'])
         def current_image_name():
             current_image_name = self.slideshow_manager.get_current_image_name()
             return current_image_name
+
+        @self.app.route(API.gallery, methods=['GET'])
+        def gallery_page():
+            '''
+            One page of the library as JSON, ?orientation=portrait|landscape|both&sort=newest|oldest&limit=&cursor=&fields=a,b
+            '''
+            if self.slideshow_manager.viewer is None:
+                return jsonify(error='Viewer is not initialized'), 503
+
+            orientation = request.args.get('orientation', 'both')
+            sort = request.args.get('sort', 'newest')
+            if orientation not in ('portrait', 'landscape', 'both') or sort not in ('newest', 'oldest'):
+                return jsonify(error='orientation must be portrait, landscape or both and sort newest or oldest'), 400
+            try:
+                fields = parse_fields(request.args.get('fields'))
+                limit = parse_limit(request.args.get('limit'))
+                after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            except ValueError as e:
+                return jsonify(error=str(e)), 400
+
+            media_manager = self.slideshow_manager.viewer.media_manager
+            page, next_key = media_manager.get_page(orientation, newest_first=sort == 'newest', after=after, limit=limit)
+
+            items = []
+            for media in page:
+                item = {
+                    'filename': media.filename,
+                    'type': 'video' if is_video_file(media.filename) else 'animation' if isinstance(media, AnimatedContainer) else 'image',
+                    'orientation': str(media.orientation),
+                    'width': media.width,
+                    'height': media.height,
+                    'uploaded': media.uploaded,
+                    'thumbnail': url_for('uploaded_thumbnail', filename=media.thumbnail_name),
+                    'url': url_for('uploaded_file', filename=media.filename),
+                }
+                items.append({field: item[field] for field in fields})
+
+            next_url = None
+            if next_key is not None:
+                next_url = url_for('gallery_page', orientation=orientation, sort=sort, limit=limit,
+                                   cursor=encode_cursor(next_key), fields=request.args.get('fields') or None)
+            return jsonify(items=items, next=next_url)
         
         @self.app.route(API.canvas, methods=['GET'])
         def canvas():
-            if self.slideshow_manager.viewer is not None:
-                canvas = self.slideshow_manager.viewer.canvas_image
-                #return an opencv/nparry image
-                _, buffer = cv2.imencode('.jpg', canvas)
-                response = make_response(buffer.tobytes())
-                response.headers['Content-Type'] = 'image/jpeg'
-                return response
+            frame = self.get_canvas_frame()
+            if frame is None or frame[1] is None:
+                return "Viewer is not initialized", 503
+            generation, image = frame
+            # optional ?w=<width>&q=<jpeg quality> variants, each cached for the current canvas generation
+            encoded = self.canvas_cache.get(generation, image,
+                                            width=request.args.get('w', type=int),
+                                            quality=request.args.get('q', type=int))
+            response = make_response(encoded.data)
+            response.headers['Content-Type'] = 'image/jpeg'
+            response.set_etag(encoded.etag)
+            response.last_modified = encoded.last_modified
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        @self.app.route(API.canvas_stream, methods=['GET'])
+        def canvas_stream():
+            if self.slideshow_manager.viewer is None:
+                return "Viewer is not initialized", 503
+            client = self.canvas_streamer.add_client()
+            return Response(self.canvas_streamer.stream(client), mimetype=self.canvas_streamer.mimetype)
+        
+        @self.app.route(API.events, methods=['GET'])
+        def events():
+            # server-sent events with the current image, slideshow state and configuration changes
+            client = self.slideshow_manager.events.add_client()
+            response = Response(self.slideshow_manager.events.stream(client), mimetype=self.slideshow_manager.events.mimetype)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
         
         @self.app.route(API.configure_mqtt, methods=['POST'])
         def configure_mqtt():
@@ -312,7 +533,7 @@ class CombinedApp:
                         self.slideshow_manager.auto_brightness = False
                         self.config_manager.update_parameter('auto_brightness', False)
                         brightness = int(brightness)
-                        self.monitor_controller.set_luminance(brightness)
+                        self.monitor_state.set_luminance(brightness)
                     elif brightness == -1:
                         self.slideshow_manager.auto_brightness = True
                         self.config_manager.update_parameter('auto_brightness', True)
@@ -330,24 +551,24 @@ class CombinedApp:
                 self.config_manager.update_parameter('scale_mode', scale_mode)
                 self.config_manager.update_parameter('time_on', time_on)
                 self.config_manager.update_parameter('time_off', time_off)
-                self.slideshow_manager.viewer.update_parameters(media_orientation_filter=media_orientation_filter, 
-                                                        display_mode=display_mode, 
-                                                        rotation=rotation,
-                                                        scale_mode=scale_mode)
+                self.slideshow_manager.viewer.post_parameters(media_orientation_filter=media_orientation_filter,
+                                                             display_mode=display_mode,
+                                                             rotation=rotation,
+                                                             scale_mode=scale_mode)
 
                 # Handle screen control
                 display_power_action = request.form.get('power')
                 if display_power_action is not None:
                     if display_power_action == 'on':
-                        self.monitor_controller.set_power_mode('on')
+                        self.monitor_state.set_power_mode('on')
                         return jsonify(success=True)
                     elif display_power_action == 'off':
-                        self.monitor_controller.set_power_mode('off')
+                        self.monitor_state.set_power_mode('off')
                         return jsonify(success=True)
                 
                 # if the oreintation is changed, we need to refresh the page to update the gallery view
+                # the viewer filters the library itself when it applies the posted parameters
                 if media_orientation_filter is not None:
-                    self.slideshow_manager.viewer.media_manager.orientation_filter = media_orientation_filter
                     return redirect(url_for('index'))
 
                 return "", 204
@@ -360,8 +581,8 @@ class CombinedApp:
                     'media_orientation_filter': self.config_manager.config['media_orientation_filter'],
                     'scale_mode': self.config_manager.config['scale_mode'],
                     'rotation': self.config_manager.config['rotation'],
-                    'brightness': self.monitor_controller.get_luminance(),
-                    'power': self.monitor_controller.get_power_mode(),
+                    'brightness': self.monitor_state.get_luminance(),
+                    'power': self.monitor_state.get_power_mode(),
                 }), 200
                 
         @self.app.route(API.configure_slideshow, methods=['POST'])
@@ -376,23 +597,23 @@ class CombinedApp:
             
             self.config_manager.update_parameter('transition_duration', transition_duration)
             self.config_manager.update_parameter('frame_interval', frame_interval)
-            self.slideshow_manager.viewer.update_parameters(transition_duration=transition_duration, frame_interval=frame_interval)
+            self.slideshow_manager.viewer.post_parameters(transition_duration=transition_duration, frame_interval=frame_interval)
             slideshow_active = strtobool(request.form.get('slideshow_active'))
             if slideshow_active == True:
-                self.slideshow_manager.viewer.play_slideshow()
+                self.slideshow_manager.viewer.post(self.slideshow_manager.viewer.play_slideshow, key='slideshow')
             elif slideshow_active == False:
-                self.slideshow_manager.viewer.pause_slideshow()
+                self.slideshow_manager.viewer.post(self.slideshow_manager.viewer.pause_slideshow, key='slideshow')
             return redirect(url_for('index'))
 
         @self.app.route(API.slideshow_next, methods=['POST'])
         def slideshow_next():
-            self.slideshow_manager.viewer.show_next_image()
+            self.slideshow_manager.viewer.post_step(1)
             # self.slideshow_manager.publish_current_image()
             return '', 204
 
         @self.app.route(API.slideshow_previous, methods=['POST'])
         def slideshow_previous():
-            self.slideshow_manager.viewer.show_previous_image()
+            self.slideshow_manager.viewer.post_step(-1)
             # self.slideshow_manager.publish_current_image()
             return '', 204
 
@@ -413,9 +634,9 @@ class CombinedApp:
             pause_when_plex_playing = strtobool(request.form.get('pause_when_plex_playing'))
             
             if pause_when_plex_playing:
-                self.slideshow_manager.viewer.pause_slideshow()
+                self.slideshow_manager.viewer.post(self.slideshow_manager.viewer.pause_slideshow, key='slideshow')
             else:
-                self.slideshow_manager.viewer.play_slideshow()
+                self.slideshow_manager.viewer.post(self.slideshow_manager.viewer.play_slideshow, key='slideshow')
             
             self.config_manager.update_parameter('plex_port', plex_port)
             self.config_manager.update_parameter('allow_plex', allow_plex)
@@ -438,39 +659,32 @@ class CombinedApp:
 
         @self.app.route(API.plex_hook, methods=['POST'])
         def plex_hook():
-            if self.config_manager['allow_plex']:
-            # if True:
+            # Plex only needs to know the event arrived, the poster is fetched and shown by the plex_webhooks worker
+            if not self.config_manager['allow_plex']:
+                return jsonify(success=False), 403
+            try:
                 payload_str = request.form.get('payload')
-                
                 if payload_str is None:
-                    payload_str = request.data.decode('utf-8')
-                    payload = json.loads(json.loads(payload_str)['payload'])
+                    payload = json.loads(json.loads(request.data.decode('utf-8'))['payload'])
                 else:
                     payload = json.loads(payload_str)
-
-                if payload['event'] == 'media.play' or payload['event'] == 'media.resume':
-                    thumb_url = get_thumbnail(payload)
-                    media_title = get_title(payload)
-                    print(media_title)
-                    if thumb_url is not None:
-                        image_url = f"http://{request.access_route[0]}:{self.config_manager.config['plex_port']}{thumb_url}.jpg"
-                        try:
-                            print(image_url)
-                            image = read_image_from_url(image_url)
-                            if self.config_manager.config['pause_when_plex_playing']:
-                                self.slideshow_manager.viewer.pause_slideshow()
-                            self.slideshow_manager.viewer.set_image(image, media_title)
-                        except:
-                            print(f"Failed to fetch image from Plex server on port {self.config_manager.config['plex_port']}")
-                            # print("Disabling Plex server integration")
-                            # self.config_manager.update_parameter('allow_plex', False)
-                            return jsonify(success=False), 500
-
-                elif payload['event'] == 'media.stop' or payload['event'] == 'media.pause':
-                    if self.slideshow_manager.viewer is not None:
-                        self.slideshow_manager.viewer.play_slideshow()
-                return jsonify(success=True), 200
-            return jsonify(success=False), 403
+                if not isinstance(payload, dict):
+                    raise ValueError('the payload is not an object')
+            except (ValueError, KeyError, TypeError) as e:
+                return jsonify(success=False, error=f'Invalid payload: {e}'), 400
+            queued = self.plex_webhooks.submit(payload, request.access_route[0])
+            return jsonify(success=True, queued=queued), 200
+
+        @self.app.route(API.metrics, methods=['GET'])
+        def metrics_route():
+            response = make_response(metrics.render_prometheus())
+            response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+            return response
+
+        @self.app.route(API.metrics_slow, methods=['GET'])
+        def slow_requests():
+            # the latest requests that took longer than slow_request_threshold, newest last, with a stack sample
+            return jsonify(threshold=self.request_metrics.slow_threshold, requests=list(self.request_metrics.slow_requests))
 
         @self.app.route(API.power_control, methods=['POST'])
         def power_control():
@@ -481,6 +695,89 @@ class CombinedApp:
                 self.reboot()
             return '', 204
 
+    def fetch_remote_item(self, item: IngestItem) -> None:
+        '''
+        Download an image URL into the staging folder, runs on an ingest download thread before ingest_item
+        '''
+        item.path, item.name = self.remote_downloader.download(item.url)
+
+    def ingest_item(self, item: IngestItem) -> str:
+        '''
+        Add an uploaded or downloaded file to the library, runs on an ingest worker
+        '''
+        file_path = thumbnail_path = None
+        try:
+            if item.path is None:
+                raise ValueError(f'{item.name} was not downloaded')
+
+            viewer = self.slideshow_manager.viewer
+            while viewer is None:
+                # uploads staged before a restart can be picked up before the slideshow is up
+                time.sleep(0.5)
+                viewer = self.slideshow_manager.viewer
+
+            # animations keep their extension and size, resizing would flatten them to the first frame
+            animated = is_animated(item.path)
+            name = item.name if animated else replace_webp_extension(item.name)
+            if not is_video_file(name) and not animated:
+                max_usful_size(item.path, max_size=max(viewer.screen_width, viewer.screen_height))
+
+            with self.ingest_lock:
+                filename = generate_unique_filename(self.app.config['UPLOAD_FOLDER'], os.path.splitext(name)[1].lower())
+                file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
+                os.replace(item.path, file_path)
+            thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], thumbnail_filename(filename))
+            create_thumbnail(file_path, thumbnail_path)
+
+            # the file is read here, the library itself is only changed on the Tk loop which plays from it
+            media = viewer.media_manager.create_media(file_path)
+            self.wait_for_viewer(viewer.call(self.add_to_library, viewer, media, filename))
+            return filename
+        except Exception:
+            # a file that didn't make it into the library isn't left in the folder to turn up after a restart
+            for path in (file_path, thumbnail_path):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            if item.path is not None and os.path.exists(item.path):
+                os.remove(item.path)
+
+    def add_to_library(self, viewer, media, filename):
+        # runs on the Tk loop
+        media_manager = viewer.media_manager
+        list_was_empty = len(media_manager.all_media_files) == 0
+        media_manager.add_media(media)
+        media_manager.filter_media_by_orientation(self.config_manager.config['media_orientation_filter'])
+        # if the list was empty, show the first image we've just uploaded
+        if list_was_empty:
+            viewer.select_image(filename)
+
+    def wait_for_viewer(self, future):
+        # the reply waits for the change so the gallery shows it, a stalled Tk loop still applies it later
+        try:
+            future.result(timeout=self.library_update_timeout)
+        except FutureTimeoutError:
+            print("The viewer has not applied the library change yet")
+
+    def requeue_incoming(self):
+        # uploads staged before a restart are processed again, they are already on disk so the queue limit doesn't apply
+        items = []
+        for path in list_files(self.app.config['INCOMING_FOLDER'], include_paths=True):
+            if path.endswith(PARTIAL_SUFFIX):
+                # an upload or download cut short by the restart
+                os.remove(path)
+                continue
+            items.append(IngestItem(staged_name(path), path=path))
+        if items:
+            print(f'Requeueing {len(items)} staged uploads')
+            self.ingest_queue.submit(items, check_limit=False)
+
+    def get_canvas_frame(self):
+        if self.slideshow_manager.viewer is None:
+            return None
+        return self.slideshow_manager.viewer.canvas_frame
+
     def monitor_sensor(self):
         previous_media_orientation_filter = None
         previous_brightness = None
@@ -491,12 +788,22 @@ class CombinedApp:
         smooth_luminance = [None]*smoothing_window
         smooth_index = 0
         
+        last_metrics_publish = time.monotonic()
+        
         while self.slideshow_manager.viewer is None:
             time.sleep(1)
         
         while True:
             
-            if self.config_manager.config['auto_rotation']:
+            metrics_publish_interval = self.config_manager.config['metrics_publish_interval']
+            if metrics_publish_interval > 0 and time.monotonic() - last_metrics_publish >= metrics_publish_interval:
+                self.slideshow_manager.publish_metrics()
+                last_metrics_publish = time.monotonic()
+            
+            # while the display is off there is nothing to rotate or dim, so leave the sensors alone
+            idle = self.slideshow_manager.viewer.idle
+            
+            if self.config_manager.config['auto_rotation'] and not idle:
                 # read the sensor data, smooth it and calculate the rotation angle
                 accel = self.sensor_reader.read_bmi160_accel()
                 smooth_accel[smooth_index] = accel
@@ -504,11 +811,11 @@ class CombinedApp:
                 angle = accel_to_rotation(smoothed_accel)
                 if angle != previous_rotation:
                     #only update the rotation if it has changed
-                    self.slideshow_manager.viewer.update_parameters(rotation=angle)
+                    self.slideshow_manager.viewer.post_parameters(rotation=angle)
                     previous_rotation = angle
 
 
-            if self.config_manager.config['auto_brightness']:
+            if self.config_manager.config['auto_brightness'] and not idle:
                 # read the sensor data, smooth it and calculate the brightness
                 luminance = self.sensor_reader.read_veml7700_light()
                 smooth_luminance[smooth_index] = luminance
@@ -519,7 +826,7 @@ class CombinedApp:
                 self.slideshow_manager.publish_light_levels(smoothed_luminance, brightness)
 
                 if brightness != previous_brightness:
-                    self.monitor_controller.set_luminance(brightness)
+                    self.monitor_state.set_luminance(brightness)
                     previous_brightness = brightness
             
             smooth_index = (smooth_index + 1) % smoothing_window
@@ -532,23 +839,114 @@ class CombinedApp:
                     if time_on <= current_time < time_off:
                         if not self.on_trigger:
                             self.on_trigger = True
-                            self.monitor_controller.set_power_mode('on')
-                            if self.previous_slideshow_active_state:
-                                #only resume the slideshow if it was active before the display was turned off
-                                self.slideshow_manager.viewer.play_slideshow()
+                            self.monitor_state.set_power_mode('on')
+                            self.slideshow_manager.exit_idle()
                             print(f"Turning on the display at {current_time}")
                     else:
                         if self.on_trigger:
                             self.on_trigger = False
-                            self.monitor_controller.set_power_mode('off')
-                            self.previous_slideshow_active_state = self.slideshow_manager.viewer.slideshow_active
-                            self.slideshow_manager.viewer.pause_slideshow()
+                            self.monitor_state.set_power_mode('off')
+                            self.slideshow_manager.enter_idle()
                             print(f"Turning off the display at {current_time}")
+                        elif idle and seconds_until(self.config_manager.config['time_on']) <= self.config_manager.config['prewarm_lead_time']:
+                            #get the first frames ready shortly before the display comes back on
+                            self.slideshow_manager.prewarm()
             
-            time.sleep(0.1)
+            if idle:
+                time.sleep(self.config_manager.config['idle_sensor_interval'])
+            else:
+                time.sleep(0.1)
+
+    def handle_plex_event(self, event: PlexEvent, is_current) -> bool:
+        '''
+        Show the poster of what started playing, or resume the slideshow, on the plex_webhooks worker
+        returns False when a newer event of the session arrived while the poster was fetched
+        '''
+        viewer = self.slideshow_manager.viewer
+        if viewer is None:
+            return True
+        if event.event not in PLAY_EVENTS:
+            viewer.post(viewer.play_slideshow, key='slideshow')
+            return True
+
+        thumb_url = get_thumbnail(event.payload)
+        media_title = get_title(event.payload)
+        print(media_title)
+        if thumb_url is None:
+            return True
+        plex_url = f"http://{event.address}:{self.config_manager.config['plex_port']}"
+        image = self.artwork_fetcher.get(plex_url, thumb_url, viewer.screen_height, viewer.screen_width)
+        if not is_current():
+            print(f"Dropped the artwork of {media_title}, a newer Plex event arrived")
+            return False
+        if self.config_manager.config['pause_when_plex_playing']:
+            viewer.post(viewer.pause_slideshow, key='slideshow')
+        viewer.post(viewer.set_image, image, media_title, key='show')
+        return True
+
+    def delete_media_files(self, filenames):
+        '''
+        Delete files with their thumbnails and cached copies, then remove them from the library in one go
+        returns the deleted and the missing filenames, raises ValueError before deleting anything if a name isn't a plain file name
+        '''
+        filenames = list(dict.fromkeys(filenames))
+        invalid = [filename for filename in filenames if os.path.basename(filename) != filename or filename in ('.', '..')]
+        if invalid:
+            raise ValueError(f"Not a file name in the library: {', '.join(invalid)}")
+
+        deleted, missing, file_paths = [], [], []
+        for filename in filenames:
+            file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
+            #a file already gone from disk is still dropped from the library
+            file_paths.append(file_path)
+            if not os.path.exists(file_path):
+                missing.append(filename)
+                continue
+            os.remove(file_path)
+            thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], thumbnail_filename(filename))
+            if os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+            self.upload_server.discard(filename)
+            self.thumbnail_server.discard(thumbnail_filename(filename))
+            self.derivative_cache.discard(filename)
+            deleted.append(filename)
+
+        if not file_paths:
+            return deleted, missing
+
+        viewer = self.slideshow_manager.viewer
+        self.wait_for_viewer(viewer.call(self.remove_from_library, viewer, file_paths))
+        return deleted, missing
+
+    def remove_from_library(self, viewer, file_paths):
+        # runs on the Tk loop, removing the files from the slideshow files list publishes the change once
+        media_manager = viewer.media_manager
+        removed = set(file_paths)
+        for media in media_manager.all_media_files:
+            if media.file_path in removed:
+                # the processed frames of a deleted file are never shown again, free them now
+                viewer.frame_cache.discard(media.cache_id)
+        media_manager.remove_media_files(file_paths)
+        if len(media_manager.all_media_files) == 0:
+            viewer.set_image_from_path('static/background.png')
+
+    def create_asgi_app(self) -> AsgiAdapter:
+        # the same Flask routes, with the image encode/decode routes on their own small pool
+        # and the MJPEG and event streams served natively so clients don't hold a thread each
+        return AsgiAdapter(self.app,
+                           cpu_routes=(API.canvas, API.display_now),
+                           native_routes={API.canvas_stream: canvas_stream_route(self.canvas_streamer, lambda: self.slideshow_manager.viewer is not None),
+                                          API.events: event_stream_route(self.slideshow_manager.events)},
+                           io_workers=self.config_manager.config['asgi_io_workers'],
+                           cpu_workers=self.config_manager.config['asgi_cpu_workers'])
 
     def run_flask(self):
-        self.app.run(host='0.0.0.0', port=self.config_manager.config['web_interface_port'], debug=False, use_reloader=False)
+        port = self.config_manager.config['web_interface_port']
+        if self.config_manager.config['web_server'] == 'asgi':
+            if serve(self.create_asgi_app(), host='0.0.0.0', port=port):
+                return
+            print('Falling back to the Flask development server')
+        self.app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
 
     def run(self):
         flask_thread = threading.Thread(target=self.run_flask)
@@ -2,20 +2,31 @@ import json
 import os
 from queue import Queue
 from config_manager import ConfigManager
+from event_stream import EventBroadcaster
 from image_viewer3 import ImageViewer
+from metrics import metrics
+from remote_fetch import RemoteDownloader
+from remote_playlist import RemoteMediaCache, RemotePlaylist
 import paho.mqtt.client as mqtt
 
 
 class SlideshowManager:
+
+    REMOTE_CACHE_FOLDER = 'remote_cache'        #downloaded images of the remote playlist
+
     def __init__(self, 
                  folder, 
                  config_manager):
         self.config_manager: ConfigManager = config_manager
         self.folder = folder
-        self.viewer = None
+        self.viewer = None              #the primary viewer, the web interface and MQTT control this one
+        self.viewers = []               #every viewer, one per display
         self.check_job = None
         self.mqtt_client = None
         self.mqtt_connected = False
+        self.events = EventBroadcaster()    #pushes image, state and config changes to the web interface
+        self.remote_playlist = None         #RemotePlaylist when remote_playlist_url is set
+        self.config_manager.config_changed_callback = self.on_config_changed
         self.setup_mqtt_client()
 
     def get_current_image_name(self):
@@ -24,14 +35,73 @@ class SlideshowManager:
         return ''
 
     def start_slideshow(self):
-        self.viewer = ImageViewer(self.config_manager)
+        #each entry of 'displays' configures one panel, without entries a single display uses the top level configuration
+        displays = self.config_manager.config['displays'] or [None]
+        self.viewer = ImageViewer(self.config_manager, display_config=displays[0])
+        viewers = [self.viewer]
+        for display_config in displays[1:]:
+            #the additional displays share the catalog and the processed frames of the first one
+            viewers.append(ImageViewer(self.config_manager,
+                                       media_manager=self.viewer.media_manager.create_view(),
+                                       frame_cache=self.viewer.frame_cache,
+                                       display_config=display_config,
+                                       master=self.viewer.root))
+        self.viewers = viewers
         #add callbacks
-        self.viewer.image_change_callback = self.publish_current_image
-        self.viewer.media_manager.media_files_changed_callback = self.publish_available_images
+        self.viewer.image_change_callback = self.on_image_changed
+        self.viewer.state_change_callback = self.on_state_changed
+        self.viewer.media_manager.media_files_changed_callback = self.on_media_files_changed
         #initial publishing
         self.publish_available_images()
         self.publish_current_config()
+        self.on_state_changed(self.viewer.state)
+        self.start_remote_playlist()
+        for viewer in self.viewers[1:]:
+            viewer.run()
         self.viewer.run()
+
+    def start_remote_playlist(self):
+        config = self.config_manager.config
+        if not config['remote_playlist_url']:
+            return
+        downloader = RemoteDownloader(SlideshowManager.REMOTE_CACHE_FOLDER,
+                                      max_bytes=config['download_max_size'] * 1024 * 1024,
+                                      max_seconds=config['download_timeout'])
+        cache = RemoteMediaCache(SlideshowManager.REMOTE_CACHE_FOLDER, downloader,
+                                 max_bytes=config['remote_cache_size'] * 1024 * 1024)
+        self.remote_playlist = RemotePlaylist(config['remote_playlist_url'], cache,
+                                              prefetch_count=config['remote_prefetch'],
+                                              refresh_interval=config['remote_refresh_interval'])
+        self.remote_playlist.start(self.viewer.media_manager, is_idle=lambda: self.viewer.idle,
+                                   post=lambda func, *args: self.viewer.post(func, *args, key='remote_media'))
+
+    def on_image_changed(self, filename):
+        if self.remote_playlist is not None:
+            self.remote_playlist.wake()
+        self.publish_current_image()
+        self.events.publish('current_image', {'filename': filename})
+
+    def on_state_changed(self, state):
+        self.events.publish('state', state)
+
+    def on_media_files_changed(self):
+        self.publish_available_images()
+        self.events.publish('media', {'count': len(self.viewer.media_manager.all_media_files)})
+
+    def on_config_changed(self, key, value):
+        self.events.publish('config', {key: value})
+
+    def enter_idle(self):
+        for viewer in self.viewers:
+            viewer.post(viewer.enter_idle, key='idle')
+
+    def exit_idle(self):
+        for viewer in self.viewers:
+            viewer.post(viewer.exit_idle, key='idle')
+
+    def prewarm(self):
+        for viewer in self.viewers:
+            viewer.post(viewer.prewarm, key='prewarm')
     
     def setup_mqtt_client(self):
         try:
@@ -88,23 +158,23 @@ class SlideshowManager:
         #         self.monitor_controller.set_power_mode('off')
 
         if 'display_mode' in base_topic:
-            self.viewer.update_parameters(display_mode=payload_str)
+            self.viewer.post_parameters(display_mode=payload_str)
             
         if 'rotation' in base_topic:    
-            self.viewer.update_parameters(rotation=int(payload_str))
+            self.viewer.post_parameters(rotation=int(payload_str))
             
         if 'scale_mode' in base_topic:  
-            self.viewer.update_parameters(scale_mode=payload_str)
+            self.viewer.post_parameters(scale_mode=payload_str)
             
         if 'slideshow' in base_topic:    
             if payload_str == 'pause':
-                self.viewer.pause_slideshow()
+                self.viewer.post(self.viewer.pause_slideshow, key='slideshow')
             elif payload_str == 'resume':
-                self.viewer.play_slideshow()
+                self.viewer.post(self.viewer.play_slideshow, key='slideshow')
             elif payload_str == 'next':
-                self.viewer.show_next_image()
+                self.viewer.post_step(1)
             elif payload_str == 'previous':
-                self.viewer.show_previous_image()
+                self.viewer.post_step(-1)
             elif payload_str == 'quit':
                 self.close()
                 
@@ -161,7 +231,8 @@ class SlideshowManager:
             return
         if not self.viewer.media_manager:
             return
-        files = self.viewer.media_manager.get_media_files()
+        # read only, the library is changed on the Tk loop
+        files = list(self.viewer.media_manager.all_media_files)
         files = [os.path.basename(file.filename) for file in files]
         self.publish_mqtt_message(f"{self.config_manager.config['mqtt_topic']}/available_images", json.dumps(files), retain=True)
 
@@ -169,6 +240,9 @@ class SlideshowManager:
         self.publish_mqtt_message(f"{self.config_manager.config['mqtt_topic']}/light_sensor", light_level)
         self.publish_mqtt_message(f"{self.config_manager.config['mqtt_topic']}/screen_brightness", screen_brightness)
 
+    def publish_metrics(self):
+        self.publish_mqtt_message(f"{self.config_manager.config['mqtt_topic']}/metrics", json.dumps(metrics.snapshot()))
+
     def close(self):
         if self.viewer:
             self.viewer.quit_app()
@@ -0,0 +1,116 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from flask import abort, send_file
+from werkzeug.security import safe_join
+
+#this class ImmutableFileServer is responsible for serving the uploaded media and thumbnails with HTTP caching
+#files are named by generate_unique_filename and never change, so browsers may keep them for good (immutable)
+#the strong ETag is a hash of the content, computed once per file and redone only if its size or mtime changes
+#conditional GETs and byte ranges are answered by werkzeug's send_file, small files are served from memory
+
+FileInfo = namedtuple('FileInfo', ['etag', 'size', 'mtime_ns'])
+
+
+class BytesCache:
+    '''
+    LRU of small file contents, bounded by their total size
+    '''
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_item_bytes=256 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.items = OrderedDict()          #path -> (mtime_ns, data)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, mtime_ns):
+        with self.lock:
+            item = self.items.get(path)
+            if item is None or item[0] != mtime_ns:
+                return None
+            self.items.move_to_end(path)
+            return item[1]
+
+    def put(self, path, mtime_ns, data) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        with self.lock:
+            self._remove(path)
+            self.items[path] = (mtime_ns, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, path) -> None:
+        with self.lock:
+            self._remove(path)
+
+    def _remove(self, path) -> None:
+        item = self.items.pop(path, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+
+class ImmutableFileServer:
+
+    MAX_AGE = 365 * 24 * 3600
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, directory, bytes_cache: BytesCache = None) -> None:
+        self.directory = directory
+        self.bytes_cache = bytes_cache
+        self.infos = {}                     #path -> FileInfo
+        self.lock = threading.Lock()
+
+    def file_info(self, path, stat) -> FileInfo:
+        with self.lock:
+            info = self.infos.get(path)
+        if info is not None and info.size == stat.st_size and info.mtime_ns == stat.st_mtime_ns:
+            return info
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(self.HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        info = FileInfo(digest.hexdigest(), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            self.infos[path] = info
+        return info
+
+    def discard(self, filename) -> None:
+        #forget a deleted file
+        path = safe_join(self.directory, filename)
+        if path is None:
+            return
+        with self.lock:
+            self.infos.pop(path, None)
+        if self.bytes_cache is not None:
+            self.bytes_cache.discard(path)
+
+    def send(self, filename):
+        path = safe_join(self.directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        stat = os.stat(path)
+        info = self.file_info(path, stat)
+
+        #send_file resolves relative paths against the app's root_path, not the working directory checked above
+        source = os.path.abspath(path)
+        if self.bytes_cache is not None and stat.st_size <= self.bytes_cache.max_item_bytes:
+            data = self.bytes_cache.get(path, stat.st_mtime_ns)
+            if data is None:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                self.bytes_cache.put(path, stat.st_mtime_ns, data)
+            source = io.BytesIO(data)
+
+        response = send_file(source, download_name=os.path.basename(path), conditional=True,
+                             etag=info.etag, last_modified=stat.st_mtime, max_age=self.MAX_AGE)
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,97 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+#a stand-in for a Plex Media Server on the local machine, for the artwork and webhook tests
+#it serves a poster at any /library/metadata/... path, optionally slowly or with an error, counts the requests,
+#and sends webhooks the way Plex does (a multipart form with the JSON in the payload field)
+#run it to push a play/pause burst to a running frame: python fake_plex.py http://<device>:7000 [plex port]
+
+
+def make_poster(height=3000, width=2000) -> bytes:
+    import cv2
+    import numpy as np
+    return cv2.imencode('.jpg', np.full((height, width, 3), 128, np.uint8))[1].tobytes()
+
+
+def webhook_payload(event, session='player-1', thumb='/library/metadata/1/thumb/1', title='A Movie', section='movie') -> dict:
+    thumb_key = {'movie': 'thumb', 'show': 'grandparentThumb'}.get(section, 'parentThumb')
+    return {
+        'event': event,
+        'Player': {'uuid': session, 'title': 'Living Room', 'publicAddress': '127.0.0.1'},
+        'Metadata': {'librarySectionType': section, 'title': title, 'grandparentTitle': title, thumb_key: thumb},
+    }
+
+
+class FakePlexServer:
+    def __init__(self, poster: bytes = None, delay=0.0, port=0) -> None:
+        self.poster = poster
+        self.delay = delay                  #seconds before each artwork response
+        self.status = 200                   #set to an error code to fail the artwork requests
+        self.requests = []                  #paths requested, in order
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake.lock:
+                    fake.requests.append(self.path)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                if fake.status != 200 or not self.path.startswith('/library/metadata/'):
+                    self.send_error(fake.status if fake.status != 200 else 404)
+                    return
+                if fake.poster is None:
+                    fake.poster = make_poster()
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(fake.poster)))
+                self.end_headers()
+                self.wfile.write(fake.poster)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakePlexServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def send_webhook(host, payload, timeout=5) -> requests.Response:
+        # Plex posts multipart/form-data with the JSON in the payload field
+        files = {'payload': (None, json.dumps(payload), 'application/json')}
+        return requests.post(f'{host}/plex_hook', files=files, timeout=timeout)
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else 'http://127.0.0.1:7000'
+    plex = FakePlexServer(delay=1.0, port=int(sys.argv[2]) if len(sys.argv) > 2 else 32400).start()
+    for event in ('media.play', 'media.pause', 'media.resume'):
+        started = time.time()
+        response = FakePlexServer.send_webhook(host, webhook_payload(event))
+        print(event, response.status_code, response.text.strip(), f'{time.time() - started:.3f}s')
+    time.sleep(3)
+    print('artwork requests:', plex.requests)
+    plex.stop()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import numpy as np
+
+from command_queue import CommandQueue
+from frame_cache import FrameCache
+from image_container import ImageContainer
+from image_viewer3 import ImageViewer
+from media_manager import MediaManager
+from run import CombinedApp
+
+#stand-ins for the screen and the hardware, so the real web app can run in the route tests and in api_benchmark.py
+#StubApp is CombinedApp with a stub monitor and stub sensors, StubViewer takes the place of the Tk ImageViewer
+
+
+class StubMonitorController:
+    # answers like MonitorController, every read or write takes as long as a DDC/CI round trip
+
+    DDC_DELAY = 0.05
+
+    def __init__(self):
+        self.power = 'on'
+        self.luminance = 50
+        self.contrast = 50
+
+    def get_power_mode(self):
+        time.sleep(self.DDC_DELAY)
+        return self.power
+
+    def get_luminance(self):
+        time.sleep(self.DDC_DELAY)
+        return self.luminance
+
+    def get_contrast(self):
+        time.sleep(self.DDC_DELAY)
+        return self.contrast
+
+    def set_power_mode(self, mode):
+        time.sleep(self.DDC_DELAY)
+        self.power = 'on' if mode == 'on' else 'off'
+        return True
+
+    def set_luminance(self, value):
+        time.sleep(self.DDC_DELAY)
+        self.luminance = value
+        return True
+
+    def set_contrast(self, value):
+        time.sleep(self.DDC_DELAY)
+        self.contrast = value
+        return True
+
+
+class StubSensorReader:
+    def read_bmi160_accel(self):
+        return (0.0, 0.0, 9.81)
+
+    def read_veml7700_light(self):
+        return 100
+
+    def close(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class StubApp(CombinedApp):
+    # CombinedApp with all of its routes, caches and the ingest queue, on stub hardware
+    monitor_controller_class = StubMonitorController
+    sensor_reader_class = StubSensorReader
+
+
+class StubViewer:
+    '''
+    Stands in for ImageViewer without a screen: commands posted by the routes are drained by a thread as the Tk loop would,
+    showing an image only makes it the current image and bumps the canvas generation
+    '''
+
+    COMMAND_INTERVAL = ImageViewer.COMMAND_INTERVAL
+
+    #the thread safe entry points are the real ones
+    post = ImageViewer.post
+    call = ImageViewer.call
+    post_step = ImageViewer.post_step
+    post_parameters = ImageViewer.post_parameters
+    set_image_from_bytes = ImageViewer.set_image_from_bytes
+    set_image_from_base64 = ImageViewer.set_image_from_base64
+
+    def __init__(self, media_manager: MediaManager, screen_height=1080, screen_width=1920):
+        self.media_manager = media_manager
+        self.screen_height = screen_height
+        self.screen_width = screen_width
+        self.commands = CommandQueue()
+        self.frame_cache = FrameCache()
+        self.slideshow_active = True
+        self.idle = False
+        self.parameters = {}
+        self.images_shown = 0
+        self.image_change_callback = None
+        self.state_change_callback = None
+        self.current_image: ImageContainer = media_manager.get_media_by_index(0)
+        self.canvas_frame = (0, np.full((screen_height, screen_width, 3), 64, np.uint8))
+        threading.Thread(target=self._drain_commands, name='stub-viewer', daemon=True).start()
+
+    @property
+    def current_image_name(self):
+        if self.current_image is None:
+            return ''
+        return self.current_image.filename
+
+    @property
+    def state(self):
+        return {'slideshow_active': self.slideshow_active, 'idle': self.idle}
+
+    def _drain_commands(self):
+        while True:
+            self.commands.drain()
+            time.sleep(self.COMMAND_INTERVAL / 1000)
+
+    def show(self, media: ImageContainer):
+        self.current_image = media
+        self.images_shown += 1
+        generation, frame = self.canvas_frame
+        self.canvas_frame = (generation + 1, frame)
+        if self.image_change_callback is not None:
+            self.image_change_callback(media.filename)
+
+    def step_images(self, step: int):
+        media = None
+        for _ in range(abs(step)):
+            media = self.media_manager.get_next_media() if step > 0 else self.media_manager.get_prev_media()
+        if media is not None:
+            self.show(media)
+
+    def select_image(self, image_name: str):
+        media = self.media_manager.get_media_by_filename(image_name)
+        if media is not None:
+            self.show(media)
+
+    def show_remote_image(self, remote_image: ImageContainer):
+        self.show(remote_image)
+
+    def set_image(self, image: np.ndarray, title: str = 'plex_image'):
+        self.show(ImageContainer().from_image(image, filename=title))
+
+    def set_image_from_path(self, path: str):
+        pass
+
+    def update_parameters(self, **parameters):
+        self.parameters.update(parameters)
+
+    def play_slideshow(self, event=None):
+        self.slideshow_active = True
+
+    def pause_slideshow(self, event=None):
+        self.slideshow_active = False
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+from animated_image import AnimationPlayer, frame_duration, is_animated_file
+
+
+class TestAnimatedImage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'animation.gif')
+        colours = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+        frames = [Image.new('RGB', (40, 30), colour) for colour in colours]
+        frames[0].save(self.path, save_all=True, append_images=frames[1:], duration=[20, 40, 60, 80], loop=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_is_animated_file(self):
+        still = os.path.join(self.directory.name, 'still.gif')
+        Image.new('RGB', (10, 10)).save(still)
+        self.assertTrue(is_animated_file(self.path))
+        self.assertFalse(is_animated_file(still))
+
+    def test_frame_duration_defaults_without_delay(self):
+        image = Image.new('RGB', (1, 1))
+        self.assertEqual(frame_duration(image), 0.1)
+        image.info['duration'] = 40
+        self.assertEqual(frame_duration(image), 0.04)
+
+    def test_frames_are_decoded_lazily_and_bounded(self):
+        player = AnimationPlayer(self.path, 60, 80, 'fill', 0, max_frames=2)
+        player.start()
+        try:
+            frame = player.get_frame()
+            self.assertEqual(frame.shape, (60, 80, 3))
+            self.assertEqual(list(player.frames), [0])
+            self.assertIsNone(player.get_frame())
+
+            while not player.finished:
+                player.get_frame()
+                time.sleep(0.01)
+            self.assertLessEqual(len(player.frames), 2)
+            self.assertEqual(player.durations, {0: 0.02, 1: 0.04, 2: 0.06, 3: 0.08})
+        finally:
+            player.stop()
+
+    def test_late_frames_are_skipped(self):
+        player = AnimationPlayer(self.path, 30, 40, 'fill', 0)
+        player.start()
+        try:
+            player.get_frame()
+            time.sleep(0.07)
+            player.get_frame()
+            self.assertEqual(player.index, 2)
+            self.assertEqual(player.dropped_frames, 1)
+        finally:
+            player.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import requests
+
+from artwork import ArtworkFetcher
+from fake_plex import FakePlexServer, make_poster
+
+
+class TestArtworkFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.plex = FakePlexServer(make_poster(3000, 2000)).start()
+        self.base_url = self.plex.url
+        self.folder = tempfile.TemporaryDirectory()
+        self.fetcher = ArtworkFetcher(self.folder.name)
+
+    def tearDown(self):
+        self.plex.stop()
+        self.folder.cleanup()
+
+    def test_decoded_at_screen_size(self):
+        image = self.fetcher.get(self.base_url, '/library/metadata/1/thumb/1', 720, 960)
+        self.assertEqual(image.shape, (1500, 1000, 3))
+
+    def test_replays_are_not_downloaded_again(self):
+        self.fetcher.get(self.base_url, '/library/metadata/1/thumb/1', 1080, 1920)
+        self.fetcher.get(self.base_url, '/library/metadata/1/thumb/1', 1080, 1920)
+        self.assertEqual(len(self.plex.requests), 1)
+
+        # a new fetcher finds the poster on disk
+        fetcher = ArtworkFetcher(self.folder.name)
+        fetcher.get(self.base_url, '/library/metadata/1/thumb/1', 720, 1280)
+        self.assertEqual(len(self.plex.requests), 1)
+
+    def test_disk_cache_is_bounded(self):
+        fetcher = ArtworkFetcher(self.folder.name, max_disk_bytes=len(self.plex.poster) * 2)
+        for index in range(4):
+            fetcher.get(self.base_url, f'/library/metadata/{index}/thumb/1', 1080, 1920)
+        self.assertEqual(len(os.listdir(self.folder.name)), 2)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(requests.RequestException):
+            self.fetcher.get(self.base_url, '/missing/thumb/1', 1080, 1920)
+        with self.assertRaises(requests.RequestException):
+            self.fetcher.get('http://127.0.0.1:9', '/library/metadata/1/thumb/1', 1080, 1920)
+
+
+if __name__ == '__main__':
+    unittest.main()
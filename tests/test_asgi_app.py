@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import unittest
+
+from asgi_app import AsgiAdapter
+
+
+def make_receive(body_chunks):
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': index < len(body_chunks) - 1}
+                for index, chunk in enumerate(body_chunks)]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        #the client stays connected until the response is done
+        await asyncio.sleep(3600)
+    return receive
+
+
+def call(adapter, method='GET', path='/', query=b'', body_chunks=(b'',), headers=()):
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': list(headers), 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(adapter(scope, make_receive(list(body_chunks)), send))
+    return sent
+
+
+class TestAsgiAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def wsgi_app(environ, start_response):
+            self.calls.append((environ, threading.current_thread().name))
+            body = environ['wsgi.input'].read()
+            start_response('201 Created', [('Content-Type', 'text/plain'), ('X-Echo', environ.get('HTTP_X_ECHO', ''))])
+            return [environ['PATH_INFO'].encode(), b'?', environ['QUERY_STRING'].encode(), b':', body]
+
+        self.adapter = AsgiAdapter(wsgi_app, cpu_routes=('/canvas',), io_workers=2, cpu_workers=1)
+
+    def tearDown(self):
+        self.adapter.shutdown()
+
+    def test_response_is_passed_through(self):
+        sent = call(self.adapter, 'POST', '/upload', b'a=1', body_chunks=(b'hello ', b'world'),
+                    headers=[(b'x-echo', b'yes'), (b'content-type', b'text/plain')])
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'x-echo', b'yes'), sent[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertEqual(body, b'/upload?a=1:hello world')
+        self.assertFalse(sent[-1].get('more_body', False))
+        self.assertEqual(self.calls[0][0]['CONTENT_TYPE'], 'text/plain')
+
+    def test_routes_run_on_their_pool(self):
+        call(self.adapter, path='/canvas')
+        call(self.adapter, path='/thumbnails/a.jpg')
+        self.assertTrue(self.calls[0][1].startswith('asgi-cpu'))
+        self.assertTrue(self.calls[1][1].startswith('asgi-io'))
+
+    def test_native_route_bypasses_wsgi(self):
+        async def native(adapter, scope, receive, send):
+            await adapter.send_text(send, 200, 'native')
+        self.adapter.native_routes['/canvas/stream'] = native
+        sent = call(self.adapter, path='/canvas/stream')
+        self.assertEqual(sent[1]['body'], b'native')
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+
+from canvas_cache import EncodedCanvasCache
+
+
+class TestEncodedCanvasCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = EncodedCanvasCache(max_variants=2)
+        self.image = np.zeros((90, 160, 3), dtype=np.uint8)
+
+    def test_same_generation_is_cached(self):
+        first = self.cache.get(1, self.image)
+        second = self.cache.get(1, self.image)
+        self.assertIs(first, second)
+
+    def test_new_generation_changes_etag(self):
+        first = self.cache.get(1, self.image)
+        second = self.cache.get(2, self.image)
+        self.assertNotEqual(first.etag, second.etag)
+
+    def test_variants_are_cached_separately(self):
+        full = self.cache.get(1, self.image)
+        small = self.cache.get(1, self.image, width=80, quality=50)
+        self.assertNotEqual(full.etag, small.etag)
+        self.assertIs(small, self.cache.get(1, self.image, width=80, quality=50))
+
+    def test_width_is_clamped_to_the_canvas(self):
+        self.assertEqual(self.cache.normalise(self.image, width=4000, quality=500), (160, 100))
+
+    def test_variants_are_bounded(self):
+        for width in (40, 60, 80):
+            self.cache.get(1, self.image, width=width)
+        self.assertEqual(len(self.cache.variants), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import time
+import unittest
+
+import numpy as np
+
+from canvas_stream import CanvasStreamer, StreamClient
+
+
+class TestCanvasStream(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = (1, np.zeros((48, 64, 3), dtype=np.uint8))
+        self.encodes = 0
+        self.streamer = CanvasStreamer(lambda: self.frame, max_fps=50, quality=80)
+        encode = self.streamer.encode
+
+        def counting_encode(image):
+            self.encodes += 1
+            return encode(image)
+        self.streamer.encode = counting_encode
+
+    def tearDown(self):
+        self.streamer.stop()
+
+    def test_encode_is_multipart_jpeg(self):
+        chunk = CanvasStreamer(lambda: None).encode(self.frame[1])
+        self.assertTrue(chunk.startswith(b'--frame\r\nContent-Type: image/jpeg\r\n'))
+        self.assertIn(b'\xff\xd8', chunk)
+
+    def test_same_generation_is_encoded_once_for_all_clients(self):
+        first = self.streamer.add_client()
+        second = self.streamer.add_client()
+        time.sleep(0.3)
+        self.assertEqual(self.encodes, 1)
+        self.assertEqual(first.queue.get(timeout=1), second.queue.get(timeout=1))
+
+    def test_no_work_without_clients(self):
+        reads = []
+        streamer = CanvasStreamer(lambda: reads.append(1) or self.frame, max_fps=50)
+        self.addCleanup(streamer.stop)
+        streamer.remove_client(streamer.add_client())
+        time.sleep(0.1)
+        count = len(reads)
+        time.sleep(0.3)
+        self.assertEqual(len(reads), count)
+        #the encoder thread is parked on the event, not ticking at max_fps
+        self.assertTrue(streamer.running)
+        self.assertFalse(streamer.has_clients.is_set())
+
+        #a new client wakes the encoder again
+        self.frame = (2, self.frame[1])
+        client = streamer.add_client()
+        self.assertTrue(client.queue.get(timeout=1).startswith(b'--frame'))
+
+    def test_slow_client_is_dropped(self):
+        client = StreamClient(max_pending=1)
+        self.assertTrue(client.send(b'a'))
+        self.assertFalse(client.send(b'b'))
+        self.assertTrue(client.dropped)
+
+    def test_quality_adapts_to_encode_time(self):
+        self.streamer.adapt_quality(encode_time=1.0, frame_budget=0.1, dropped=False)
+        self.assertEqual(self.streamer.quality, 70)
+        self.streamer.adapt_quality(encode_time=0.0, frame_budget=0.1, dropped=False)
+        self.assertEqual(self.streamer.quality, 72)
+        for _ in range(20):
+            self.streamer.adapt_quality(encode_time=1.0, frame_budget=0.1, dropped=True)
+        self.assertEqual(self.streamer.quality, self.streamer.min_quality)
+
+
+if __name__ == '__main__':
+    unittest.main()
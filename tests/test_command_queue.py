@@ -0,0 +1,86 @@
+import threading
+import unittest
+
+from command_queue import CommandQueue, merge_kwargs, sum_steps
+
+
+class TestCommandQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = CommandQueue()
+        self.calls = []
+
+    def step(self, count):
+        self.calls.append(('step', count))
+
+    def select(self, name):
+        self.calls.append(('select', name))
+
+    def update(self, **parameters):
+        self.calls.append(('update', parameters))
+
+    def test_commands_run_in_order_on_drain(self):
+        self.queue.post(self.select, 'a.jpg')
+        self.queue.post(self.update, rotation=90)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.queue.drain(), 2)
+        self.assertEqual(self.calls, [('select', 'a.jpg'), ('update', {'rotation': 90})])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_burst_of_steps_is_one_command(self):
+        for _ in range(10):
+            self.queue.post(self.step, 1, key='show', merge=sum_steps)
+        self.queue.post(self.step, -1, key='show', merge=sum_steps)
+        self.queue.drain()
+        self.assertEqual(self.calls, [('step', 9)])
+        self.assertEqual(self.queue.coalesced, 10)
+
+    def test_newer_command_supersedes_older(self):
+        self.queue.post(self.step, 1, key='show', merge=sum_steps)
+        self.queue.post(self.select, 'b.jpg', key='show', merge=sum_steps)
+        self.queue.drain()
+        self.assertEqual(self.calls, [('select', 'b.jpg')])
+
+    def test_parameters_are_merged(self):
+        self.queue.post(self.update, key='parameters', merge=merge_kwargs, rotation=90, scale_mode='fit')
+        self.queue.post(self.update, key='parameters', merge=merge_kwargs, rotation=180)
+        self.queue.drain()
+        self.assertEqual(self.calls, [('update', {'rotation': 180, 'scale_mode': 'fit'})])
+
+    def test_failing_command_does_not_stop_the_rest(self):
+        self.queue.post(lambda: 1 / 0)
+        self.queue.post(self.select, 'c.jpg')
+        self.assertEqual(self.queue.drain(), 2)
+        self.assertEqual(self.calls, [('select', 'c.jpg')])
+
+    def test_call_returns_the_result_once_drained(self):
+        future = self.queue.call(lambda name: name.upper(), 'd.jpg')
+        failing = self.queue.call(lambda: 1 / 0)
+        self.assertFalse(future.done())
+        self.queue.drain()
+        self.assertEqual(future.result(timeout=0), 'D.JPG')
+        self.assertIsInstance(failing.exception(timeout=0), ZeroDivisionError)
+
+    def test_worker_waits_for_the_call(self):
+        results = []
+        worker = threading.Thread(target=lambda: results.append(self.queue.call(self.select, 'e.jpg').result(timeout=5)))
+        worker.start()
+        while not len(self.queue):
+            pass
+        self.queue.drain()
+        worker.join()
+        self.assertEqual((results, self.calls), ([None], [('select', 'e.jpg')]))
+
+    def test_post_from_many_threads(self):
+        threads = [threading.Thread(target=self.queue.post, args=(self.step, 1), kwargs={'key': 'show', 'merge': sum_steps})
+                   for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.queue.drain()
+        self.assertEqual(self.calls, [('step', 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
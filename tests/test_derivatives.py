@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import cv2
+import numpy as np
+
+from derivatives import DerivativeCache, Variant, parse_variant
+
+
+class TestParseVariant(unittest.TestCase):
+
+    def test_no_size_means_the_original(self):
+        self.assertIsNone(parse_variant({}, 'a.jpg'))
+
+    def test_defaults_follow_the_source(self):
+        self.assertEqual(parse_variant({'w': '600'}, 'a.png'), Variant(600, 0, 'fit', 'png'))
+        self.assertEqual(parse_variant({'w': '600'}, 'a.gif'), Variant(600, 0, 'fit', 'jpg'))
+        self.assertEqual(parse_variant({'w': '', 'h': '300'}, 'a.jpg'), Variant(0, 300, 'fit', 'jpg'))
+
+    def test_bad_values(self):
+        for args in ({'w': 'big'}, {'w': '99999'}, {'w': '10', 'fit': 'stretch'}, {'w': '10', 'fit': 'fill'}, {'w': '10', 'fmt': 'bmp'},
+                     {'w': '0', 'h': '0'}, {'w': '0'}, {'w': '600', 'h': '-1'}):
+            with self.assertRaises(ValueError):
+                parse_variant(args, 'a.jpg')
+
+
+class TestDerivativeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.folder.name, 'images')
+        os.makedirs(self.source)
+        cv2.imwrite(os.path.join(self.source, 'a.jpg'), np.full((400, 800, 3), 128, np.uint8))
+        self.cache = DerivativeCache(self.source, os.path.join(self.folder.name, 'derivatives'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def read(self, name):
+        return cv2.imread(os.path.join(self.cache.cache_folder, name))
+
+    def test_fit_and_fill(self):
+        self.assertEqual(self.read(self.cache.get('a.jpg', Variant(200, 0, 'fit', 'jpg'))).shape[:2], (100, 200))
+        self.assertEqual(self.read(self.cache.get('a.jpg', Variant(100, 100, 'fill', 'png'))).shape[:2], (100, 100))
+        #never made bigger than the original
+        self.assertEqual(self.read(self.cache.get('a.jpg', Variant(1600, 0, 'fit', 'jpg'))).shape[:2], (400, 800))
+
+    def test_concurrent_requests_make_one_copy(self):
+        calls = []
+        generate = self.cache.generate
+
+        def counting_generate(*args):
+            calls.append(args)
+            return generate(*args)
+
+        self.cache.generate = counting_generate
+        threads = [threading.Thread(target=self.cache.get, args=('a.jpg', Variant(300, 0, 'fit', 'jpg'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_least_recently_used_copies_are_removed(self):
+        first = self.cache.get('a.jpg', Variant(300, 0, 'fit', 'png'))
+        self.cache.max_bytes = self.cache.size
+        second = self.cache.get('a.jpg', Variant(200, 0, 'fit', 'png'))
+        self.assertEqual(list(self.cache.files), [second])
+        self.assertFalse(os.path.exists(os.path.join(self.cache.cache_folder, first)))
+
+    def test_missing_and_deleted_files(self):
+        with self.assertRaises(FileNotFoundError):
+            self.cache.get('missing.jpg', Variant(100, 0, 'fit', 'jpg'))
+        name = self.cache.get('a.jpg', Variant(100, 0, 'fit', 'jpg'))
+        self.cache.discard('a.jpg')
+        self.assertEqual(self.cache.size, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.cache.cache_folder, name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,12 @@ class DisplayNowTestCase():
         with open(filename, 'rb') as file:
             response = requests.post(f'{self.host}/display_now', files={'file': file})
             print(response.text)
+
+    #function to send the raw bytes of an image, decoded once by the viewer
+    def post_raw(self, filename):
+        with open(filename, 'rb') as file:
+            response = requests.post(f'{self.host}/display_now', data=file.read(), headers={'Content-Type': 'image/jpeg'})
+            print(response.status_code, response.text)
     
 
 if __name__ == '__main__':
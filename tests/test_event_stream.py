@@ -0,0 +1,52 @@
+import json
+import unittest
+
+from event_stream import EventBroadcaster
+
+
+def parse(chunk):
+    fields = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+class TestEventStream(unittest.TestCase):
+
+    def setUp(self):
+        self.broadcaster = EventBroadcaster(max_pending=4, keepalive_interval=0.01)
+
+    def test_event_is_sent_to_every_client(self):
+        first = self.broadcaster.add_client()
+        second = self.broadcaster.add_client()
+        self.broadcaster.publish('current_image', {'filename': 'a.jpg'})
+        for client in (first, second):
+            self.assertEqual(client.queue.get_nowait(), EventBroadcaster.RETRY)
+            self.assertEqual(parse(client.queue.get_nowait()), ('current_image', {'filename': 'a.jpg'}))
+
+    def test_latest_event_of_each_kind_is_replayed(self):
+        self.broadcaster.publish('current_image', {'filename': 'a.jpg'})
+        self.broadcaster.publish('state', {'slideshow_active': True, 'idle': False})
+        self.broadcaster.publish('current_image', {'filename': 'b.jpg'})
+        client = self.broadcaster.add_client()
+        client.queue.get_nowait()
+        events = [parse(client.queue.get_nowait()) for _ in range(client.queue.qsize())]
+        self.assertEqual(events, [('state', {'slideshow_active': True, 'idle': False}),
+                                  ('current_image', {'filename': 'b.jpg'})])
+
+    def test_slow_client_is_dropped(self):
+        client = self.broadcaster.add_client()
+        for index in range(5):
+            self.broadcaster.publish('config', {'frame_interval': index})
+        self.assertTrue(client.dropped)
+        self.assertEqual(self.broadcaster.client_count, 0)
+
+    def test_stream_sends_keepalive_when_idle(self):
+        client = self.broadcaster.add_client()
+        stream = self.broadcaster.stream(client)
+        self.assertEqual(next(stream), EventBroadcaster.RETRY)
+        self.assertEqual(next(stream), EventBroadcaster.KEEPALIVE)
+        stream.close()
+        self.assertEqual(self.broadcaster.client_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
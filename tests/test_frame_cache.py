@@ -0,0 +1,35 @@
+import unittest
+
+from frame_cache import FrameCache
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def test_least_recently_used_frame_is_evicted(self):
+        cache = FrameCache(max_frames=2)
+        first = cache.make_key(1, 1080, 1920, 'fit', 0)
+        second = cache.make_key(2, 1080, 1920, 'fit', 0)
+        third = cache.make_key(3, 1080, 1920, 'fit', 0)
+        cache.put(first, 'first')
+        cache.put(second, 'second')
+        cache.get(first)
+        cache.put(third, 'third')
+        self.assertEqual(cache.get(first), 'first')
+        self.assertIsNone(cache.get(second))
+
+    def test_render_parameters_are_part_of_the_key(self):
+        cache = FrameCache()
+        cache.put(cache.make_key(1, 1080, 1920, 'fit', 0), 'landscape')
+        self.assertIsNone(cache.get(cache.make_key(1, 1920, 1080, 'fit', 90)))
+
+    def test_discard_drops_every_variant_of_a_media(self):
+        cache = FrameCache()
+        cache.put(cache.make_key(1, 1080, 1920, 'fit', 0), 'a')
+        cache.put(cache.make_key(1, 1080, 1920, 'fill', 0), 'b')
+        cache.put(cache.make_key(2, 1080, 1920, 'fit', 0), 'c')
+        cache.discard(1)
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from gallery import GALLERY_FIELDS, MAX_PAGE_SIZE, decode_cursor, encode_cursor, parse_fields, parse_limit
+from image_container import ImageContainer
+from media_manager import MediaManager
+
+
+def make_media(filename, uploaded, orientation):
+    media = ImageContainer()
+    media.filename = filename
+    media.uploaded = uploaded
+    media.orientation = orientation
+    media.file_path = 'images/' + filename
+    return media
+
+
+class TestGalleryHelpers(unittest.TestCase):
+
+    def test_cursor_round_trip(self):
+        key = (1700000000.5, 'a.jpg')
+        self.assertEqual(decode_cursor(encode_cursor(key)), key)
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor')
+
+    def test_fields_and_limit(self):
+        self.assertEqual(parse_fields(None), GALLERY_FIELDS)
+        self.assertEqual(parse_fields('filename, thumbnail,filename'), ('filename', 'thumbnail'))
+        with self.assertRaises(ValueError):
+            parse_fields('filename,secret')
+        self.assertEqual(parse_limit('5000'), MAX_PAGE_SIZE)
+        with self.assertRaises(ValueError):
+            parse_limit('0')
+
+
+class TestMediaManagerPages(unittest.TestCase):
+
+    def setUp(self):
+        self.media_manager = MediaManager('images')
+        self.media_manager.all_media_files.extend([
+            make_media('a.jpg', 1, ImageContainer.Orientation.LANDSCAPE),
+            make_media('b.jpg', 2, ImageContainer.Orientation.PORTRAIT),
+            make_media('c.jpg', 3, ImageContainer.Orientation.LANDSCAPE),
+            make_media('d.jpg', 3, ImageContainer.Orientation.LANDSCAPE),
+        ])
+
+    def walk(self, **kwargs):
+        filenames, after = [], None
+        while True:
+            page, after = self.media_manager.get_page(after=after, limit=2, **kwargs)
+            filenames.extend(media.filename for media in page)
+            if after is None:
+                return filenames
+
+    def test_pages_follow_upload_time(self):
+        self.assertEqual(self.walk(), ['d.jpg', 'c.jpg', 'b.jpg', 'a.jpg'])
+        self.assertEqual(self.walk(newest_first=False), ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg'])
+        self.assertEqual(self.walk(orientation='landscape'), ['d.jpg', 'c.jpg', 'a.jpg'])
+
+    def test_deleting_between_pages_skips_nothing(self):
+        page, after = self.media_manager.get_page(limit=2)
+        self.media_manager.all_media_files.remove(page[0])
+        page, _ = self.media_manager.get_page(after=after, limit=2)
+        self.assertEqual([media.filename for media in page], ['b.jpg', 'a.jpg'])
+
+
+class TestMediaManagerBatch(unittest.TestCase):
+
+    def test_removing_many_files_reports_once(self):
+        media_manager = MediaManager('images')
+        view = media_manager.create_view()
+        media_manager.all_media_files.extend(make_media(f'{index}.jpg', index, ImageContainer.Orientation.LANDSCAPE) for index in range(5))
+        view.filter_media_by_orientation('landscape')
+        changes = []
+        media_manager.media_files_changed_callback = lambda: changes.append(len(media_manager.all_media_files))
+
+        media_manager.remove_media_files(['images/1.jpg', 'images/3.jpg', 'images/missing.jpg'])
+        self.assertEqual(changes, [3])
+        self.assertEqual([media.filename for media in view.all_media_files], ['0.jpg', '2.jpg', '4.jpg'])
+        self.assertEqual([media.filename for media in view.playlist], ['0.jpg', '2.jpg', '4.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
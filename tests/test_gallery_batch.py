@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from stub_app import StubApp, StubViewer
+from config_manager import ConfigManager
+from media_manager import MediaManager
+
+#uploads are stored under uuid names, CombinedApp renames any other file in the folder when it starts
+A = '00000000-0000-4000-8000-00000000000a.jpg'
+B = '00000000-0000-4000-8000-00000000000b.jpg'
+
+
+class TestGalleryBatchRoute(unittest.TestCase):
+    # /gallery/batch of the real app, with the stub viewer and hardware of stub_app.py
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.TemporaryDirectory()
+        os.chdir(self.folder.name)
+        os.mkdir('images')
+        for name in (A, B):
+            cv2.imwrite(os.path.join('images', name), np.full((30, 40, 3), 128, np.uint8))
+
+        config_manager = ConfigManager(os.path.join(self.folder.name, 'config.json'))
+        config_manager.config.update({'mqtt_broker': '127.0.0.1', 'mqtt_port': 9})
+        self.combined = StubApp(config_manager)
+        media_manager = MediaManager('images', 'thumbnails')
+        media_manager.get_media_files()
+        media_manager.create_playlist()
+        self.viewer = StubViewer(media_manager, screen_height=72, screen_width=128)
+        self.combined.slideshow_manager.viewer = self.viewer
+        self.client = self.combined.app.test_client()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def library(self):
+        return sorted(media.filename for media in self.viewer.media_manager.all_media_files)
+
+    def test_delete_reports_deleted_and_missing(self):
+        self.assertEqual(self.library(), [A, B])
+        response = self.client.post('/gallery/batch', json={'action': 'delete', 'filenames': [A, 'gone.jpg']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'action': 'delete', 'deleted': [A], 'missing': ['gone.jpg']})
+        self.assertEqual(self.library(), [B])
+        self.assertFalse(os.path.exists(os.path.join('images', A)))
+
+    def test_body_that_is_not_an_object(self):
+        for body in ([1, 2], 'delete', 3):
+            response = self.client.post('/gallery/batch', json=body)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('JSON object', response.get_json()['error'])
+
+    def test_names_with_a_directory_are_rejected_before_deleting(self):
+        for name in ('../config.json', 'images/' + B, '..'):
+            response = self.client.post('/gallery/batch', json={'action': 'delete', 'filenames': [A, name]})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(name, response.get_json()['error'])
+        self.assertEqual(self.library(), [A, B])
+        self.assertTrue(os.path.exists(os.path.join('images', A)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from config_manager import ConfigManager
+from image_container import ImageContainer
+from image_viewer3 import ImageViewer
+from media_manager import MediaManager
+from remote_playlist import RemoteMediaCache
+
+
+class FakeRoot:
+    # records the callbacks scheduled with after instead of running a Tk loop
+
+    def __init__(self) -> None:
+        self.jobs = {}
+        self.next_id = 0
+
+    def after(self, delay, func):
+        self.next_id += 1
+        self.jobs[self.next_id] = (delay, func)
+        return self.next_id
+
+    def after_cancel(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    def attributes(self, *args):
+        pass
+
+    def config(self, **kwargs):
+        pass
+
+    def geometry(self, geometry):
+        pass
+
+
+class FakeCanvas:
+
+    def create_image(self, *args, **kwargs):
+        return 1
+
+    def itemconfig(self, *args, **kwargs):
+        pass
+
+
+class FakePhoto:
+
+    def __init__(self, image) -> None:
+        self.size = image.size
+        self.pastes = 0
+
+    def paste(self, image):
+        self.pastes += 1
+
+    def width(self):
+        return self.size[0]
+
+    def height(self):
+        return self.size[1]
+
+
+class HeadlessViewer(ImageViewer):
+    # an ImageViewer without a window, the frames are converted and "pasted" into a FakePhoto
+
+    def create_ui(self):
+        self.root = FakeRoot()
+        self.canvas = FakeCanvas()
+        self.screen_width = self.get_setting('screen_width')
+        self.screen_height = self.get_setting('screen_height')
+        self.window_x = self.window_y = 0
+
+
+class ViewerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.images = os.path.join(self.directory.name, 'images')
+        thumbnails = os.path.join(self.directory.name, 'thumbnails')
+        os.mkdir(self.images)
+        os.mkdir(thumbnails)
+        for index, colour in enumerate((50, 150)):
+            cv2.imwrite(os.path.join(self.images, f'{index}.jpg'), np.full((60, 80, 3), colour, np.uint8))
+
+        self.config_manager = ConfigManager(os.path.join(self.directory.name, 'config.json'))
+        self.config_manager.config.update(transition_duration=0, frame_interval=1, media_orientation_filter='both',
+                                          display_mode='windowed', ken_burns=False)
+        self.media_manager = MediaManager(self.images, thumbnails)
+        self.media_manager.get_media_files()
+        self.media_manager.all_media_files.sort(key=lambda media: media.filename)
+        self.media_manager.create_playlist()
+
+        patcher = mock.patch('image_viewer3.ImageTk.PhotoImage', FakePhoto)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.viewer = HeadlessViewer(self.config_manager, self.media_manager,
+                                     display_config={'screen_width': 40, 'screen_height': 30})
+        self.announced = []
+        self.viewer.image_change_callback = self.announced.append
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scheduled_delays(self):
+        return sorted(delay for delay, _ in self.viewer.root.jobs.values())
+
+
+class TestRemoteImagesAreSkipped(ViewerTestCase):
+
+    def add_remote_image(self):
+        cache = RemoteMediaCache(os.path.join(self.directory.name, 'remote'), None)
+        self.media_manager.set_remote_media([ImageContainer().from_url('http://nas/remote.jpg', cache=cache)])
+
+    def test_a_remote_image_not_downloaded_is_skipped_straight_away(self):
+        self.add_remote_image()
+        self.assertEqual(self.viewer.current_image_name, '0.jpg')
+
+        self.viewer.show_next_image()
+        self.viewer.show_next_image()
+        self.assertEqual(self.viewer.current_image_name, '0.jpg')
+        self.assertEqual(self.announced, ['1.jpg', '0.jpg'])
+        self.assertEqual(self.scheduled_delays(), [1000])
+
+    def test_nothing_available_keeps_the_screen_and_retries_later(self):
+        self.media_manager.all_media_files.clear()
+        self.add_remote_image()
+        frame = self.viewer.canvas_image
+        self.viewer.show_previous_image()
+        self.assertIs(self.viewer.canvas_image, frame)
+        self.assertEqual(self.announced, [])
+        self.assertEqual(self.scheduled_delays(), [1000])
+
+
+class TestUnchangedFramesAreSkipped(ViewerTestCase):
+
+    def test_reprocessing_with_the_same_parameters_keeps_the_array(self):
+        media = self.media_manager.all_media_files[0]
+        frame = media.get_processed_for(30, 40, 'fit', 0)
+        media.process_image(30, 40, 'fit', 0)
+        self.assertIs(media.processed_image, frame)
+
+    def test_a_setting_giving_the_same_frame_is_not_faded(self):
+        #the images have the aspect ratio of the screen, so fill and fit make the same frame
+        frame = self.viewer.canvas_image
+        pastes = self.viewer.photo.pastes
+        self.viewer.scale_mode = 'fill'
+        self.assertIs(self.viewer.canvas_image, frame)
+        self.assertFalse(self.viewer.fade_in_progress)
+        self.assertEqual(self.viewer.photo.pastes, pastes)
+
+    def test_the_frame_on_screen_is_not_pasted_again(self):
+        pastes = self.viewer.photo.pastes
+        self.viewer.update_canvas()
+        self.assertEqual(self.viewer.photo.pastes, pastes)
+        #an equal frame that is a different array is still pasted, only the identity is checked
+        self.viewer.canvas_image = self.viewer.canvas_image.copy()
+        self.viewer.update_canvas()
+        self.assertEqual(self.viewer.photo.pastes, pastes + 1)
+
+
+class TestIdle(ViewerTestCase):
+
+    def test_enter_idle_pauses_and_releases_the_frames(self):
+        self.viewer.play_slideshow()
+        states = []
+        self.viewer.state_change_callback = states.append
+        frame = self.viewer.canvas_image
+        self.assertGreater(len(self.viewer.frame_cache), 0)
+
+        self.viewer.enter_idle()
+        self.assertTrue(self.viewer.idle)
+        self.assertFalse(self.viewer.slideshow_active)
+        self.assertEqual(len(self.viewer.frame_cache), 0)
+        self.assertTrue(all(media.processed_image is None for media in self.media_manager.all_media_files))
+        #the last frame is still there for the web interface
+        self.assertIs(self.viewer.canvas_image, frame)
+        self.assertEqual(states, [{'slideshow_active': False, 'idle': True}])
+
+    def test_exit_idle_only_resumes_a_slideshow_that_was_playing(self):
+        self.viewer.play_slideshow()
+        self.viewer.enter_idle()
+        states = []
+        self.viewer.state_change_callback = states.append
+        self.viewer.exit_idle()
+        self.assertFalse(self.viewer.idle)
+        self.assertTrue(self.viewer.slideshow_active)
+        self.assertEqual(states, [{'slideshow_active': True, 'idle': False}])
+
+        self.viewer.pause_slideshow()
+        self.viewer.enter_idle()
+        self.viewer.exit_idle()
+        self.assertFalse(self.viewer.idle)
+        self.assertFalse(self.viewer.slideshow_active)
+
+    def test_prewarm_processes_the_upcoming_images_once(self):
+        self.viewer.enter_idle()
+        self.viewer.prewarm(count=1)
+        self.assertEqual(len(self.viewer.frame_cache), 2)
+        self.assertTrue(all(media.processed_image is not None for media in self.media_manager.all_media_files))
+
+        misses = self.viewer.frame_cache.misses
+        self.viewer.prewarm(count=1)
+        self.assertEqual(self.viewer.frame_cache.misses, misses)
+
+        #going idle again forgets the prewarm
+        self.viewer.exit_idle()
+        self.viewer.enter_idle()
+        self.viewer.prewarm(count=1)
+        self.assertEqual(self.viewer.frame_cache.misses, misses + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from ingest import IngestItem, IngestQueue, staged_name, staging_suffix
+
+
+class TestIngestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.finished = threading.Event()
+
+        def process(item):
+            self.release.wait(timeout=5)
+            if item.name == 'broken.jpg':
+                raise ValueError('not an image')
+            return 'library-' + item.name
+
+        self.queue = IngestQueue(process, workers=2, max_queued=3)
+        self.queue.job_finished_callback = lambda job: self.finished.set()
+
+    def test_job_reports_progress_until_done(self):
+        job = self.queue.submit([IngestItem('a.jpg', path='a'), IngestItem('broken.jpg', path='b')])
+        self.assertIs(self.queue.get(job.id), job)
+        self.assertIn(job.to_dict()['status'], ('queued', 'processing'))
+
+        self.release.set()
+        self.assertTrue(self.finished.wait(timeout=5))
+        status = job.to_dict()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual((status['total'], status['completed'], status['failed']), (2, 2, 1))
+        self.assertEqual(status['items'][0]['filename'], 'library-a.jpg')
+        self.assertEqual(status['items'][1]['error'], 'not an image')
+
+    def test_full_queue_refuses_new_jobs(self):
+        with self.assertRaises(OverflowError):
+            self.queue.submit([IngestItem(f'{index}.jpg') for index in range(4)])
+        job = self.queue.submit([IngestItem(f'{index}.jpg') for index in range(3)])
+        self.assertEqual(job.to_dict()['total'], 3)
+        self.release.set()
+
+    def test_staged_files_can_bypass_the_limit(self):
+        job = self.queue.submit([IngestItem(f'{index}.jpg', path=str(index)) for index in range(5)], check_limit=False)
+        self.assertEqual(job.to_dict()['total'], 5)
+        self.release.set()
+
+    def test_staged_names_keep_the_uploaded_name(self):
+        suffix = staging_suffix('../My photo.jpg')
+        self.assertEqual(suffix, '~My_photo.jpg.part')
+        self.assertEqual(staged_name('incoming/tmpab12cd' + suffix[:-len('.part')]), 'My_photo.jpg')
+        self.assertEqual(staged_name('incoming/tmpab12cd.jpg'), 'tmpab12cd.jpg')
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.queue.get('missing'))
+
+
+class TestIngestQueueDownloads(unittest.TestCase):
+
+    def setUp(self):
+        self.downloading = 0
+        self.most_downloading = 0
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.queue = IngestQueue(lambda item: 'library-' + item.name, workers=1, fetch=self.fetch, fetch_workers=3)
+        self.queue.job_finished_callback = lambda job: self.finished.set()
+
+    def fetch(self, item):
+        with self.lock:
+            self.downloading += 1
+            self.most_downloading = max(self.most_downloading, self.downloading)
+        time.sleep(0.1)
+        with self.lock:
+            self.downloading -= 1
+        if 'missing' in item.url:
+            raise ValueError('404')
+        item.path, item.name = 'staged', item.url.rsplit('/', 1)[-1]
+
+    def test_urls_are_downloaded_concurrently_then_ingested(self):
+        items = [IngestItem(f'{index}.jpg', url=f'http://nas/{index}.jpg') for index in range(3)]
+        job = self.queue.submit(items + [IngestItem('missing.jpg', url='http://nas/missing.jpg'), IngestItem('a.jpg', path='a')])
+        self.assertTrue(self.finished.wait(timeout=5))
+        self.assertEqual(self.most_downloading, 3)
+        status = job.to_dict()
+        self.assertEqual((status['total'], status['completed'], status['failed']), (5, 5, 1))
+        self.assertEqual([item['filename'] for item in status['items']],
+                         ['library-0.jpg', 'library-1.jpg', 'library-2.jpg', None, 'library-a.jpg'])
+        self.assertEqual(self.queue.pending, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
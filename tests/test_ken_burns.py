@@ -0,0 +1,51 @@
+import random
+import unittest
+
+import numpy as np
+
+from ken_burns import KenBurns
+
+
+class TestKenBurns(unittest.TestCase):
+
+    def setUp(self):
+        #an oversampled frame at 1.5 times a 40x60 screen, with a horizontal gradient to tell positions apart
+        gradient = np.tile(np.arange(90, dtype=np.uint8), (60, 1))
+        self.source = np.dstack([gradient] * 3)
+        self.ken_burns = KenBurns(self.source, 40, 60, duration=10, rng=random.Random(1))
+
+    def test_published_frames_are_never_overwritten(self):
+        first = self.ken_burns.render(0, 0, 90)
+        published = first.copy()
+        frames = [self.ken_burns.render(30, 0, 60) for _ in range(3)]
+        self.assertEqual(first.shape, (40, 60, 3))
+        self.assertTrue(all(frame is not first for frame in frames))
+        self.assertTrue(np.array_equal(first, published))
+
+    def test_whole_window_shows_the_whole_source(self):
+        frame = self.ken_burns.render(0, 0, 90)
+        self.assertEqual(int(frame[0, 0, 0]), 0)
+        self.assertGreaterEqual(int(frame[0, -1, 0]), 87)
+
+    def test_window_moves_between_start_and_end(self):
+        start, end = self.ken_burns.windows
+        self.assertEqual(self.ken_burns.window_at(0), start)
+        self.assertEqual(self.ken_burns.window_at(1), end)
+        self.assertIn(90.0, (start[2], end[2]))
+        self.assertIn(60.0, (start[2], end[2]))
+
+    def test_restart_reverses_the_pan(self):
+        start, end = self.ken_burns.windows
+        self.ken_burns.start()
+        self.ken_burns.restart()
+        self.assertEqual(self.ken_burns.windows, (end, start))
+
+    def test_frames_are_paced(self):
+        self.ken_burns.start()
+        self.assertIsNotNone(self.ken_burns.get_frame())
+        self.assertIsNone(self.ken_burns.get_frame())
+        self.assertFalse(self.ken_burns.finished)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        self.registry.inc('things_total')
+        self.registry.inc('things_total', 2)
+        self.assertEqual(self.registry.snapshot()['things_total'], 3)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('render_seconds', buckets=(0.1, 1.0), stage='resize')
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+        text = self.registry.render_prometheus()
+        self.assertIn('# TYPE digital_canvas_render_seconds histogram', text)
+        self.assertIn('digital_canvas_render_seconds_bucket{stage="resize",le="0.1"} 1', text)
+        self.assertIn('digital_canvas_render_seconds_bucket{stage="resize",le="1.0"} 2', text)
+        self.assertIn('digital_canvas_render_seconds_bucket{stage="resize",le="+Inf"} 3', text)
+        self.assertIn('digital_canvas_render_seconds_count{stage="resize"} 3', text)
+
+    def test_timer_records_into_labelled_histogram(self):
+        with self.registry.timer('render_seconds', stage='blend'):
+            pass
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['render_seconds.blend']['count'], 1)
+
+    def test_gauge_goes_up_and_down(self):
+        gauge = self.registry.gauge('requests_in_flight', route='/')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertIn('# TYPE digital_canvas_requests_in_flight gauge', self.registry.render_prometheus())
+        self.assertEqual(self.registry.snapshot()['requests_in_flight./'], 1)
+
+    def test_label_values_are_escaped(self):
+        self.registry.inc('plex_events_total', event='media.play"\n{x}\\')
+        self.assertIn('digital_canvas_plex_events_total{event="media.play\\"\\n{x}\\\\"} 1',
+                      self.registry.render_prometheus())
+
+
+if __name__ == '__main__':
+    unittest.main()
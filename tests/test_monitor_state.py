@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+
+from monitor_state import MonitorState
+
+
+class SlowMonitor:
+    # answers like MonitorController, but only once release is set
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.reads = 0
+        self.luminance = 40
+
+    def get_power_mode(self):
+        self.reads += 1
+        self.release.wait(timeout=5)
+        return 'on'
+
+    def get_luminance(self):
+        self.reads += 1
+        self.release.wait(timeout=5)
+        return self.luminance
+
+    def get_contrast(self):
+        self.reads += 1
+        self.release.wait(timeout=5)
+        return 50
+
+    def set_luminance(self, value):
+        self.luminance = value
+        return True
+
+    def set_power_mode(self, mode):
+        #like MonitorController when no monitor was detected
+        return False
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMonitorState(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = SlowMonitor()
+        self.state = MonitorState(self.monitor, ttls={'brightness': 60})
+        self.addCleanup(self.state.stop)
+
+    def test_reads_never_wait_for_the_monitor(self):
+        self.state.start()
+        started = time.time()
+        self.assertEqual(self.state.get_luminance(), -1)
+        self.assertLess(time.time() - started, 0.5)
+
+        self.monitor.release.set()
+        self.assertTrue(wait_for(lambda: self.state.get_luminance() == 40))
+
+    def test_reads_only_come_from_the_cache(self):
+        for _ in range(10):
+            self.state.get_contrast()
+        self.assertEqual(self.monitor.reads, 0)
+
+        self.state.start()
+        self.monitor.release.set()
+        self.assertTrue(wait_for(lambda: self.state.get_contrast() == 50))
+        for _ in range(10):
+            self.state.get_luminance()
+        self.assertEqual(self.monitor.reads, 3)
+
+    def test_expired_values_are_read_again_in_the_background(self):
+        self.state.ttls['brightness'] = 0.1
+        self.monitor.release.set()
+        self.state.start()
+        self.assertTrue(wait_for(lambda: self.state.get_luminance() == 40))
+        self.monitor.luminance = 10
+        self.assertTrue(wait_for(lambda: self.state.get_luminance() == 10))
+
+    def test_writes_update_the_cache(self):
+        self.state.set_luminance(75)
+        self.assertEqual(self.state.get_luminance(), 75)
+        self.assertEqual(self.monitor.reads, 0)
+
+    def test_writes_the_monitor_refused_are_not_cached(self):
+        self.assertFalse(self.state.set_power_mode('off'))
+        self.assertEqual(self.state.get_power_mode(), 'on')
+
+    def test_a_refresh_never_overwrites_a_newer_write(self):
+        #the refresh thread is slow to store what it read, a write gets in between if the bus is free
+        store = self.state.set
+        def slow_set(key, value):
+            if threading.current_thread().name.startswith('monitor-'):
+                time.sleep(0.1)
+            store(key, value)
+        self.state.set = slow_set
+
+        refresh = threading.Thread(target=self.state.refresh, args=('brightness',), name='monitor-state')
+        refresh.start()
+        self.assertTrue(wait_for(lambda: self.monitor.reads == 1))
+        #the refresh has read the old value off the bus, the write waits for the bus
+        writer = threading.Thread(target=self.state.set_luminance, args=(75,))
+        writer.start()
+        time.sleep(0.05)
+        self.monitor.release.set()
+        writer.join(timeout=2)
+        refresh.join(timeout=2)
+        self.assertEqual(self.state.get_luminance(), 75)
+
+
+if __name__ == '__main__':
+    unittest.main()
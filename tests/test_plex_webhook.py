@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from stub_app import StubApp, StubViewer
+from config_manager import ConfigManager
+from fake_plex import FakePlexServer, make_poster, webhook_payload
+from media_manager import MediaManager
+from plex_webhook import PlexWebhookQueue, session_key
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestPlexWebhookQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.handled = []
+        self.queue = PlexWebhookQueue(lambda event, is_current: self.handled.append(event), coalesce_delay=0.1, max_delay=0.5)
+
+    def test_submit_returns_straight_away(self):
+        started = time.time()
+        self.assertTrue(self.queue.submit(webhook_payload('media.play'), '127.0.0.1'))
+        self.assertLess(time.time() - started, 0.05)
+        self.assertTrue(wait_for(lambda: len(self.handled) == 1))
+
+    def test_bursts_of_a_session_are_coalesced(self):
+        for event in ('media.play', 'media.pause', 'media.resume'):
+            self.queue.submit(webhook_payload(event, session='a'), '127.0.0.1')
+        self.queue.submit(webhook_payload('media.stop', session='b'), '127.0.0.1')
+        self.assertTrue(wait_for(lambda: len(self.handled) == 2))
+        time.sleep(0.2)
+        self.assertEqual(sorted((event.session, event.event) for event in self.handled), [('a', 'media.resume'), ('b', 'media.stop')])
+
+    def test_session_of_a_malformed_player(self):
+        self.assertEqual(session_key({'Player': 'living room'}), 'default')
+        self.assertEqual(session_key({'Player': {'uuid': 'a'}}), 'a')
+
+    def test_other_events_are_ignored(self):
+        self.assertFalse(self.queue.submit(webhook_payload('media.scrobble'), '127.0.0.1'))
+        time.sleep(0.2)
+        self.assertEqual(self.handled, [])
+
+
+class TestPlexHookRoute(unittest.TestCase):
+    # /plex_hook and CombinedApp.handle_plex_event of the real app, with the stub viewer and hardware of stub_app.py
+
+    def setUp(self):
+        self.plex = FakePlexServer(make_poster(600, 400), delay=0.5).start()
+        self.cwd = os.getcwd()
+        self.folder = tempfile.TemporaryDirectory()
+        os.chdir(self.folder.name)
+        os.mkdir('images')
+
+        config_manager = ConfigManager(os.path.join(self.folder.name, 'config.json'))
+        config_manager.config.update({'mqtt_broker': '127.0.0.1', 'mqtt_port': 9, 'plex_port': self.plex.port,
+                                      'pause_when_plex_playing': True})
+        self.combined = StubApp(config_manager)
+        self.combined.plex_webhooks.coalesce_delay = 0.05
+        self.viewer = StubViewer(MediaManager('images', 'thumbnails'), screen_height=72, screen_width=128)
+        self.combined.slideshow_manager.viewer = self.viewer
+        self.client = self.combined.app.test_client()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.plex.stop()
+        self.folder.cleanup()
+
+    def post(self, payload):
+        # Plex posts a multipart form with the JSON in the payload field
+        return self.client.post('/plex_hook', data={'payload': payload}, content_type='multipart/form-data')
+
+    def test_hook_is_acknowledged_before_the_poster_is_fetched(self):
+        started = time.time()
+        response = self.post(json.dumps(webhook_payload('media.play')))
+        self.assertLess(time.time() - started, 0.3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'success': True, 'queued': True})
+
+        self.assertTrue(wait_for(lambda: self.viewer.current_image_name == 'A Movie'))
+        self.assertFalse(self.viewer.slideshow_active)
+
+    def test_malformed_and_ignored_payloads(self):
+        self.assertEqual(self.post('not json').status_code, 400)
+        self.assertEqual(self.post('[1, 2]').status_code, 400)
+        self.assertEqual(self.client.post('/plex_hook', data=b'{}').status_code, 400)
+
+        scrobble = self.post(json.dumps(webhook_payload('media.scrobble')))
+        self.assertEqual(scrobble.status_code, 200)
+        self.assertEqual(scrobble.get_json()['queued'], False)
+
+        odd_player = self.post(json.dumps({**webhook_payload('media.stop'), 'Player': 'living room'}))
+        self.assertEqual(odd_player.status_code, 200)
+
+    def test_a_poster_fetched_after_a_pause_is_dropped(self):
+        self.viewer.slideshow_active = False
+        self.post(json.dumps(webhook_payload('media.play')))
+        self.assertTrue(wait_for(lambda: len(self.plex.requests) == 1))
+        self.post(json.dumps(webhook_payload('media.pause')))
+        self.assertTrue(wait_for(lambda: self.viewer.slideshow_active))
+        time.sleep(0.6)
+        self.assertEqual(self.viewer.images_shown, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from remote_fetch import parse_urls, RemoteDownloader, sniff_extension
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 1000
+
+
+class RemoteHandler(BaseHTTPRequestHandler):
+    # /photo.jpg, /page.html, /octet, /huge (announces its length), /endless (doesn't) and /slow
+
+    def do_GET(self):
+        if self.path == '/page.html':
+            self.reply(b'<html></html>', 'text/html')
+        elif self.path == '/octet':
+            self.reply(JPEG, 'application/octet-stream')
+        elif self.path == '/huge':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(100 * 1024 * 1024))
+            self.end_headers()
+        elif self.path in ('/endless', '/slow'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.end_headers()
+            try:
+                for _ in range(200 if self.path == '/endless' else 40):
+                    self.wfile.write(JPEG)
+                    self.wfile.flush()
+                    if self.path == '/slow':
+                        time.sleep(0.05)
+            except OSError:
+                pass
+        else:
+            self.reply(JPEG, 'image/jpeg')
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRemoteDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RemoteHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.folder = tempfile.TemporaryDirectory()
+        self.downloader = RemoteDownloader(self.folder.name, max_bytes=64 * 1024, max_seconds=1)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def test_download_is_staged_with_its_name(self):
+        path, name = self.downloader.download(self.url + '/photo.jpg')
+        self.assertEqual(name, 'photo.jpg')
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), JPEG)
+
+    def test_generic_types_are_sniffed(self):
+        path, name = self.downloader.download(self.url + '/octet')
+        self.assertEqual(name, 'octet.jpg')
+        self.assertTrue(path.endswith('.jpg'))
+
+    def test_refused_downloads_leave_nothing_behind(self):
+        for path in ('/page.html', '/huge', '/endless', '/slow'):
+            with self.assertRaises((ValueError, TimeoutError)):
+                self.downloader.download(self.url + path)
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+
+class TestRemoteHelpers(unittest.TestCase):
+
+    def test_parse_urls(self):
+        self.assertEqual(parse_urls(['http://a/1.jpg\nhttps://b/2.png', '', 'http://a/1.jpg']), ['http://a/1.jpg', 'https://b/2.png'])
+        with self.assertRaises(ValueError):
+            parse_urls(['file:///etc/passwd'])
+
+    def test_sniff_extension(self):
+        self.assertEqual(sniff_extension(b'RIFF\x00\x00\x00\x00WEBPVP8 '), '.webp')
+        self.assertEqual(sniff_extension(b'\x00\x00\x00\x18ftypmp42'), '.mp4')
+        self.assertIsNone(sniff_extension(b'<html>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
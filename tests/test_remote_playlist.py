@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from image_container import ImageContainer
+from media_manager import MediaManager
+from remote_fetch import RemoteDownloader
+from remote_playlist import parse_index, RemoteMediaCache, RemotePlaylist
+
+
+def encode(height, width) -> bytes:
+    return cv2.imencode('.jpg', np.full((height, width, 3), 128, np.uint8))[1].tobytes()
+
+
+class NasHandler(BaseHTTPRequestHandler):
+    # /index.json lists /photos/0.jpg .. /photos/4.jpg, the odd ones are portrait
+
+    requests = []
+
+    def do_GET(self):
+        NasHandler.requests.append(self.path)
+        if self.path == '/index.json':
+            body, content_type = json.dumps([f'photos/{index}.jpg' for index in range(5)]).encode('utf-8'), 'application/json'
+        elif self.path.startswith('/photos/'):
+            index = int(os.path.splitext(os.path.basename(self.path))[0])
+            body, content_type = encode(300, 200) if index % 2 else encode(200, 300), 'image/jpeg'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRemotePlaylist(unittest.TestCase):
+
+    def setUp(self):
+        NasHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), NasHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = RemoteMediaCache(self.folder.name, RemoteDownloader(self.folder.name))
+        self.media_manager = MediaManager(self.folder.name)
+        self.playlist = RemotePlaylist(self.url + '/index.json', self.cache, prefetch_count=2)
+        self.playlist.media_manager = self.media_manager
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def downloads(self):
+        return [path for path in NasHandler.requests if path.startswith('/photos/')]
+
+    def test_index_is_played_and_prefetched_ahead(self):
+        self.playlist.refresh()
+        self.assertEqual([media.filename for media in self.media_manager.playlist], [f'{index}.jpg' for index in range(5)])
+        self.assertFalse(self.media_manager.playlist[0].exists())
+
+        self.playlist.prefetch()
+        self.assertEqual(self.downloads(), ['/photos/0.jpg', '/photos/1.jpg', '/photos/2.jpg'])
+        media = self.media_manager.playlist[1]
+        self.assertTrue(media.exists())
+        self.assertEqual(media.get_processed_for(100, 100, 'fill', 0).shape, (100, 100, 3))
+
+    def test_unknown_orientations_are_filtered_once_downloaded(self):
+        self.media_manager.filter_media_by_orientation('landscape')
+        self.playlist.refresh()
+        self.assertEqual(len(self.media_manager.playlist), 5)
+        self.playlist.prefetch()
+        self.assertEqual([media.filename for media in self.media_manager.playlist], ['0.jpg', '2.jpg', '3.jpg', '4.jpg'])
+
+    def test_images_not_downloaded_are_skipped_not_fetched(self):
+        self.playlist.refresh()
+        self.assertIsNone(self.media_manager.playlist[4].get_processed_for(100, 100, 'fill', 0))
+        self.assertEqual(self.downloads(), [])
+
+    def test_nothing_is_downloaded_while_idle(self):
+        self.playlist.is_idle = lambda: True
+        self.playlist.refresh()
+        self.playlist.prefetch()
+        self.assertEqual(self.downloads(), [])
+
+    def test_cache_is_bounded_and_reused(self):
+        cache = RemoteMediaCache(self.folder.name, RemoteDownloader(self.folder.name), max_bytes=len(encode(200, 300)) * 2)
+        for index in range(4):
+            cache.fetch(f'{self.url}/photos/{index * 2}.jpg')
+        self.assertEqual(len(os.listdir(self.folder.name)), 2)
+        cache.fetch(f'{self.url}/photos/6.jpg')
+        self.assertEqual(len(self.downloads()), 4)
+
+
+class TestParseIndex(unittest.TestCase):
+
+    def test_entries(self):
+        entries = parse_index({'images': ['a.jpg', {'url': 'http://other/b.jpg', 'width': 20, 'height': 10}, 'a.jpg']},
+                              'http://nas/photos/index.json')
+        self.assertEqual(entries, [('http://nas/photos/a.jpg', None), ('http://other/b.jpg', (20, 10))])
+        with self.assertRaises(ValueError):
+            parse_index({'urls': []}, 'http://nas/')
+
+    def test_size_sets_the_orientation_before_download(self):
+        with tempfile.TemporaryDirectory() as folder:
+            media = ImageContainer().from_url('http://nas/b.jpg', cache=RemoteMediaCache(folder, None), size=(10, 20))
+            self.assertEqual(media.orientation, 'portrait')
+            self.assertFalse(media.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
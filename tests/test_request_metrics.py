@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from werkzeug.routing import Map, Rule
+
+from metrics import metrics
+from request_metrics import UNMATCHED, RequestMetrics
+
+
+def call(app, path):
+    statuses = []
+    body = app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SERVER_NAME': 'canvas', 'SERVER_PORT': '80',
+                'wsgi.url_scheme': 'http'}, lambda status, headers, exc_info=None: statuses.append(status))
+    data = b''.join(body)
+    body.close()
+    return statuses[0], data
+
+
+class TestRequestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+
+        def app(environ, start_response):
+            if environ['PATH_INFO'] == '/plex_hook':
+                self.release.wait(timeout=5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'hello', b' world']
+
+        url_map = Map([Rule('/thumbnails/<filename>'), Rule('/plex_hook')])
+        self.middleware = RequestMetrics(app, url_map, slow_threshold=0.05)
+
+    def test_requests_are_recorded_by_route(self):
+        histogram = metrics.histogram('http_response_bytes', route='/thumbnails/<filename>')
+        count = histogram.count
+        self.assertEqual(call(self.middleware, '/thumbnails/a.jpg'), ('200 OK', b'hello world'))
+        call(self.middleware, '/thumbnails/b.jpg')
+        self.assertEqual(histogram.count, count + 2)
+        self.assertEqual(histogram.sum % 11, 0)
+        self.assertEqual(self.middleware.route_for({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/random', 'SERVER_NAME': 'canvas',
+                                                    'SERVER_PORT': '80', 'wsgi.url_scheme': 'http'}), UNMATCHED)
+
+    def test_in_flight_and_slow_stack_sample(self):
+        #the gauge is process wide, responses of other tests that were never closed still count in it
+        in_flight = metrics.gauge('http_requests_in_flight', route='/plex_hook')
+        baseline = in_flight.value
+        thread = threading.Thread(target=call, args=(self.middleware, '/plex_hook'))
+        thread.start()
+        deadline = time.time() + 2
+        while not self.middleware.slow_requests and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(in_flight.value, baseline + 1)
+        self.release.set()
+        thread.join()
+        self.assertEqual(in_flight.value, baseline)
+
+        sample = self.middleware.slow_requests[0]
+        self.assertEqual(sample['route'], '/plex_hook')
+        self.assertIn('self.release.wait', sample['stack'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from static_cache import BytesCache, ImmutableFileServer
+
+
+class TestBytesCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = BytesCache(max_bytes=10, max_item_bytes=6)
+        cache.put('a', 1, b'aaaa')
+        cache.put('b', 1, b'bbbb')
+        self.assertEqual(cache.get('a', 1), b'aaaa')
+        cache.put('c', 1, b'cccc')
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.size, 8)
+
+    def test_ignores_large_and_stale_items(self):
+        cache = BytesCache(max_bytes=10, max_item_bytes=6)
+        cache.put('a', 1, b'a' * 7)
+        self.assertIsNone(cache.get('a', 1))
+        cache.put('b', 1, b'bb')
+        self.assertIsNone(cache.get('b', 2))
+
+
+class TestImmutableFileServer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.folder.name, 'clip.mp4'), 'wb') as file:
+            file.write(bytes(range(256)) * 4)
+
+        self.server = ImmutableFileServer(self.folder.name, BytesCache())
+        app = Flask(__name__)
+        app.add_url_rule('/uploads/<path:filename>', view_func=self.server.send)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_response_is_immutable_with_strong_etag(self):
+        response = self.client.get('/uploads/clip.mp4')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertFalse(response.headers['ETag'].startswith('W/'))
+
+        revalidated = self.client.get('/uploads/clip.mp4', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_byte_range(self):
+        response = self.client.get('/uploads/clip.mp4', headers={'Range': 'bytes=256-511'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, bytes(range(256)))
+        self.assertEqual(response.headers['Content-Range'], 'bytes 256-511/1024')
+
+    def test_missing_and_escaping_paths(self):
+        self.assertEqual(self.client.get('/uploads/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/uploads/../run.py').status_code, 404)
+
+    def test_relative_folder_is_read_from_the_working_directory(self):
+        # send_file alone would look for it under the app's root_path
+        cwd = os.getcwd()
+        os.chdir(self.folder.name)
+        try:
+            server = ImmutableFileServer('.')
+            app = Flask(__name__)
+            app.add_url_rule('/uploads/<path:filename>', view_func=server.send)
+            response = app.test_client().get('/uploads/clip.mp4')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), 1024)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import datetime
 import unittest
 from PIL import Image
 from utils import *
@@ -129,5 +130,18 @@ class TestUtils(unittest.TestCase):
     def test_check_admin_privileges(self):
         self.assertIsInstance(check_admin_privileges(), bool)
 
+    def test_cv_read_reduced(self):
+        data = cv2.imencode('.jpg', np.zeros((2000, 3000, 3), np.uint8))[1].tobytes()
+        self.assertEqual(cv_read_reduced(data, 480, 640).shape[:2], (1000, 1500))
+        self.assertEqual(cv_read_reduced(data, 1080, 1920).shape[:2], (2000, 3000))
+        self.assertIsNone(cv_read_reduced(b'not an image', 480, 640))
+    def test_seconds_until(self):
+        now = datetime.datetime(2024, 5, 1, 22, 30)
+        self.assertEqual(seconds_until("23:00", now), 30 * 60)
+        #earlier in the day means tomorrow, across midnight
+        self.assertEqual(seconds_until("06:15", now), (7 * 60 + 45) * 60)
+        self.assertEqual(seconds_until("22:30", now), 24 * 60 * 60)
+        self.assertEqual(seconds_until("00:00", datetime.datetime(2024, 12, 31, 23, 59, 30)), 30)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
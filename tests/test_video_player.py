@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from video_player import VideoContainer, VideoPlayer
+
+
+def wait_for(condition, timeout=3):
+    # the first truthy result, the condition may consume what it checks (e.g. get_frame) so it isn't called again
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        if result or time.time() >= deadline:
+            return result
+        time.sleep(0.01)
+
+
+class TestVideoPlayer(unittest.TestCase):
+
+    FRAMES = 10
+
+    def setUp(self):
+        #a 10 frame clip at 20 fps, every frame a different shade to tell them apart
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'clip.avi')
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'MJPG'), 20, (40, 30))
+        for index in range(self.FRAMES):
+            writer.write(np.full((30, 40, 3), index * 25, np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play_through(self, player, timeout=5):
+        # the frames shown while playing the clip to the end
+        frames = []
+        deadline = time.time() + timeout
+        while not player.finished and time.time() < deadline:
+            frame = player.get_frame()
+            if frame is not None:
+                frames.append(frame)
+            time.sleep(0.005)
+        self.assertTrue(player.finished)
+        return frames
+
+    def test_fps_is_known_before_playback(self):
+        player = VideoPlayer(self.path, 60, 80, 'fill', 0)
+        self.assertAlmostEqual(player.fps, 20, places=1)
+        self.assertEqual(player.frame_delay, 50)
+        self.assertEqual(VideoPlayer(self.path, 60, 80, 'fill', 0, fps=10).frame_delay, 100)
+
+    def test_frames_are_rendered_in_order(self):
+        player = VideoPlayer(self.path, 60, 80, 'fill', 0)
+        player.start()
+        try:
+            frames = self.play_through(player)
+            self.assertEqual(frames[0].shape, (60, 80, 3))
+            self.assertEqual(len(frames) + player.dropped_frames, self.FRAMES)
+            shades = [int(frame[30, 40, 0]) for frame in frames]
+            self.assertEqual(shades, sorted(shades))
+        finally:
+            player.stop()
+
+    def test_decoding_waits_for_the_bounded_buffer(self):
+        player = VideoPlayer(self.path, 60, 80, 'fill', 0, buffer_size=2)
+        player.start()
+        try:
+            #nothing takes frames out of the buffer, the decoder has to wait with two in it
+            self.assertTrue(wait_for(lambda: len(player.frames) == 2))
+            time.sleep(0.2)
+            self.assertEqual(len(player.frames), 2)
+            self.assertFalse(player.decoding_finished)
+        finally:
+            player.stop()
+
+    def test_restart_loops_the_clip(self):
+        player = VideoPlayer(self.path, 60, 80, 'fill', 0)
+        player.start()
+        try:
+            self.play_through(player)
+            player.restart()
+            self.assertFalse(player.finished)
+            self.assertTrue(wait_for(lambda: player.get_frame() is not None))
+        finally:
+            player.stop()
+
+    def test_stop_ends_the_decode_thread(self):
+        player = VideoPlayer(self.path, 60, 80, 'fill', 0, buffer_size=1)
+        player.start()
+        thread = player._thread
+        self.assertTrue(wait_for(lambda: len(player.frames) == 1))
+        player.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(player.frames), 0)
+        self.assertIsNone(player.get_frame())
+
+
+class TestVideoContainer(unittest.TestCase):
+
+    def test_properties_are_read_without_decoding(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clip.avi')
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 20, (30, 40))
+            for _ in range(10):
+                writer.write(np.zeros((40, 30, 3), np.uint8))
+            writer.release()
+
+            video = VideoContainer()
+            video.file_path = path
+            video.populate_properties()
+            self.assertAlmostEqual(video.duration, 0.5, places=1)
+            self.assertEqual(video.orientation, VideoContainer.Orientation.PORTRAIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,17 +12,62 @@ import re
 import uuid
 import os
 import ctypes
+import datetime
 
 
+VIDEO_TYPES = ('.mp4', '.webm', '.mov', '.mkv', '.avi')
+
 def check_and_create(dirpath):
     if not os.path.exists(dirpath):
             os.makedirs(dirpath)
 
 def create_thumbnail(image_path, thumbnail_path, size=(200, 200)):
+    if is_video_file(image_path):
+        create_video_thumbnail(image_path, thumbnail_path, size)
+        return
     with Image.open(image_path) as img:
         img.thumbnail(size, Image.LANCZOS)
         img.save(thumbnail_path)
 
+def create_video_thumbnail(video_path, thumbnail_path, size=(200, 200)):
+    frame = read_video_frame(video_path)
+    if frame is None:
+        print(f"Failed to read a frame from {video_path}")
+        return
+    img = cv2_to_pil(frame)
+    img.thumbnail(size, Image.LANCZOS)
+    img.save(thumbnail_path)
+
+def is_video_file(filename):
+    return filename.lower().endswith(VIDEO_TYPES)
+
+def thumbnail_filename(filename):
+    # videos get a jpg thumbnail next to the name of the clip, e.g. clip.mp4.jpg
+    if is_video_file(filename):
+        return filename + '.jpg'
+    return filename
+
+def read_video_frame(video_path):
+    # read the first frame of a video without decoding the rest of it
+    capture = cv2.VideoCapture(video_path)
+    try:
+        ok, frame = capture.read()
+        return frame if ok else None
+    finally:
+        capture.release()
+
+def read_video_properties(video_path):
+    capture = cv2.VideoCapture(video_path)
+    try:
+        properties = {
+            "size": (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))),  # (width, height)
+            "fps": capture.get(cv2.CAP_PROP_FPS),
+            "frame_count": int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        }
+    finally:
+        capture.release()
+    return properties
+
 def replace_webp_extension(filename):
     # Use regex to find the original extension before .webp
     match = re.search(r'\.(jpg|jpeg|png|bmp)\.webp$', filename)
@@ -56,15 +101,17 @@ def create_thumbnails_for_existing_images(images, thumbs):
     check_and_create(thumbs)
     
     # Create thumbnails for images that don't have a corresponding thumbnail
-    for filename in os.listdir(images):
+    image_files = os.listdir(images)
+    for filename in image_files:
         file_path = os.path.join(images, filename)
-        thumbnail_path = os.path.join(thumbs, filename)
+        thumbnail_path = os.path.join(thumbs, thumbnail_filename(filename))
         if not os.path.exists(thumbnail_path):
             create_thumbnail(file_path, thumbnail_path)
 
     # Remove thumbnails for images that no longer exist            
+    thumbnail_files = [thumbnail_filename(filename) for filename in image_files]
     for filename in os.listdir(thumbs):
-        if filename not in os.listdir(images):
+        if filename not in thumbnail_files:
             os.remove(os.path.join(thumbs, filename))
 
 
@@ -439,6 +486,29 @@ def cv_resize_to_target_size(src_image, target_height, target_width, resize_opti
     else:
         return resized_image
 
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def cv_read_reduced(source, target_height, target_width):
+    # decode an image file or encoded bytes at 1/2, 1/4 or 1/8 of its size when that is still at least
+    # as big as the target, the JPEG decoder then skips most of the work and far less memory is used
+    # the size is read from the header only, the short side is compared so a rotated (EXIF) image is still big enough
+    data = source if isinstance(source, (bytes, bytearray, memoryview)) else None
+    try:
+        with Image.open(BytesIO(data) if data is not None else source) as img:
+            short_side = min(img.size)
+    except Exception:
+        short_side = 0
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in REDUCED_READ_FLAGS:
+        if short_side // factor >= max(target_height, target_width):
+            flag = reduced_flag
+            break
+
+    if data is not None:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    return cv2.imread(source, flag)
+
 def pil_to_cv2(pil_img):
     '''Convert PIL Image to OpenCV image (numpy.ndarray).'''
     cv2_img = np.array(pil_img)
@@ -624,6 +694,16 @@ def accel_to_rotation(accel):
         return 0
     
     
+def seconds_until(time_str, now=None):
+    # seconds until the next occurrence of a "HH:MM" time of day, wrapping around midnight
+    if now is None:
+        now = datetime.datetime.now()
+    target = datetime.datetime.strptime(time_str, "%H:%M").time()
+    target = datetime.datetime.combine(now.date(), target)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
 def generate_unique_filename(directory, extension):
     filename = str(uuid.uuid4()) + extension
     while os.path.exists(os.path.join(directory, filename)):
@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from image_container import ImageContainer
+from metrics import metrics, RENDER_SECONDS
+from utils import cv2_crop_center, cv2_rotate_image, cv_resize_to_target_size, read_video_properties, read_video_frame
+
+#this module adds short video clips to the slideshow
+#VideoContainer is the ImageContainer of a clip, its image is the first frame which is used for thumbnails and the crossfade
+#VideoPlayer decodes the clip on a worker thread into a small bounded buffer, resized to the screen at decode time,
+#so a clip is never held in memory as a whole
+
+
+class VideoContainer(ImageContainer):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fps: float = 0
+        self.frame_count: int = 0
+
+    @property
+    def thumbnail_name(self) -> str:
+        return self.filename + '.jpg'
+
+    @property
+    def duration(self) -> float:
+        if self.fps <= 0:
+            return 0
+        return self.frame_count / self.fps
+
+    def reload_image(self):
+        #only the first frame is kept, it stands in for the clip until playback starts
+        print(f'Reloading first frame of video {self.filename}')
+        with metrics.timer(RENDER_SECONDS, stage='decode'):
+            self._image = read_video_frame(self.file_path)
+
+    def release_memory(self):
+        self._image = None
+        self.processed_image = None
+
+    def populate_properties(self):
+        if self.fps == 0:
+            #read the clip properties from the container without decoding it
+            properties = read_video_properties(self.file_path)
+            self.width, self.height = properties['size']
+            self.fps = properties['fps']
+            self.frame_count = properties['frame_count']
+        if self._image is not None:
+            self.height, self.width = self._image.shape[:2]
+
+        self.is_portrait = self.height > self.width
+
+        if self.is_portrait:
+            self.orientation = ImageContainer.Orientation.PORTRAIT
+        else:
+            self.orientation = ImageContainer.Orientation.LANDSCAPE
+
+
+class FrameRenderer:
+    '''
+    Fits the frames of a clip or animation to the screen the same way ImageContainer.process_image does,
+    but the blurred backdrop for 'fit' is only made once from the first frame
+    '''
+
+    def __init__(self, target_height, target_width, scale_mode, angle) -> None:
+        self.target_height = target_height
+        self.target_width = target_width
+        self.scale_mode = str(scale_mode)
+        self.angle = angle
+        self.background = None
+
+    def render_frame(self, frame) -> np.ndarray:
+        frame = cv2_rotate_image(frame, self.angle)
+        resized = cv_resize_to_target_size(frame, self.target_height, self.target_width, self.scale_mode)
+        if self.scale_mode == ImageContainer.ScaleMode.FIT.value:
+            if self.background is None:
+                background = cv_resize_to_target_size(frame, self.target_height, self.target_width, ImageContainer.ScaleMode.FILL.value)
+                background = cv2.GaussianBlur(background, (101, 101), 0)
+                self.background = cv2.multiply(background, 0.5)
+            return cv2_crop_center(resized, (self.target_height, self.target_width), background=self.background.copy())
+        return cv2_crop_center(resized, (self.target_height, self.target_width))
+
+
+class VideoPlayer(FrameRenderer):
+
+    DEFAULT_FPS = 25
+
+    def __init__(self, file_path, target_height, target_width, scale_mode, angle, buffer_size=8, fps=None) -> None:
+        '''
+        fps is the frame rate of the clip when it is already known (VideoContainer.fps), otherwise it is read from the file
+        here, before playback starts, so the first frames are not scheduled at a guessed rate
+        '''
+        super().__init__(target_height, target_width, scale_mode, angle)
+        self.file_path = file_path
+        self.buffer_size = max(buffer_size, 1)
+
+        if not fps or fps <= 0:
+            fps = read_video_properties(file_path)['fps']
+        self.fps = fps if fps and fps > 0 else self.DEFAULT_FPS
+        self.frames = deque()                   #(timestamp, frame), never more than buffer_size
+        self.condition = threading.Condition()
+        self.decoding_finished = False
+        self.dropped_frames = 0
+        self.start_time = None
+        self._running = False
+        self._thread = None
+
+    @property
+    def finished(self) -> bool:
+        with self.condition:
+            return self.decoding_finished and len(self.frames) == 0
+
+    @property
+    def frame_delay(self) -> int:
+        #milliseconds between two frames of the clip
+        return max(1, int(1000 / self.fps))
+
+    def elapsed(self) -> float:
+        if self.start_time is None:
+            return 0
+        return time.monotonic() - self.start_time
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self.start_time = time.monotonic()
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self.condition:
+            self._running = False
+            self.frames.clear()
+            self.condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def restart(self) -> None:
+        self.stop()
+        self.decoding_finished = False
+        self.start()
+
+    def get_frame(self) -> Optional[np.ndarray]:
+        '''
+        The frame that should be on screen now. Frames the display is too late for are dropped
+        '''
+        elapsed = self.elapsed()
+        frame = None
+        with self.condition:
+            while self.frames and self.frames[0][0] <= elapsed:
+                if frame is not None:
+                    self.dropped_frames += 1
+                _, frame = self.frames.popleft()
+            self.condition.notify_all()
+        return frame
+
+    def _decode(self) -> None:
+        capture = cv2.VideoCapture(self.file_path)
+        index = 0
+        try:
+            while True:
+                with self.condition:
+                    while self._running and len(self.frames) >= self.buffer_size:
+                        self.condition.wait(timeout=0.5)
+                    if not self._running:
+                        break
+
+                timestamp = index / self.fps
+                index += 1
+                if timestamp + 1 / self.fps < self.elapsed():
+                    #decoding can't keep up, skip this frame without converting or resizing it
+                    if not capture.grab():
+                        break
+                    self.dropped_frames += 1
+                    continue
+
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                with metrics.timer(RENDER_SECONDS, stage='video_frame'):
+                    frame = self.render_frame(frame)
+
+                with self.condition:
+                    if not self._running:
+                        break
+                    self.frames.append((timestamp, frame))
+                    self.condition.notify_all()
+        finally:
+            capture.release()
+            with self.condition:
+                self.decoding_finished = True
+                self.condition.notify_all()